@@ -90,6 +90,22 @@ def build_exe(onefile=False, icon_path=None):
         "--hidden-import=libs.toolBar",
         "--hidden-import=libs.pascal_voc_io",
         "--hidden-import=libs.ustr",
+        "--hidden-import=libs.spatialIndex",
+        "--hidden-import=libs.boxGeometry",
+        "--hidden-import=libs.imageLoader",
+        "--hidden-import=libs.tileRenderer",
+        "--hidden-import=libs.annotationIndex",
+        "--hidden-import=libs.dirWatcher",
+        "--hidden-import=libs.fileListModel",
+        "--hidden-import=libs.dirScanner",
+        "--hidden-import=libs.projectManifest",
+        "--hidden-import=libs.datasetStats",
+        "--hidden-import=libs.labelStatsModel",
+        "--hidden-import=libs.vocBatchReader",
+        "--hidden-import=libs.saveQueue",
+        "--hidden-import=libs.annotationJournal",
+        "--hidden-import=libs.annotationFingerprint",
+        "--hidden-import=libs.undoHistory",
         "--hidden-import=lib",
         "--hidden-import=shape",
         "--hidden-import=canvas",
@@ -100,6 +116,22 @@ def build_exe(onefile=False, icon_path=None):
         "--hidden-import=toolBar",
         "--hidden-import=pascal_voc_io",
         "--hidden-import=ustr",
+        "--hidden-import=spatialIndex",
+        "--hidden-import=boxGeometry",
+        "--hidden-import=imageLoader",
+        "--hidden-import=tileRenderer",
+        "--hidden-import=annotationIndex",
+        "--hidden-import=dirWatcher",
+        "--hidden-import=fileListModel",
+        "--hidden-import=dirScanner",
+        "--hidden-import=projectManifest",
+        "--hidden-import=datasetStats",
+        "--hidden-import=labelStatsModel",
+        "--hidden-import=vocBatchReader",
+        "--hidden-import=saveQueue",
+        "--hidden-import=annotationJournal",
+        "--hidden-import=annotationFingerprint",
+        "--hidden-import=undoHistory",
     ]
     
     def convert_to_ico(input_file):
@@ -87,6 +87,22 @@ def build_single_exe():
         "--hidden-import=libs.toolBar",
         "--hidden-import=libs.pascal_voc_io",
         "--hidden-import=libs.ustr",
+        "--hidden-import=libs.spatialIndex",
+        "--hidden-import=libs.boxGeometry",
+        "--hidden-import=libs.imageLoader",
+        "--hidden-import=libs.tileRenderer",
+        "--hidden-import=libs.annotationIndex",
+        "--hidden-import=libs.dirWatcher",
+        "--hidden-import=libs.fileListModel",
+        "--hidden-import=libs.dirScanner",
+        "--hidden-import=libs.projectManifest",
+        "--hidden-import=libs.datasetStats",
+        "--hidden-import=libs.labelStatsModel",
+        "--hidden-import=libs.vocBatchReader",
+        "--hidden-import=libs.saveQueue",
+        "--hidden-import=libs.annotationJournal",
+        "--hidden-import=libs.annotationFingerprint",
+        "--hidden-import=libs.undoHistory",
         
         # 排除不需要的模块
         "--exclude-module=tkinter",
@@ -10,5 +10,21 @@ __all__ = [
     'labelFile',
     'toolBar',
     'pascal_voc_io',
-    'ustr'
+    'ustr',
+    'spatialIndex',
+    'boxGeometry',
+    'imageLoader',
+    'tileRenderer',
+    'annotationIndex',
+    'dirWatcher',
+    'fileListModel',
+    'dirScanner',
+    'projectManifest',
+    'datasetStats',
+    'labelStatsModel',
+    'vocBatchReader',
+    'saveQueue',
+    'annotationJournal',
+    'annotationFingerprint',
+    'undoHistory'
 ]
\ No newline at end of file
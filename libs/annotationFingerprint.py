@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 标注指纹：记录每个 XML 写出内容的哈希，内容没有变化的保存不再写盘，
+# 避免共享盘上无谓的写入和修改时间变化；指纹也供增量导出判断哪些文件变了
+
+import hashlib
+import threading
+import time
+
+from imageLoader import fileStamp
+from pascal_voc_io import writeFileAtomic
+
+
+def fingerprint(data):
+    """XML 字节内容的指纹"""
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def changedSince(current, previous):
+    """current、previous 为 {XML 路径: 指纹}，返回新增或内容变化的路径，供增量导出使用"""
+    return [path for path, digest in current.items() if previous.get(path) != digest]
+
+
+class FingerprintStore(object):
+    """按 XML 路径记录 ((修改时间, 大小), 指纹)，文件在别处被修改后记录失效，可在多个线程中使用
+
+    网络盘（SMB、NFS）的修改时间精度只有 1–2 秒，同一时间片内别人写入大小相同的内容时
+    (修改时间, 大小) 不变；保存时修改时间距今不到 settleSeconds 秒的记录不可信，要读出文件比较。
+    """
+
+    settleSeconds = 2.0
+
+    def __init__(self):
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, path):
+        with self._lock:
+            return self._entries.get(path)
+
+    def put(self, path, stamp, digest):
+        if stamp is None:
+            return
+        with self._lock:
+            self._entries[path] = (tuple(stamp), digest)
+
+    def update(self, entries):
+        """entries 为 {XML 路径: ((修改时间, 大小), 指纹)}，如项目清单中保存的指纹"""
+        with self._lock:
+            self._entries.update((path, (tuple(stamp), digest))
+                                 for path, (stamp, digest) in entries.items())
+
+    def isSettled(self, stamp):
+        """修改时间已过去足够久，(修改时间, 大小) 相同即可认为内容相同"""
+        mtime = stamp[0] / 1e9 if isinstance(stamp[0], int) else stamp[0]
+        return time.time() - mtime >= self.settleSeconds
+
+    def digestFor(self, path):
+        """文件当前内容的指纹，记录已失效或没有记录时返回 None"""
+        entry = self.get(path)
+        if entry is None or entry[0] != fileStamp(path):
+            return None
+        return entry[1]
+
+    def snapshot(self):
+        """全部记录的副本 {XML 路径: ((修改时间, 大小), 指纹)}"""
+        with self._lock:
+            return dict(self._entries)
+
+    def writeIfChanged(self, path, data, writeFunc=writeFileAtomic):
+        """内容与磁盘上的文件不同时才写入，返回是否写入
+
+        没有有效记录或记录还不可信时读出现有文件比较，读取比写入便宜，也不改变修改时间。
+        """
+        digest = fingerprint(data)
+        stamp = fileStamp(path)
+        if stamp is not None:
+            entry = self.get(path)
+            if entry is not None and entry[0] == stamp and self.isSettled(stamp):
+                existing = entry[1]
+            else:
+                try:
+                    with open(path, 'rb') as f:
+                        existing = fingerprint(f.read())
+                except (IOError, OSError):
+                    existing = None
+            if existing == digest:
+                self.put(path, stamp, digest)
+                return False
+        writeFunc(path, data)
+        self.put(path, fileStamp(path), digest)
+        return True
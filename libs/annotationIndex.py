@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 项目标注状态索引：打开目录时每个目录只列一次文件，之后保存时原地更新，
+# 进度、计数和文件列表着色不再逐张图片调用 os.path.exists
+
+import os
+
+
+class AnnotationIndex(object):
+    """记录图片列表中每张图片的 XML 是否存在
+
+    xmlPathFunc(imagePath) 给出图片对应的 XML 路径。
+    """
+
+    def __init__(self, xmlPathFunc):
+        self.xmlPathFunc = xmlPathFunc
+        self._size = 0
+        self._xmlRows = {}
+        self._annotated = bytearray()
+        self._count = 0
+        self._xmlDirs = []
+        self._pendingImages = None
+
+    def __len__(self):
+        return self._size
+
+    @staticmethod
+    def normPath(path):
+        return os.path.normcase(os.path.normpath(path))
+
+    @staticmethod
+    def listDir(dirPath):
+        """目录下所有文件的规范化路径，目录不存在时返回空集合"""
+        try:
+            names = os.listdir(dirPath)
+        except (OSError, TypeError, ValueError):
+            return set()
+        return set(AnnotationIndex.normPath(os.path.join(dirPath, name)) for name in names)
+
+    def build(self, images, annotated=None):
+        """根据图片列表重建索引，每个 XML 所在目录只列一次
+
+        annotated 为已知的各行标注状态（例如项目清单中保存的），给出时不再列目录，
+        XML 路径到行号的映射也推迟到第一次用到时才建立。
+        """
+        self._size = len(images)
+        if annotated is not None and len(annotated) == self._size:
+            self._annotated = bytearray(1 if a else 0 for a in annotated)
+            self._count = sum(self._annotated)
+            self._pendingImages = images
+            return
+        self._pendingImages = None
+        self._buildRows(images)
+        existing = set()
+        for dirPath in self._xmlDirs:
+            existing |= self.listDir(dirPath)
+        self._annotated = bytearray(self._size)
+        self._count = 0
+        for xmlPath in existing.intersection(self._xmlRows):
+            for row in self.rowsOf(xmlPath):
+                self._annotated[row] = 1
+                self._count += 1
+
+    def _buildRows(self, images):
+        # 多数 XML 只对应一行，存行号；几张图片共用一个 XML 时才存列表
+        xmlRows = {}
+        for row, imagePath in enumerate(images):
+            xmlPath = self.normPath(self.xmlPathFunc(imagePath))
+            old = xmlRows.setdefault(xmlPath, row)
+            if isinstance(old, list):
+                old.append(row)
+            elif old != row:
+                xmlRows[xmlPath] = [old, row]
+        self._xmlRows = xmlRows
+        self._xmlDirs = sorted(set(os.path.dirname(p) for p in xmlRows))
+
+    def _ensureRows(self):
+        if self._pendingImages is not None:
+            images, self._pendingImages = self._pendingImages, None
+            self._buildRows(images)
+
+    def clear(self):
+        self.build([])
+
+    def xmlDirs(self):
+        """索引中的 XML 所在的全部目录"""
+        self._ensureRows()
+        return list(self._xmlDirs)
+
+    def rowsOf(self, xmlPath):
+        self._ensureRows()
+        rows = self._xmlRows.get(xmlPath)
+        if rows is None:
+            return ()
+        return rows if isinstance(rows, list) else (rows,)
+
+    def isAnnotated(self, row):
+        return bool(self._annotated[row])
+
+    def flags(self):
+        """各行的标注状态，可以原样传回 build(images, annotated)"""
+        return bytes(self._annotated)
+
+    def annotatedCount(self):
+        return self._count
+
+    def progress(self):
+        """返回 (已标注数, 总数, 百分比)"""
+        total = self._size
+        percent = (self._count / total * 100) if total > 0 else 0.0
+        return self._count, total, percent
+
+    def setXmlExists(self, xmlPath, exists=True):
+        """XML 被写入或删除时调用，返回状态发生变化的行号列表"""
+        changed = []
+        for row in self.rowsOf(self.normPath(xmlPath)):
+            if bool(self._annotated[row]) != exists:
+                self._annotated[row] = exists
+                self._count += 1 if exists else -1
+                changed.append(row)
+        return changed
+
+    def setImageXml(self, row, imagePath, exists):
+        """已知图片行号时更新它的 XML 状态，映射还未建立时不为此去建立"""
+        if self._pendingImages is None or not 0 <= row < self._size:
+            return self.setXmlExists(self.xmlPathFunc(imagePath), exists)
+        if bool(self._annotated[row]) == exists:
+            return []
+        self._annotated[row] = exists
+        self._count += 1 if exists else -1
+        return [row]
+
+    def refresh(self, imagePath, row=-1):
+        """重新检查单张图片的 XML，返回状态发生变化的行号列表"""
+        xmlPath = self.xmlPathFunc(imagePath)
+        return self.setImageXml(row, imagePath, os.path.exists(xmlPath))
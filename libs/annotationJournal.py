@@ -0,0 +1,329 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 标注日志：每个会话一个只追加的 JSON 行文件，记录未保存的形状操作（添加、删除、移动、旋转、改标签）
+# 和最后的视图位置，fsync 按批进行；程序异常退出后下次启动时重放，XML 保存后自动压缩
+
+import glob
+import json
+import os
+import time
+
+from pascal_voc_io import writeFileAtomic
+
+JOURNAL_EXT = '.jsonl'
+LOCK_EXT = '.lock'
+
+
+def _tryLock(f):
+    """对打开的文件加非阻塞的排他锁，已被其他进程持有时返回 False"""
+    try:
+        import fcntl
+    except ImportError:
+        import msvcrt
+        try:
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+def shapeState(label, points, direction=0, isRotated=False, difficult=False):
+    """日志中一个形状的状态"""
+    return {'label': label, 'points': [[float(x), float(y)] for x, y in points],
+            'direction': float(direction), 'isRotated': bool(isRotated),
+            'difficult': bool(difficult)}
+
+
+def stateToShape(state):
+    """转成 MainWindow.loadLabels 接受的 (label, points, direction, isRotated, line_color, fill_color, difficult)"""
+    return (state['label'], [tuple(p) for p in state['points']], state.get('direction', 0),
+            state.get('isRotated', False), None, None, state.get('difficult', False))
+
+
+def _stamp(value):
+    return tuple(value) if value is not None else None
+
+
+class ImageEdits(object):
+    """一张图片尚未写入 XML 的操作，按保存分段
+
+    每段的操作以段开始时的 XML 为基准：XML 中的形状按读取顺序编号为 0, 1, ...，
+    新建的形状用负数编号。stamp 为基准 XML 的 (修改时间, 大小)，保存还没确认写完时 known 为 False。
+    """
+
+    def __init__(self, xmlPath, stamp=None, known=True):
+        self.xmlPath = xmlPath
+        self.segments = [{'seq': None, 'stamp': _stamp(stamp), 'known': known, 'ops': []}]
+
+    def hasOps(self):
+        return any(segment['ops'] for segment in self.segments)
+
+    def startSegment(self, seq):
+        self.segments.append({'seq': seq, 'stamp': None, 'known': False, 'ops': []})
+
+    def confirm(self, seq, stamp):
+        """序号为 seq 的保存已写完，它之前的操作都已在 XML 中"""
+        for i, segment in enumerate(self.segments):
+            if segment['seq'] == seq:
+                del self.segments[:i]
+                segment['stamp'] = _stamp(stamp)
+                segment['known'] = True
+                return True
+        return False
+
+    def baseSegment(self, stamp):
+        """与当前 XML 对应的段的下标，无法对应时返回 None
+
+        优先取基准 stamp 与 XML 相同的最后一段；没有时认为最后一次未确认的保存已写完。
+        """
+        stamp = _stamp(stamp)
+        for i in range(len(self.segments) - 1, -1, -1):
+            segment = self.segments[i]
+            if segment['known'] and segment['stamp'] == stamp:
+                return i
+        for i in range(len(self.segments) - 1, -1, -1):
+            if not self.segments[i]['known']:
+                return i
+        return None
+
+    def replay(self, baseStates, stamp):
+        """在 XML 读出的 baseStates 上重放操作，返回 [(编号, 状态), ...]，XML 已变化时返回 None"""
+        start = self.baseSegment(stamp)
+        if start is None:
+            return None
+        shapes = dict(enumerate(dict(s) for s in baseStates))
+        order = list(range(len(baseStates)))
+        for k, segment in enumerate(self.segments[start:]):
+            if k:
+                # 保存后的 XML 按画布顺序写出，之后的编号即为新的顺序
+                shapes = dict(enumerate(shapes[i] for i in order))
+                order = list(range(len(shapes)))
+            for op in segment['ops']:
+                shapeId = op['id']
+                if op['op'] == 'add':
+                    shapes[shapeId] = dict(op['shape'])
+                    order.append(shapeId)
+                elif op['op'] == 'delete':
+                    if shapes.pop(shapeId, None) is not None:
+                        order.remove(shapeId)
+                elif shapeId in shapes:
+                    shapes[shapeId].update((k, v) for k, v in op.items()
+                                           if k not in ('op', 'id', 'image'))
+        return [(i, shapes[i]) for i in order]
+
+    def records(self, image):
+        """压缩后重新写出的日志行"""
+        first = self.segments[0]
+        if first['known']:
+            yield {'op': 'open', 'image': image, 'xml': self.xmlPath, 'stamp': first['stamp']}
+        else:
+            yield {'op': 'save', 'image': image, 'xml': self.xmlPath, 'seq': first['seq']}
+        for i, segment in enumerate(self.segments):
+            if i:
+                yield {'op': 'save', 'image': image, 'xml': self.xmlPath, 'seq': segment['seq']}
+            for op in segment['ops']:
+                yield op
+
+
+class AnnotationJournal(object):
+    """一个会话的日志文件
+
+    record() 只写入文件缓冲，由调用方定时调用 sync() 统一 fsync，单次编辑几乎没有额外开销。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.images = {}
+        self.view = None
+        self._seq = 0
+        self._nextId = -1
+        self._unsynced = False
+        self._lockFile = open(path + LOCK_EXT, 'a')
+        _tryLock(self._lockFile)
+        self._file = open(path, 'a', encoding='utf-8')
+
+    @classmethod
+    def create(cls, directory):
+        """在 directory 下为当前进程新建日志"""
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        name = 'session-%d-%d' % (os.getpid(), int(time.time() * 1000))
+        return cls(os.path.join(directory, name + JOURNAL_EXT))
+
+    # 写入
+
+    def _write(self, record):
+        self._file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')) + '\n')
+        self._unsynced = True
+
+    def tracks(self, image):
+        return image in self.images
+
+    def begin(self, image, xmlPath, stamp):
+        """开始记录一张图片，stamp 为读入的 XML 的 (修改时间, 大小)，没有 XML 时为 None"""
+        if image not in self.images:
+            self.images[image] = ImageEdits(xmlPath, stamp)
+            self._write({'op': 'open', 'image': image, 'xml': xmlPath, 'stamp': stamp})
+
+    def newId(self):
+        """新建形状的编号"""
+        self._nextId -= 1
+        return self._nextId + 1
+
+    def record(self, image, op, shapeId, **fields):
+        """op 为 add / delete / move / rotate / relabel / difficult，图片须已 begin"""
+        record = dict(fields, op=op, id=shapeId)
+        self.images[image].segments[-1]['ops'].append(record)
+        self._write(dict(record, image=image))
+
+    def markSave(self, image, xmlPath):
+        """XML 开始保存，返回保存序号；之后的操作以保存后的 XML 为基准"""
+        self._seq += 1
+        edits = self.images.get(image)
+        if edits is None:
+            edits = self.images[image] = ImageEdits(xmlPath, known=False)
+            edits.segments[0]['seq'] = self._seq
+        else:
+            edits.startSegment(self._seq)
+        self._write({'op': 'save', 'image': image, 'xml': xmlPath, 'seq': self._seq})
+        return self._seq
+
+    def markSaved(self, image, seq, stamp):
+        """保存 seq 已写完；不再有未保存操作的图片从日志中移除，全部保存后压缩日志"""
+        edits = self.images.get(image)
+        if edits is None or not edits.confirm(seq, stamp):
+            return
+        self._write({'op': 'saved', 'image': image, 'seq': seq, 'stamp': stamp})
+        if len(edits.segments) == 1 and not edits.hasOps():
+            del self.images[image]
+            if not any(e.hasOps() for e in self.images.values()):
+                self.compact()
+
+    def discard(self, image):
+        """放弃一张图片的未保存操作"""
+        if self.images.pop(image, None) is not None:
+            self._write({'op': 'discard', 'image': image})
+
+    def setView(self, image, zoom, scrollX, scrollY):
+        view = {'op': 'view', 'image': image, 'zoom': zoom, 'h': scrollX, 'v': scrollY}
+        if view != self.view:
+            self.view = view
+            self._write(view)
+
+    def sync(self):
+        """把缓冲中的记录写到磁盘"""
+        if not self._unsynced:
+            return
+        self._unsynced = False
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def compact(self):
+        """按内存中的状态重写日志，去掉已保存、已放弃的记录"""
+        lines = []
+        for image, edits in self.images.items():
+            lines.extend(json.dumps(r, ensure_ascii=False, separators=(',', ':'))
+                         for r in edits.records(image))
+        if self.view is not None:
+            lines.append(json.dumps(self.view, ensure_ascii=False, separators=(',', ':')))
+        self._file.close()
+        writeFileAtomic(self.path, ''.join(line + '\n' for line in lines).encode('utf-8'))
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._unsynced = False
+
+    def adopt(self, images, view):
+        """接收从旧日志恢复的状态，写入本会话的日志"""
+        self.images.update(images)
+        for edits in images.values():
+            for segment in edits.segments:
+                for op in segment['ops']:
+                    self._nextId = min(self._nextId, op['id'] - 1)
+        if view is not None and self.view is None:
+            self.view = view
+        self.compact()
+
+    def close(self):
+        """正常退出：没有未保存的操作时删除日志，否则压缩后留给下次启动"""
+        self.images = dict((image, edits) for image, edits in self.images.items() if edits.hasOps())
+        if self.images:
+            self.view = None
+            self.compact()
+            self._file.close()
+        else:
+            self._file.close()
+            os.remove(self.path)
+        self._lockFile.close()
+        try:
+            os.remove(self.path + LOCK_EXT)
+        except OSError:
+            pass
+
+
+def readJournal(path):
+    """读出日志，返回 ({图片路径: ImageEdits}, 最后的 view 记录)；末尾写了一半的行被忽略"""
+    images = {}
+    view = None
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+                op = record['op']
+                image = record.get('image')
+            except (ValueError, KeyError, TypeError):
+                continue
+            if op == 'view':
+                view = record
+            elif op == 'open':
+                images[image] = ImageEdits(record.get('xml'), record.get('stamp'))
+            elif op == 'save':
+                edits = images.get(image)
+                if edits is None:
+                    edits = images[image] = ImageEdits(record.get('xml'), known=False)
+                    edits.segments[0]['seq'] = record['seq']
+                else:
+                    edits.startSegment(record['seq'])
+            elif op == 'saved':
+                edits = images.get(image)
+                if edits is not None and edits.confirm(record['seq'], record.get('stamp')):
+                    if len(edits.segments) == 1 and not edits.hasOps():
+                        del images[image]
+            elif op == 'discard':
+                images.pop(image, None)
+            elif image in images:
+                record.pop('image', None)
+                images[image].segments[-1]['ops'].append(record)
+    images = dict((image, edits) for image, edits in images.items() if edits.hasOps())
+    return images, view
+
+
+def recoverJournals(directory, exclude=None):
+    """读出 directory 下已无进程持有的日志并删除，较新的日志覆盖较旧的
+
+    返回 ({图片路径: ImageEdits}, 最后的 view 记录)。
+    """
+    images = {}
+    view = None
+    paths = sorted(glob.glob(os.path.join(directory, '*' + JOURNAL_EXT)), key=os.path.getmtime)
+    for path in paths:
+        if path == exclude:
+            continue
+        with open(path + LOCK_EXT, 'a') as lockFile:
+            if not _tryLock(lockFile):
+                continue
+            try:
+                found, lastView = readJournal(path)
+            except (OSError, UnicodeDecodeError):
+                continue
+            images.update(found)
+            view = lastView or view
+            os.remove(path)
+        try:
+            os.remove(path + LOCK_EXT)
+        except OSError:
+            pass
+    return images, view
@@ -0,0 +1,169 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 旋转框几何运算的向量化实现，Shape / LabelFile / PascalVocReader 共用
+#
+# 约定：
+#   corners 为 (N, 4, 2) 数组，顶点顺序与 Shape.points 一致 (p0, p1, p2, p3)
+#   rboxes  为 (N, 5) 数组，每行 (cx, cy, w, h, angle)，angle 与 XML 中的 robndbox 一致
+#   rect    为 (N, 4) 数组，每行 (x1, y1, x2, y2)
+
+import numpy as np
+
+
+def asCorners(points):
+    """把单个框 (4, 2) 或一批框 (N, 4, 2) 统一成 (N, 4, 2) 的 float 数组"""
+    corners = np.asarray(points, dtype=np.float64)
+    if corners.ndim == 2:
+        corners = corners[np.newaxis]
+    return corners
+
+
+def rotatePoints(points, center, theta):
+    """绕 center 旋转 theta（与 Shape.rotate 的方向约定相同）
+
+    points 为 (..., 2)，center 可广播到 points，theta 为标量或 (N,)。
+    """
+    points = np.asarray(points, dtype=np.float64)
+    center = np.asarray(center, dtype=np.float64)
+    theta = np.asarray(theta, dtype=np.float64)
+    # theta 为 (N,) 时对齐到 points 的前导维
+    while theta.ndim and theta.ndim < points.ndim - 1:
+        theta = theta[..., np.newaxis]
+    cos, sin = np.cos(theta), np.sin(theta)
+    xoff = points[..., 0] - center[..., 0]
+    yoff = points[..., 1] - center[..., 1]
+    out = np.empty(np.broadcast(points, center).shape)
+    out[..., 0] = center[..., 0] + (cos * xoff + sin * yoff)
+    out[..., 1] = center[..., 1] + (-sin * xoff + cos * yoff)
+    return out
+
+
+def rboxToCorners(rboxes):
+    """(N, 5) 的 (cx, cy, w, h, angle) 转成 (N, 4, 2) 的四个顶点"""
+    rboxes = np.asarray(rboxes, dtype=np.float64).reshape(-1, 5)
+    cx, cy, w, h, angle = rboxes.T
+    xs = np.stack([cx - w / 2, cx + w / 2, cx + w / 2, cx - w / 2], axis=1)
+    ys = np.stack([cy - h / 2, cy - h / 2, cy + h / 2, cy + h / 2], axis=1)
+    center = np.stack([cx, cy], axis=1)[:, np.newaxis, :]
+    return rotatePoints(np.stack([xs, ys], axis=2), center, -angle)
+
+
+def cornersToRbox(corners, centers=None, directions=None):
+    """(N, 4, 2) 的四个顶点转成 (N, 5) 的 (cx, cy, w, h, angle)
+
+    centers 为 (N, 2)，缺省或某行为 NaN 时用四个顶点的平均值；
+    directions 为 (N,)，对应 Shape.direction，缺省时由 p0->p1 边的方向推算。
+    """
+    c = asCorners(corners)
+    if len(c) == 0:
+        return np.zeros((0, 5))
+    mean = (((c[:, 0] + c[:, 1]) + c[:, 2]) + c[:, 3]) / 4
+    if centers is None:
+        center = mean
+    else:
+        center = np.asarray(centers, dtype=np.float64).reshape(-1, 2)
+        center = np.where(np.isnan(center), mean, center)
+    e01 = c[:, 0] - c[:, 1]
+    e21 = c[:, 2] - c[:, 1]
+    w = np.sqrt(e01[:, 0] * e01[:, 0] + e01[:, 1] * e01[:, 1])
+    h = np.sqrt(e21[:, 0] * e21[:, 0] + e21[:, 1] * e21[:, 1])
+    if directions is None:
+        angle = np.mod(np.arctan2(-e01[:, 1], -e01[:, 0]), np.pi)
+    else:
+        angle = np.mod(np.asarray(directions, dtype=np.float64), np.pi)
+    return np.stack([center[:, 0], center[:, 1], w, h, angle], axis=1)
+
+
+def bounds(corners):
+    """(N, 4, 2) 的包围盒 (N, 4)：x1, y1, x2, y2"""
+    c = asCorners(corners)
+    return np.concatenate([c.min(axis=1), c.max(axis=1)], axis=1)
+
+
+def polygonArea(corners):
+    """鞋带公式计算面积，(N, 4, 2) -> (N,)"""
+    c = asCorners(corners)
+    x, y = c[..., 0], c[..., 1]
+    xn, yn = np.roll(x, -1, axis=1), np.roll(y, -1, axis=1)
+    return np.abs((x * yn - xn * y).sum(axis=1)) / 2
+
+
+def containsPoint(corners, point):
+    """判断点是否在各个凸四边形内部（含边界），(N, 4, 2) -> (N,)"""
+    c = asCorners(corners)
+    p = np.asarray(point, dtype=np.float64)
+    edges = np.roll(c, -1, axis=1) - c
+    rel = p - c
+    cross = edges[..., 0] * rel[..., 1] - edges[..., 1] * rel[..., 0]
+    return np.all(cross >= 0, axis=1) | np.all(cross <= 0, axis=1)
+
+
+def rectsIntersect(rectA, rectsB):
+    """与 QRectF.intersects 一致：要求有正面积的相交区域"""
+    a = np.asarray(rectA, dtype=np.float64)
+    b = np.asarray(rectsB, dtype=np.float64).reshape(-1, 4)
+    nonEmptyA = a[0] < a[2] and a[1] < a[3]
+    return (nonEmptyA & (b[:, 0] < b[:, 2]) & (b[:, 1] < b[:, 3]) &
+            (a[0] < b[:, 2]) & (b[:, 0] < a[2]) &
+            (a[1] < b[:, 3]) & (b[:, 1] < a[3]))
+
+
+def rectOverlapRatio(rectA, rectsB):
+    """相交面积 / 较小矩形的面积"""
+    a = np.asarray(rectA, dtype=np.float64)
+    b = np.asarray(rectsB, dtype=np.float64).reshape(-1, 4)
+    iw = np.minimum(a[2], b[:, 2]) - np.maximum(a[0], b[:, 0])
+    ih = np.minimum(a[3], b[:, 3]) - np.maximum(a[1], b[:, 1])
+    inter = np.where((iw > 0) & (ih > 0), iw * ih, 0.0)
+    areaA = (a[2] - a[0]) * (a[3] - a[1])
+    areaB = (b[:, 2] - b[:, 0]) * (b[:, 3] - b[:, 1])
+    minArea = np.minimum(areaA, areaB)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(minArea > 0, inter / minArea, 0.0)
+
+
+def _edgeNormals(c):
+    edges = np.roll(c, -1, axis=1) - c
+    return np.stack([-edges[..., 1], edges[..., 0]], axis=-1)
+
+
+def satOverlap(cornersA, cornersB):
+    """分离轴定理判断凸四边形是否重叠（边界接触算重叠）
+
+    cornersA 与 cornersB 形状可以是 (N, 4, 2) 对 (N, 4, 2)，
+    也可以是单个 (4, 2) 对一批 (N, 4, 2)，返回 (N,) 的布尔数组。
+    """
+    a, b = asCorners(cornersA), asCorners(cornersB)
+    a, b = np.broadcast_arrays(a, b)
+    # 每对框共有 8 条分离轴：两个框各自四条边的法向量
+    axes = np.concatenate([_edgeNormals(a), _edgeNormals(b)], axis=1)
+    projA = np.einsum('nkd,nvd->nkv', axes, a)
+    projB = np.einsum('nkd,nvd->nkv', axes, b)
+    separated = (projA.max(axis=2) < projB.min(axis=2)) | \
+                (projB.max(axis=2) < projA.min(axis=2))
+    return ~separated.any(axis=1)
+
+
+def overlapWith(cornersA, rotatedA, cornersB, rotatedB, minRatio=0.1):
+    """一个框与一批框的重叠判定
+
+    先比较包围盒；任一方为旋转框时用 SAT，否则要求相交面积超过较小框的 minRatio。
+    """
+    a = asCorners(cornersA)[0]
+    b = asCorners(cornersB)
+    result = np.zeros(len(b), dtype=bool)
+    if not len(b):
+        return result
+    rectA = np.concatenate([a.min(axis=0), a.max(axis=0)])
+    rectsB = bounds(b)
+    hit = rectsIntersect(rectA, rectsB)
+    if not hit.any():
+        return result
+    rotated = np.asarray(rotatedB, dtype=bool) | bool(rotatedA)
+    sat = hit & rotated
+    if sat.any():
+        result[sat] = satOverlap(a, b[sat])
+    plain = hit & ~rotated
+    if plain.any():
+        result[plain] = rectOverlapRatio(rectA, rectsB[plain]) > minRatio
+    return result
@@ -11,6 +11,8 @@ except ImportError:
 
 from shape import Shape
 from lib import distance
+from tileRenderer import TilePyramid
+from spatialIndex import HitTestIndex, TrackedList
 import math
 
 CURSOR_DEFAULT = Qt.ArrowCursor
@@ -28,6 +30,8 @@ class Canvas(QWidget):
     newShape = pyqtSignal()
     selectionChanged = pyqtSignal(bool)
     shapeMoved = pyqtSignal()
+    # 一次拖动或旋转手势结束（鼠标松开）时发出
+    shapeMoveFinished = pyqtSignal()
     drawingPolygon = pyqtSignal(bool)
     # 添加双击放大信号
     doubleClickZoom = pyqtSignal(QPoint)
@@ -40,6 +44,9 @@ class Canvas(QWidget):
 
     epsilon = 11.0
 
+    # 拖动、旋转、绘制时两次重绘之间的最短间隔（毫秒）
+    frameInterval = 16
+
 
 
     def __init__(self, *args, **kwargs):
@@ -47,6 +54,9 @@ class Canvas(QWidget):
         # Initialise local state.
         self.mode = self.EDIT
         self.shapes = []
+        # 悬停、点选时只检测光标附近的形状
+        self.hitIndex = HitTestIndex(self.shapeHitRect,
+                                     lambda shape, callback: setattr(shape, 'onGeometryChanged', callback))
         self.current = None
         self.selectedShape = None  # save the selected shape here
         self.selectedShapes = []   # 保存所有选中的形状
@@ -57,6 +67,10 @@ class Canvas(QWidget):
         self.offsets = QPointF(), QPointF()
         self.scale = 1.0
         self.pixmap = QPixmap()
+        # 图像坐标系的尺寸；加载过程中 pixmap 可能只是缩小的预览图
+        self.imageSize = QSize()
+        # 超大图像改用瓦片金字塔绘制，此时 pixmap 只是总览图
+        self.tiles = None
         self.visible = {}
         self._hideBackround = False
         self.hideBackround = False
@@ -79,6 +93,19 @@ class Canvas(QWidget):
         # 添加图片拖动相关变量
         self.isPanning = False
         self.lastPanPoint = QPointF()
+
+        # 合并鼠标移动事件：每帧只处理最新的位置，并只重绘受影响的区域
+        self._pendingMove = None
+        self._movedInGesture = False
+        self._pendingStatus = None
+        # 本次修改前各形状的 (顶点, 方向)，由 takeMoveOrigins 取走生成撤销命令
+        self._moveOrigins = {}
+        self._dirtyRect = None
+        self._frameTimer = QTimer(self)
+        self._frameTimer.setSingleShot(True)
+        self._frameTimer.timeout.connect(self.flushFrame)
+        self._frameClock = QElapsedTimer()
+        self._frameClock.start()
         
         # 添加特效相关变量
         self.completionEffect = None  # 完成特效
@@ -98,9 +125,32 @@ class Canvas(QWidget):
     def focusOutEvent(self, ev):
         self.restoreCursor()
 
+    @property
+    def shapes(self):
+        return self._shapes
+
+    @shapes.setter
+    def shapes(self, shapes):
+        # 记录增删次数，命中测试索引据此同步
+        self._shapes = TrackedList(shapes)
+
     def isVisible(self, shape):
         return self.visible.get(shape, True)
 
+    @staticmethod
+    def shapeHitRect(shape):
+        if not shape.points:
+            return None
+        rect = shape.boundingRect()
+        return (rect.left(), rect.top(), rect.right(), rect.bottom())
+
+    def shapesAt(self, point):
+        """顶点吸附范围内可能命中的可见形状，最上层的在前"""
+        self.hitIndex.sync(self.shapes)
+        return [shape for shape in
+                self.hitIndex.candidates(point.x(), point.y(), self.epsilon)
+                if self.isVisible(shape)]
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -141,6 +191,57 @@ class Canvas(QWidget):
             # 只在开始拖动时设置光标，避免频繁更新
             return
 
+        # 绘制、旋转、移动：只记录最新位置，下一帧统一处理
+        if self.drawing() or (ev.buttons() & (Qt.LeftButton | Qt.RightButton)):
+            self._pendingMove = (pos, ev.buttons())
+            self.scheduleFrame()
+            return
+
+        # 如果正在拖动，不执行悬停逻辑
+        if self.isPanning:
+            return
+
+        # Just hovering over the canvas, 2 posibilities:
+        # - Highlight shapes
+        # - Highlight vertex
+        # Update shape/vertex fill and tooltip value accordingly.
+        self.setToolTip("Image")
+        for shape in self.shapesAt(pos):
+            # Look for a nearby vertex to highlight. If that fails,
+            # check if we happen to be inside a shape.
+            index = shape.nearestVertex(pos, self.epsilon)
+            if index is not None:
+                if self.selectedVertex():
+                    self.hShape.highlightClear()
+                self.hVertex, self.hShape = index, shape
+                shape.highlightVertex(index, shape.MOVE_VERTEX)
+                self.overrideCursor(CURSOR_POINT)
+                # self.setToolTip("Click & drag to move point.")
+                # self.setStatusTip(self.toolTip())
+                self.update()
+                break
+            elif shape.containsPoint(pos):
+                if self.selectedVertex():
+                    self.hShape.highlightClear()
+                self.hVertex, self.hShape = None, shape
+                # self.setToolTip(
+                #     "Click & drag to move shape '%s'" % shape.label)
+                # self.setStatusTip(self.toolTip())
+                self.overrideCursor(CURSOR_GRAB)
+                self.update()
+                break
+        else:  # Nothing found, clear highlights, reset state.
+            if self.hShape:
+                self.hShape.highlightClear()
+                self.update()
+            self.hVertex, self.hShape = None, None
+            self.restoreCursor()
+        
+        self.setPendingStatus("(%d,%d)." % (pos.x(), pos.y()))
+        
+
+    def applyMove(self, pos, buttons):
+        """处理一次（合并后的）绘制、旋转或移动"""
         # Polygon drawing.
         if self.drawing():
             self.overrideCursor(CURSOR_DRAW)
@@ -159,84 +260,95 @@ class Canvas(QWidget):
                     self.current.highlightVertex(0, Shape.NEAR_VERTEX)
                 self.line[1] = pos
                 self.line.line_color = color
-                self.repaint()
+                self.markDirty()
                 self.current.highlightClear()
-                self.status.emit("width is %d, height is %d." % (pos.x()-self.line[0].x(), pos.y()-self.line[0].y()))
+                self.setPendingStatus("width is %d, height is %d." % (pos.x()-self.line[0].x(), pos.y()-self.line[0].y()))
             return
 
         # 处理右键旋转操作（只有在不是拖动模式时）
-        if (Qt.RightButton & ev.buttons()) and not self.isPanning:
+        if (Qt.RightButton & buttons) and not self.isPanning:
             # 如果选中了顶点和可旋转形状，则执行旋转操作
             if self.selectedVertex() and self.selectedShape and self.selectedShape.isRotated:
+                before = self.shapeWidgetRect(self.selectedShape)
+                self.rememberGeometry(self.hShape)
                 self.boundedRotateShape(pos)
+                self._movedInGesture = True
                 self.shapeMoved.emit()
-                self.repaint()
-            self.status.emit("(%d,%d)." % (pos.x(), pos.y()))
+                self.markDirty(before, self.selectedShape)
+            self.setPendingStatus("(%d,%d)." % (pos.x(), pos.y()))
             return
 
         # Polygon/Vertex moving.
-        if Qt.LeftButton & ev.buttons():
+        if Qt.LeftButton & buttons:
             if self.selectedVertex():
                 # if self.outOfPixmap(pos):
                 #     print("chule ")
                 #     return
                 # else:
                 # print("meiyou chujie")
+                before = self.shapeWidgetRect(self.hShape)
+                self.rememberGeometry(self.hShape)
                 self.boundedMoveVertex(pos)
+                self._movedInGesture = True
                 self.shapeMoved.emit()
-                self.repaint()
+                self.markDirty(before, self.hShape)
             elif self.selectedShape and self.prevPoint:
                 self.overrideCursor(CURSOR_MOVE)
+                before = self.shapeWidgetRect(self.selectedShape)
+                self.rememberGeometry(self.selectedShape)
                 self.boundedMoveShape(self.selectedShape, pos)
+                self._movedInGesture = True
                 self.shapeMoved.emit()
-                self.repaint()
-                self.status.emit("(%d,%d)." % (pos.x(), pos.y()))
+                self.markDirty(before, self.selectedShape)
+                self.setPendingStatus("(%d,%d)." % (pos.x(), pos.y()))
             return
 
-        # 如果正在拖动，不执行悬停逻辑
-        if self.isPanning:
-            return
-
-        # Just hovering over the canvas, 2 posibilities:
-        # - Highlight shapes
-        # - Highlight vertex
-        # Update shape/vertex fill and tooltip value accordingly.
-        self.setToolTip("Image")
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
-            # Look for a nearby vertex to highlight. If that fails,
-            # check if we happen to be inside a shape.
-            index = shape.nearestVertex(pos, self.epsilon)
-            if index is not None:
-                if self.selectedVertex():
-                    self.hShape.highlightClear()
-                self.hVertex, self.hShape = index, shape
-                shape.highlightVertex(index, shape.MOVE_VERTEX)
-                self.overrideCursor(CURSOR_POINT)
-                # self.setToolTip("Click & drag to move point.")
-                # self.setStatusTip(self.toolTip())
-                self.update()
-                break
-            elif shape.containsPoint(pos):
-                if self.selectedVertex():
-                    self.hShape.highlightClear()
-                self.hVertex, self.hShape = None, shape
-                # self.setToolTip(
-                #     "Click & drag to move shape '%s'" % shape.label)
-                # self.setStatusTip(self.toolTip())
-                self.overrideCursor(CURSOR_GRAB)
+    def scheduleFrame(self):
+        if not self._frameTimer.isActive():
+            self._frameTimer.start(max(0, self.frameInterval - self._frameClock.elapsed()))
+
+    def flushFrame(self):
+        """应用最新的鼠标位置，发出状态信息，并重绘累计的脏区域"""
+        if self._pendingMove is not None:
+            pos, buttons = self._pendingMove
+            self._pendingMove = None
+            self.applyMove(pos, buttons)
+        if self._pendingStatus is not None:
+            self.status.emit(self._pendingStatus)
+            self._pendingStatus = None
+        if self._dirtyRect is not None:
+            if self._dirtyRect.isEmpty():
                 self.update()
-                break
-        else:  # Nothing found, clear highlights, reset state.
-            if self.hShape:
-                self.hShape.highlightClear()
-                self.update()
-            self.hVertex, self.hShape = None, None
-            self.restoreCursor()
-        
-        self.status.emit("(%d,%d)." % (pos.x(), pos.y()))
-        
+            else:
+                self.update(self._dirtyRect)
+            self._dirtyRect = None
+        self._frameTimer.stop()
+        self._frameClock.restart()
+
+    def setPendingStatus(self, text):
+        self._pendingStatus = text
+        self.scheduleFrame()
+
+    def shapeWidgetRect(self, shape):
+        """形状在控件坐标系中的包围盒，留出顶点和线宽的余量"""
+        if shape is None or not shape.points:
+            return QRect()
+        rect = shape.boundingRect().translated(self.offsetToCenter())
+        rect = QRectF(rect.topLeft() * self.scale, rect.bottomRight() * self.scale)
+        margin = 2 * Shape.point_size + 8
+        return rect.adjusted(-margin, -margin, margin, margin).toAlignedRect()
+
+    def markDirty(self, before=None, shape=None):
+        """登记需要重绘的区域；不给出形状时重绘整个控件"""
+        if before is None:
+            self._dirtyRect = QRect()
+        elif self._dirtyRect is None or not self._dirtyRect.isEmpty():
+            rect = before.united(self.shapeWidgetRect(shape))
+            self._dirtyRect = rect if self._dirtyRect is None else self._dirtyRect.united(rect)
+        self.scheduleFrame()
 
     def mousePressEvent(self, ev):
+        self.flushFrame()
         pos = self.transformPos(ev.pos())
         # print('sldkfj %d %d' % (pos.x(), pos.y()))
         if ev.button() == Qt.LeftButton:
@@ -260,6 +372,11 @@ class Canvas(QWidget):
         # 移除中键拖动的处理
 
     def mouseReleaseEvent(self, ev):  
+        # 先应用尚未处理的移动，保证松开时形状停在最后的位置
+        self.flushFrame()
+        if self._movedInGesture:
+            self._movedInGesture = False
+            self.shapeMoveFinished.emit()
         self.hideBackroundShapes(False)      
         if ev.button() == Qt.RightButton:
             # 右键释放时停止拖动
@@ -296,6 +413,7 @@ class Canvas(QWidget):
             self.selectedShape = shape
             self.repaint()
         else:
+            self.rememberGeometry(self.selectedShape)
             self.selectedShape.points = [p for p in shape.points]
             # 移动后清除最近复制标记
             if hasattr(self.selectedShape, 'is_recently_copied'):
@@ -376,8 +494,8 @@ class Canvas(QWidget):
             self.selectionChanged.emit(True)
 
             return
-        for shape in reversed(self.shapes):
-            if self.isVisible(shape) and shape.containsPoint(point):
+        for shape in self.shapesAt(point):
+            if shape.containsPoint(point):
                 shape.selected = True
                 self.selectedShape = shape
                 self.calculateOffsets(shape, point)
@@ -508,10 +626,10 @@ class Canvas(QWidget):
                 dp -= QPointF(min(0,dc.x()), 0)
             if dc.y() < 0:                
                 dp -= QPointF(0, min(0,dc.y()))                
-            if dc.x() >= self.pixmap.width():
-                dp += QPointF(min(0, self.pixmap.width() - 1  - dc.x()), 0)
-            if dc.y() >= self.pixmap.height():
-                dp += QPointF(0, min(0, self.pixmap.height() - 1 - dc.y()))
+            if dc.x() >= self.imageSize.width():
+                dp += QPointF(min(0, self.imageSize.width() - 1  - dc.x()), 0)
+            if dc.y() >= self.imageSize.height():
+                dp += QPointF(0, min(0, self.imageSize.height() - 1 - dc.y()))
 
         else:            
             if self.outOfPixmap(pos):
@@ -521,8 +639,8 @@ class Canvas(QWidget):
                 pos -= QPointF(min(0, o1.x()), min(0, o1.y()))
             o2 = pos + self.offsets[1]
             if self.outOfPixmap(o2):
-                pos += QPointF(min(0, self.pixmap.width() - 1 - o2.x()),
-                               min(0, self.pixmap.height() - 1 - o2.y()))
+                pos += QPointF(min(0, self.imageSize.width() - 1 - o2.x()),
+                               min(0, self.imageSize.height() - 1 - o2.y()))
             dp = pos - self.prevPoint
         # The next line tracks the new position of the cursor
         # relative to the shape, but also results in making it
@@ -546,8 +664,8 @@ class Canvas(QWidget):
             pos -= QPointF(min(0, o1.x()), min(0, o1.y()))
         o2 = pos + self.offsets[1]
         if self.outOfPixmap(o2):
-            pos += QPointF(min(0, self.pixmap.width() - o2.x()),
-                           min(0, self.pixmap.height() - o2.y()))
+            pos += QPointF(min(0, self.imageSize.width() - o2.x()),
+                           min(0, self.imageSize.height() - o2.y()))
         # The next line tracks the new position of the cursor
         # relative to the shape, but also results in making it
         # a bit "shaky" when nearing the border and allows it to
@@ -616,7 +734,7 @@ class Canvas(QWidget):
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        self.drawImage(p, event.rect())
         Shape.scale = self.scale
         for shape in self.shapes:
             if (shape.selected or not self._hideBackround) and self.isVisible(shape):
@@ -694,6 +812,19 @@ class Canvas(QWidget):
 
         p.end()
 
+    def drawImage(self, p, exposed):
+        if self.tiles is not None:
+            topLeft = self.transformPos(QPointF(exposed.topLeft()))
+            bottomRight = self.transformPos(QPointF(exposed.bottomRight()) + QPointF(1, 1))
+            self.tiles.paint(p, (topLeft.x(), topLeft.y(), bottomRight.x(), bottomRight.y()),
+                             self.scale)
+        elif self.pixmap.size() == self.imageSize:
+            p.drawPixmap(0, 0, self.pixmap)
+        else:
+            # 预览图拉伸到原图尺寸显示，标注坐标保持不变
+            target = QRectF(0, 0, self.imageSize.width(), self.imageSize.height())
+            p.drawPixmap(target, self.pixmap, QRectF(self.pixmap.rect()))
+
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical coordinates."""
         return point / self.scale - self.offsetToCenter()
@@ -701,14 +832,14 @@ class Canvas(QWidget):
     def offsetToCenter(self):
         s = self.scale
         area = super(Canvas, self).size()
-        w, h = self.pixmap.width() * s, self.pixmap.height() * s
+        w, h = self.imageSize.width() * s, self.imageSize.height() * s
         aw, ah = area.width(), area.height()
         x = (aw - w) / (2 * s) if aw > w else 0
         y = (ah - h) / (2 * s) if ah > h else 0
         return QPointF(x, y)
 
     def outOfPixmap(self, p):
-        w, h = self.pixmap.width(), self.pixmap.height()
+        w, h = self.imageSize.width(), self.imageSize.height()
         return not (0 <= p.x() < w and 0 <= p.y() < h)
 
     def finalise(self):
@@ -849,7 +980,7 @@ class Canvas(QWidget):
         # Cycle through each image edge in clockwise fashion,
         # and find the one intersecting the current line segment.
         # http://paulbourke.net/geometry/lineline2d/
-        size = self.pixmap.size()
+        size = self.imageSize
         points = [(0, 0),
                   (size.width(), 0),
                   (size.width(), size.height()),
@@ -901,7 +1032,7 @@ class Canvas(QWidget):
 
     def minimumSizeHint(self):
         if self.pixmap:
-            return self.scale * self.pixmap.size()
+            return self.scale * self.imageSize
         return super(Canvas, self).minimumSizeHint()
 
     def wheelEvent(self, ev):
@@ -946,21 +1077,25 @@ class Canvas(QWidget):
             self.moveOnePixel('Down')
         elif key == Qt.Key_Z and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(0.1):
+            self.rememberGeometry(self.selectedShape)
             self.selectedShape.rotate(0.1)
             self.shapeMoved.emit() 
             self.update()  
         elif key == Qt.Key_X and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(0.01):
+            self.rememberGeometry(self.selectedShape)
             self.selectedShape.rotate(0.01) 
             self.shapeMoved.emit()
             self.update()  
         elif key == Qt.Key_C and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(-0.01):
+            self.rememberGeometry(self.selectedShape)
             self.selectedShape.rotate(-0.01) 
             self.shapeMoved.emit()
             self.update()  
         elif key == Qt.Key_V and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(-0.1):
+            self.rememberGeometry(self.selectedShape)
             self.selectedShape.rotate(-0.1)
             self.shapeMoved.emit()
             self.update()
@@ -982,41 +1117,21 @@ class Canvas(QWidget):
     def rotateOutOfBound(self, angle):
         if self.canOutOfBounding:
             return False
-        for i, p in enumerate(self.selectedShape.points):
-            if self.outOfPixmap(self.selectedShape.rotatePoint(p,angle)):
-                return True
-        return False
+        # 一次性旋转全部顶点，再整体判断是否越界
+        rotated = self.selectedShape.rotatedCorners(angle)
+        x, y = rotated[:, 0], rotated[:, 1]
+        w, h = self.imageSize.width(), self.imageSize.height()
+        return bool(((x < 0) | (x >= w) | (y < 0) | (y >= h)).any())
 
     def moveOnePixel(self, direction):
         # print(self.selectedShape.points)
-        if direction == 'Left' and not self.moveOutOfBound(QPointF(-1.0, 0)):
-            # print("move Left one pixel")
-            self.selectedShape.points[0] += QPointF(-1.0, 0)
-            self.selectedShape.points[1] += QPointF(-1.0, 0)
-            self.selectedShape.points[2] += QPointF(-1.0, 0)
-            self.selectedShape.points[3] += QPointF(-1.0, 0)
-            self.selectedShape.center += QPointF(-1.0, 0)
-        elif direction == 'Right' and not self.moveOutOfBound(QPointF(1.0, 0)):
-            # print("move Right one pixel")
-            self.selectedShape.points[0] += QPointF(1.0, 0)
-            self.selectedShape.points[1] += QPointF(1.0, 0)
-            self.selectedShape.points[2] += QPointF(1.0, 0)
-            self.selectedShape.points[3] += QPointF(1.0, 0)
-            self.selectedShape.center += QPointF(1.0, 0)
-        elif direction == 'Up' and not self.moveOutOfBound(QPointF(0, -1.0)):
-            # print("move Up one pixel")
-            self.selectedShape.points[0] += QPointF(0, -1.0)
-            self.selectedShape.points[1] += QPointF(0, -1.0)
-            self.selectedShape.points[2] += QPointF(0, -1.0)
-            self.selectedShape.points[3] += QPointF(0, -1.0)
-            self.selectedShape.center += QPointF(0, -1.0)
-        elif direction == 'Down' and not self.moveOutOfBound(QPointF(0, 1.0)):
-            # print("move Down one pixel")
-            self.selectedShape.points[0] += QPointF(0, 1.0)
-            self.selectedShape.points[1] += QPointF(0, 1.0)
-            self.selectedShape.points[2] += QPointF(0, 1.0)
-            self.selectedShape.points[3] += QPointF(0, 1.0)
-            self.selectedShape.center += QPointF(0, 1.0)
+        step = {'Left': QPointF(-1.0, 0), 'Right': QPointF(1.0, 0),
+                'Up': QPointF(0, -1.0), 'Down': QPointF(0, 1.0)}.get(direction)
+        if step is not None and not self.moveOutOfBound(step):
+            self.rememberGeometry(self.selectedShape)
+            # 生成新的顶点而不是原地修改，复制出的形状可能共享同一批 QPointF
+            self.selectedShape.moveBy(step)
+            self.selectedShape.center = self.selectedShape.center + step
         self.shapeMoved.emit()
         self.repaint()
 
@@ -1046,13 +1161,41 @@ class Canvas(QWidget):
         self.drawingPolygon.emit(False)
         self.update()
 
-    def loadPixmap(self, pixmap):
+    def loadImage(self, image, path=None, fullSize=None):
+        """fullSize 不为空时 image 只是超大图片 path 的总览图，原图按瓦片从文件解码绘制"""
+        if fullSize is None:
+            self.loadPixmap(QPixmap.fromImage(image))
+            return
+        tiles = TilePyramid(path, fullSize, image)
+        tiles.tileReady.connect(self.update)
+        self.loadPixmap(tiles.overview, fullSize)
+        self.setTiles(tiles)
+
+    def setTiles(self, tiles):
+        if self.tiles is not None:
+            self.tiles.shutdown()
+        self.tiles = tiles
+
+    def loadPixmap(self, pixmap, imageSize=None):
+        self.setTiles(None)
         self.pixmap = pixmap
+        self.imageSize = QSize(imageSize) if imageSize is not None else pixmap.size()
         self.shapes = []
         self.repaint()
 
+    def rememberGeometry(self, shape):
+        """记下形状在本次修改前的顶点和方向，同一形状只记第一次"""
+        if shape is not None and shape not in self._moveOrigins:
+            self._moveOrigins[shape] = ([(p.x(), p.y()) for p in shape.points], shape.direction)
+
+    def takeMoveOrigins(self):
+        """取走并清空 {形状: (修改前的顶点, 方向)}"""
+        origins, self._moveOrigins = self._moveOrigins, {}
+        return origins
+
     def loadShapes(self, shapes):
         self.shapes = list(shapes)
+        self._moveOrigins = {}
         self.current = None
         self.repaint()
 
@@ -1110,5 +1253,8 @@ class Canvas(QWidget):
 
     def resetState(self):
         self.restoreCursor()
+        self._moveOrigins = {}
         self.pixmap = None
+        self.imageSize = QSize()
+        self.setTiles(None)
         self.update()
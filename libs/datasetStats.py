@@ -0,0 +1,268 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 数据集统计：每个 XML 解析一次得到一份摘要（各类别数量、旋转框数、尺寸和角度直方图），
+# 摘要按 XML 的 (修改时间, 大小) 缓存在项目清单中，全数据集的统计由摘要累加，
+# 单个文件变化时只替换它自己的摘要
+
+import json
+import os
+import threading
+
+import numpy as np
+
+try:
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from boxGeometry import cornersToRbox
+from imageLoader import fileStamp
+from vocBatchReader import processPool, readVocFiles
+
+# 尺寸直方图按 sqrt(宽 * 高) 分桶，数值为各桶下界
+SIZE_BINS = (0, 16, 32, 64, 128, 256, 512, 1024)
+# 旋转框角度直方图的桶宽（度），覆盖 [0, 180)
+ANGLE_BIN_DEGREES = 15
+ANGLE_BIN_COUNT = 180 // ANGLE_BIN_DEGREES
+
+UNNAMED_LABEL = u"未命名"
+
+
+class LabelSummary(object):
+    """一个标注文件的统计摘要"""
+
+    __slots__ = ('stamp', 'labels', 'total', 'rotated', 'sizeHist', 'angleHist')
+
+    def __init__(self, stamp=None, labels=None, total=0, rotated=0, sizeHist=None, angleHist=None):
+        self.stamp = tuple(stamp) if stamp is not None else None
+        self.labels = labels if labels is not None else {}
+        self.total = total
+        self.rotated = rotated
+        self.sizeHist = sizeHist if sizeHist is not None else [0] * len(SIZE_BINS)
+        self.angleHist = angleHist if angleHist is not None else [0] * ANGLE_BIN_COUNT
+
+    def toRow(self):
+        """转成项目清单中保存的一行 (XML 修改时间, 大小, 框数, 旋转框数, 标签, 尺寸直方图, 角度直方图)"""
+        stamp = self.stamp or (None, None)
+        return (stamp[0], stamp[1], self.total, self.rotated, json.dumps(self.labels),
+                json.dumps(self.sizeHist), json.dumps(self.angleHist))
+
+    @classmethod
+    def fromRow(cls, row):
+        xmlMtime, xmlSize, total, rotated, labels, sizeHist, angleHist = row
+        stamp = (xmlMtime, xmlSize) if xmlMtime is not None else None
+        return cls(stamp, json.loads(labels), total or 0, rotated or 0,
+                   json.loads(sizeHist) if sizeHist else None,
+                   json.loads(angleHist) if angleHist else None)
+
+
+def summarizeBoxes(labels, rboxes, rotated, stamp=None):
+    """labels 为各框的标签，rboxes 为 (N, 5) 的 (cx, cy, w, h, angle)，rotated 为 (N,) bool"""
+    counts = {}
+    for label in labels:
+        label = label if label else UNNAMED_LABEL
+        counts[label] = counts.get(label, 0) + 1
+    rboxes = np.asarray(rboxes, dtype=np.float64).reshape(-1, 5)
+    rotated = np.asarray(rotated, dtype=bool)
+    sizeHist = [0] * len(SIZE_BINS)
+    angleHist = [0] * ANGLE_BIN_COUNT
+    if len(rboxes):
+        sizes = np.sqrt(rboxes[:, 2] * rboxes[:, 3])
+        bins = np.searchsorted(SIZE_BINS, sizes, side='right') - 1
+        sizeHist = np.bincount(np.clip(bins, 0, len(SIZE_BINS) - 1),
+                               minlength=len(SIZE_BINS)).tolist()
+        if rotated.any():
+            degrees = np.degrees(np.mod(rboxes[rotated, 4], np.pi)) % 180
+            angleBins = np.minimum((degrees // ANGLE_BIN_DEGREES).astype(int), ANGLE_BIN_COUNT - 1)
+            angleHist = np.bincount(angleBins, minlength=ANGLE_BIN_COUNT).tolist()
+    return LabelSummary(stamp, counts, len(rboxes), int(rotated.sum()), sizeHist, angleHist)
+
+
+def summarizeShapes(shapes, stamp=None):
+    """shapes 为 PascalVocReader.getShapes() 格式的 (label, points, direction, isRotated, ...) 序列"""
+    boxes = [s for s in shapes if len(s[1]) == 4]
+    rboxes = cornersToRbox([s[1] for s in boxes], directions=[s[2] for s in boxes]) \
+        if boxes else np.zeros((0, 5))
+    return summarizeBoxes([s[0] for s in boxes], rboxes, [bool(s[3]) for s in boxes], stamp)
+
+
+def summarizeArrays(arrays, stamps):
+    """由 vocBatchReader.readVocFiles 的结果为每个文件生成摘要，解析失败的文件为 None"""
+    names = np.array(arrays.labelNames, dtype=object)
+    ends = np.searchsorted(arrays.imageIds, np.arange(len(arrays.paths)), side='right')
+    failed = set(arrays.failed)
+    summaries = []
+    start = 0
+    for i, end in enumerate(ends):
+        if i in failed:
+            summaries.append(None)
+        else:
+            summaries.append(summarizeBoxes(names[arrays.labelIds[start:end]], arrays.boxes[start:end],
+                                            arrays.rotated[start:end], stamps[i]))
+        start = end
+    return summaries
+
+
+class DatasetStats(object):
+    """由各文件摘要累加得到的数据集统计，单个文件变化时增量更新"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        self._files = {}
+        self.labels = {}
+        self.total = 0
+        self.rotated = 0
+        self.sizeHist = [0] * len(SIZE_BINS)
+        self.angleHist = [0] * ANGLE_BIN_COUNT
+
+    def __len__(self):
+        return len(self._files)
+
+    def stampFor(self, path):
+        summary = self._files.get(path)
+        return summary.stamp if summary is not None else None
+
+    def _apply(self, summary, sign):
+        for label, count in summary.labels.items():
+            value = self.labels.get(label, 0) + sign * count
+            if value:
+                self.labels[label] = value
+            else:
+                self.labels.pop(label, None)
+        self.total += sign * summary.total
+        self.rotated += sign * summary.rotated
+        for i, count in enumerate(summary.sizeHist[:len(self.sizeHist)]):
+            self.sizeHist[i] += sign * count
+        for i, count in enumerate(summary.angleHist[:len(self.angleHist)]):
+            self.angleHist[i] += sign * count
+
+    def setSummary(self, path, summary):
+        """替换一个文件的摘要，summary 为 None 时移除"""
+        old = self._files.pop(path, None)
+        if old is not None:
+            self._apply(old, -1)
+        if summary is not None:
+            self._files[path] = summary
+            self._apply(summary, 1)
+
+    def remove(self, path):
+        self.setSummary(path, None)
+
+    def rotatedRatio(self):
+        return float(self.rotated) / self.total if self.total else 0.0
+
+
+class _SummaryTask(QRunnable):
+
+    def __init__(self, aggregator, generation, items, known, manifest):
+        super(_SummaryTask, self).__init__()
+        self.aggregator = aggregator
+        self.generation = generation
+        self.items = items
+        self.known = known
+        self.manifest = manifest
+
+    def run(self):
+        aggregator, generation = self.aggregator, self.generation
+        cached = {}
+        if self.manifest is not None:
+            # 少量文件只查这几行，整个数据集时一次读出全部缓存
+            paths = None if len(self.items) >= aggregator.batchSize else [p for p, _ in self.items]
+            cached = self.manifest.loadLabelStats(paths)
+        results = []
+        toParse = []
+        for imagePath, xmlPath in self.items:
+            stamp = fileStamp(xmlPath) if xmlPath else None
+            if stamp is None:
+                results.append((imagePath, None))
+                continue
+            if self.known.get(imagePath) == stamp:
+                continue
+            row = cached.get(imagePath)
+            if row is not None and (row[0], row[1]) == stamp:
+                try:
+                    results.append((imagePath, LabelSummary.fromRow(row)))
+                    continue
+                except (ValueError, TypeError):
+                    pass
+            toParse.append((imagePath, xmlPath, stamp))
+        if results and aggregator.isCurrent(generation):
+            aggregator.summariesReady.emit(generation, results)
+
+        # 未缓存或已变化的文件分批解析后交给界面，文件多时用多个进程
+        parsed = []
+        pool = None
+        if len(toParse) >= aggregator.processThreshold and aggregator.processes > 1:
+            pool = processPool(aggregator.processes)
+        try:
+            for start in range(0, len(toParse), aggregator.batchSize):
+                if not aggregator.isCurrent(generation):
+                    return
+                chunk = toParse[start:start + aggregator.batchSize]
+                arrays = readVocFiles([x for _, x, _ in chunk], processes=1,
+                                      chunkSize=aggregator.chunkSize, executor=pool)
+                summaries = summarizeArrays(arrays, [stamp for _, _, stamp in chunk])
+                batch = [(imagePath, s) for (imagePath, _, _), s in zip(chunk, summaries)]
+                parsed.extend((p, s) for p, s in batch if s is not None)
+                if aggregator.isCurrent(generation):
+                    aggregator.summariesReady.emit(generation, batch)
+        finally:
+            if pool is not None:
+                pool.shutdown()
+        if parsed and self.manifest is not None:
+            self.manifest.saveLabelStats([(p, s.toRow()) for p, s in parsed])
+        if aggregator.isCurrent(generation):
+            aggregator.finished.emit(generation)
+
+
+class StatsAggregator(QObject):
+    """在后台为一批标注文件生成摘要
+
+    summariesReady 的参数为 (generation, [(图片路径, LabelSummary 或 None), ...])，
+    None 表示该图片没有可用的标注文件。reset() 之后旧任务的结果不再发出。
+    """
+
+    summariesReady = pyqtSignal(int, list)
+    finished = pyqtSignal(int)
+
+    batchSize = 500
+    # 待解析的文件达到 processThreshold 个时才启动进程池，每个进程一次处理 chunkSize 个
+    processThreshold = 2000
+    processes = min(8, os.cpu_count() or 1)
+    chunkSize = 100
+
+    def __init__(self, parent=None):
+        super(StatsAggregator, self).__init__(parent)
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._lock = threading.Lock()
+        self._generation = 0
+
+    def isCurrent(self, generation):
+        with self._lock:
+            return generation == self._generation
+
+    def generation(self):
+        with self._lock:
+            return self._generation
+
+    def reset(self):
+        """丢弃尚未完成的任务，返回新的编号"""
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self.pool.clear()
+        return generation
+
+    def update(self, items, known=None, manifest=None):
+        """items 为 [(图片路径, XML 路径)]，known 为界面已有摘要的 {图片路径: stamp}"""
+        if not items:
+            return
+        self.pool.start(_SummaryTask(self, self.generation(), list(items),
+                                     dict(known or {}), manifest))
+
+    def shutdown(self, msecs=3000):
+        self.reset()
+        self.pool.waitForDone(msecs)
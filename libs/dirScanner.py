@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 图片目录扫描：os.scandir 逐个目录列出，按批次把找到的图片交给界面，可随时取消；
+# 目录清单按目录修改时间缓存，再次打开未变化的目录时只需 stat 一次，不必重新列出
+
+import hashlib
+import json
+import os
+import threading
+
+try:
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+IMAGE_EXTENSIONS = ('.jpeg', '.jpg', '.png', '.bmp')
+
+
+def isImageName(name):
+    return name.lower().endswith(IMAGE_EXTENSIONS)
+
+
+def sortImages(paths):
+    paths.sort(key=lambda x: x.lower())
+    return paths
+
+
+def listImageDir(dirPath):
+    """列出一个目录，返回 (图片文件名, 子目录名)；与 os.walk 一样不进入符号链接目录"""
+    files, subdirs = [], []
+    try:
+        it = os.scandir(dirPath)
+    except OSError:
+        return files, subdirs
+    with it:
+        for e in it:
+            name = e.name
+            try:
+                isDir = e.is_dir()
+            except OSError:
+                isDir = False
+            if isDir:
+                if not e.is_symlink():
+                    subdirs.append(name)
+            elif isImageName(name):
+                files.append(name)
+    return files, subdirs
+
+
+def scanImages(root, manifest=None, isCancelled=None, onBatch=None, batchSize=1000):
+    """扫描 root 下所有图片，返回按小写路径排序的列表；被取消时返回 None
+
+    manifest 为 {目录: [修改时间, 图片文件名, 子目录名]}，修改时间未变的目录直接复用，
+    扫描完成后 manifest 被替换为本次访问过的目录。
+    onBatch(paths, dirCount) 在每找到 batchSize 张图片时调用一次。
+    """
+    cached = manifest if manifest is not None else {}
+    visited = {}
+    images = []
+    batch = []
+    stack = [root]
+    while stack:
+        if isCancelled is not None and isCancelled():
+            return None
+        dirPath = stack.pop()
+        try:
+            mtime = os.stat(dirPath).st_mtime_ns
+        except OSError:
+            continue
+        entry = cached.get(dirPath)
+        if entry is None or entry[0] != mtime:
+            files, subdirs = listImageDir(dirPath)
+            entry = [mtime, files, subdirs]
+        visited[dirPath] = entry
+        # os.path.join(dirPath, '') 与逐个 join 结果相同，但每个目录只算一次
+        prefix = os.path.join(dirPath, '')
+        batch.extend([prefix + name for name in entry[1]])
+        stack.extend([prefix + name for name in reversed(entry[2])])
+        if len(batch) >= batchSize:
+            images.extend(batch)
+            if onBatch is not None:
+                onBatch(batch, len(visited))
+            batch = []
+    images.extend(batch)
+    if batch and onBatch is not None:
+        onBatch(batch, len(visited))
+    if manifest is not None:
+        manifest.clear()
+        manifest.update(visited)
+    return sortImages(images)
+
+
+class ScanManifestStore(object):
+    """目录清单的磁盘缓存，每个扫描根目录一个 JSON 文件"""
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+
+    def pathFor(self, root):
+        digest = hashlib.md5(os.path.abspath(root).encode('utf-8', 'surrogateescape')).hexdigest()
+        return os.path.join(self.cacheDir, 'scan-%s.json' % digest)
+
+    def load(self, root):
+        try:
+            with open(self.pathFor(root), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+        if data.get('root') != root:
+            return {}
+        return data.get('dirs', {})
+
+    def save(self, root, manifest):
+        path = self.pathFor(root)
+        tmpPath = path + '.tmp'
+        try:
+            if not os.path.isdir(self.cacheDir):
+                os.makedirs(self.cacheDir)
+            with open(tmpPath, 'w', encoding='utf-8') as f:
+                json.dump({'root': root, 'dirs': manifest}, f)
+            os.replace(tmpPath, path)
+        except (IOError, OSError, ValueError):
+            pass
+
+
+class _ScanTask(QRunnable):
+
+    def __init__(self, scanner, requestId, root, postProcess=None):
+        super(_ScanTask, self).__init__()
+        self.scanner = scanner
+        self.requestId = requestId
+        self.root = root
+        self.postProcess = postProcess
+
+    def run(self):
+        scanner, requestId, root = self.scanner, self.requestId, self.root
+        isCancelled = lambda: not scanner.isCurrent(requestId)
+        found = [0]
+
+        def onBatch(paths, dirCount):
+            found[0] += len(paths)
+            if not isCancelled():
+                scanner.batchFound.emit(requestId, list(paths))
+                scanner.progress.emit(requestId, found[0], dirCount)
+
+        manifest = scanner.manifestFor(root)
+        images = scanImages(root, manifest, isCancelled, onBatch, scanner.batchSize)
+        if images is None or isCancelled():
+            return
+        scanner.saveManifest(root, manifest)
+        extra = self.postProcess(images) if self.postProcess is not None else None
+        if isCancelled():
+            return
+        scanner.finished.emit(requestId, images, extra)
+
+
+class DirScanner(QObject):
+    """在工作线程中扫描图片目录；新的扫描或 cancel() 会让旧的扫描作废
+
+    信号在工作线程中发出，GUI 线程通过排队连接处理。
+    """
+
+    batchFound = pyqtSignal(int, list)
+    progress = pyqtSignal(int, int, int)
+    finished = pyqtSignal(int, list, object)
+
+    batchSize = 2000
+
+    def __init__(self, store=None, parent=None):
+        super(DirScanner, self).__init__(parent)
+        self.store = store
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._lock = threading.Lock()
+        self._requestId = 0
+        self._manifests = {}
+
+    def isCurrent(self, requestId):
+        with self._lock:
+            return requestId == self._requestId
+
+    def scan(self, root, postProcess=None):
+        """开始扫描 root，返回请求编号
+
+        postProcess(images) 在工作线程中对排好序的结果做进一步处理，
+        返回值作为 finished 信号的第三个参数。
+        """
+        with self._lock:
+            self._requestId += 1
+            requestId = self._requestId
+        self.pool.clear()
+        self.pool.start(_ScanTask(self, requestId, root, postProcess))
+        return requestId
+
+    def manifestFor(self, root):
+        with self._lock:
+            manifest = self._manifests.get(root)
+        if manifest is None:
+            manifest = self.store.load(root) if self.store is not None else {}
+        # 扫描过程中会修改清单，交给工作线程一份副本
+        return dict(manifest)
+
+    def saveManifest(self, root, manifest):
+        with self._lock:
+            self._manifests[root] = manifest
+        if self.store is not None:
+            self.store.save(root, manifest)
+
+    def cancel(self):
+        with self._lock:
+            self._requestId += 1
+        self.pool.clear()
+
+    def shutdown(self, msecs=3000):
+        self.cancel()
+        self.pool.waitForDone(msecs)
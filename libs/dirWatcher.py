@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 目录监视：QFileSystemWatcher 通知目录变化后只重新列出该目录并与上次的结果比较，
+# 网络文件系统上收不到通知时，由定时器检查目录修改时间作为兜底；
+# 列目录在工作线程中进行，目录修改时间未变（如本程序自己刚写完文件）时不重新列出
+
+import os
+
+try:
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, QTimer, QFileSystemWatcher, pyqtSignal
+
+
+def listFiles(dirPath, suffix=None):
+    """目录下的文件 {文件名: (修改时间, 大小)}，目录不可读时返回 None
+
+    以点开头的文件（保存时的临时文件、项目清单数据库等）不计入。
+    """
+    files = {}
+    try:
+        it = os.scandir(dirPath)
+    except (OSError, TypeError, ValueError):
+        return None
+    with it:
+        for e in it:
+            if e.name.startswith('.'):
+                continue
+            if suffix and not e.name.lower().endswith(suffix):
+                continue
+            try:
+                if not e.is_file():
+                    continue
+                st = e.stat()
+            except OSError:
+                continue
+            files[e.name] = (st.st_mtime_ns, st.st_size)
+    return files
+
+
+def dirStamp(dirPath):
+    try:
+        return os.stat(dirPath).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        return None
+
+
+class _ListTask(QRunnable):
+
+    def __init__(self, watcher, dirPath):
+        super(_ListTask, self).__init__()
+        self.watcher = watcher
+        self.dirPath = dirPath
+
+    def run(self):
+        # 先取目录修改时间再列出，列出期间的变化会在下次比较时发现
+        stamp = dirStamp(self.dirPath)
+        files = listFiles(self.dirPath, self.watcher.suffix)
+        self.watcher._listed.emit(self.dirPath, stamp, files or {})
+
+
+class DirectoryWatcher(QObject):
+    """监视一组目录中 suffix 类型文件的创建、修改和删除
+
+    filesChanged 信号的参数为 [(路径, 是否存在), ...]，同一批目录变化合并发出一次。
+    目录在工作线程中列出；本程序自己写出的文件由 noteWritten 登记，不会再作为变化发出，
+    之后目录修改时间没有别的变化时，通知也不再引起重新列出。
+    """
+
+    filesChanged = pyqtSignal(list)
+    _listed = pyqtSignal(str, object, dict)
+
+    # 目录变化通知的合并间隔（毫秒）
+    coalesceInterval = 200
+    # 兜底轮询间隔（毫秒）
+    pollInterval = 5000
+
+    def __init__(self, suffix=None, parent=None):
+        super(DirectoryWatcher, self).__init__(parent)
+        self.suffix = suffix.lower() if suffix else None
+        # 目录 -> 上次列出的结果，还没列出过的为 None
+        self._listings = {}
+        self._stamps = {}
+        # 目录 -> 本程序最后一次写入后的目录修改时间
+        self._ownStamps = {}
+        # 目录 -> 列出期间本程序写入的 {文件名: stamp}，列出的结果可能早于这些写入
+        self._writtenWhileListing = {}
+        self._dirty = set()
+        self._listing = set()
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._listed.connect(self.onListed)
+        self.watcher = QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onDirectoryChanged)
+        self.flushTimer = QTimer(self)
+        self.flushTimer.setSingleShot(True)
+        self.flushTimer.setInterval(self.coalesceInterval)
+        self.flushTimer.timeout.connect(self.flush)
+        self.pollTimer = QTimer(self)
+        self.pollTimer.setInterval(self.pollInterval)
+        self.pollTimer.timeout.connect(self.poll)
+
+    def directories(self):
+        return list(self._listings)
+
+    def setDirectories(self, dirs):
+        """替换监视的目录集合，新目录在后台列出一次作为比较基准"""
+        dirs = set(os.path.normpath(d) for d in dirs if d)
+        removed = [d for d in self._listings if d not in dirs]
+        if removed:
+            self.watcher.removePaths(removed)
+        for d in removed:
+            self._listings.pop(d, None)
+            self._stamps.pop(d, None)
+            self._ownStamps.pop(d, None)
+            self._writtenWhileListing.pop(d, None)
+            self._dirty.discard(d)
+        added = [d for d in dirs if d not in self._listings]
+        for d in added:
+            self._listings[d] = None
+            self.startListing(d)
+        watchable = [d for d in added if os.path.isdir(d)]
+        if watchable:
+            # 超出系统监视数量上限的目录只能依靠轮询
+            self.watcher.addPaths(watchable)
+        if self._listings:
+            self.pollTimer.start()
+        else:
+            self.pollTimer.stop()
+
+    def clear(self):
+        self.setDirectories([])
+
+    def noteWritten(self, path, stamp):
+        """登记本程序刚写完的文件及其 (修改时间, 大小)"""
+        d, name = os.path.split(os.path.normpath(path))
+        listing = self._listings.get(d)
+        if listing is None or stamp is None:
+            return
+        if self.suffix and not name.lower().endswith(self.suffix):
+            return
+        listing[name] = tuple(stamp)
+        self._ownStamps[d] = dirStamp(d)
+        if d in self._listing:
+            self._writtenWhileListing.setdefault(d, {})[name] = tuple(stamp)
+
+    def noteDirWritten(self, dirPath, before, after):
+        """登记本程序在目录中写入其他文件（如项目清单的回滚日志）前后的目录修改时间
+
+        写入前目录没有未处理的变化时，这次写入引起的通知不再重新列出目录。
+        """
+        d = os.path.normpath(dirPath)
+        if d not in self._listings or before is None or after is None:
+            return
+        if before in (self._ownStamps.get(d), self._stamps.get(d)):
+            self._ownStamps[d] = after
+
+    def onDirectoryChanged(self, path):
+        self._dirty.add(os.path.normpath(path))
+        self.flushTimer.start()
+
+    def poll(self):
+        """目录修改时间变化时才重新列出该目录"""
+        for d in self._listings:
+            if d not in self._listing and dirStamp(d) != self._stamps.get(d):
+                self._dirty.add(d)
+        if self._dirty:
+            self.flush()
+
+    def flush(self):
+        """重新列出有变化的目录，比较结果由 onListed 发出"""
+        self.flushTimer.stop()
+        dirty, self._dirty = self._dirty, set()
+        for d in dirty:
+            if d not in self._listings:
+                continue
+            stamp = dirStamp(d)
+            if stamp is not None and stamp == self._ownStamps.get(d):
+                # 自上次本程序写入后目录没有别的变化，已登记的文件就是全部变化
+                self._stamps[d] = stamp
+                continue
+            self.startListing(d)
+
+    def startListing(self, d):
+        if d in self._listing:
+            # 正在列出，完成后再列一次
+            self._dirty.add(d)
+            return
+        self._listing.add(d)
+        self.pool.start(_ListTask(self, d))
+
+    def waitForDone(self, msecs=-1):
+        """等待后台列目录完成，结果在事件循环处理排队的信号后生效"""
+        return self.pool.waitForDone(msecs)
+
+    def onListed(self, dirPath, stamp, files):
+        self._listing.discard(dirPath)
+        written = self._writtenWhileListing.pop(dirPath, None)
+        if dirPath not in self._listings:
+            return
+        if written:
+            files.update(written)
+        self._stamps[dirPath] = stamp
+        changes = self.rescan(dirPath, files)
+        if changes:
+            self.filesChanged.emit(changes)
+        if self._dirty:
+            self.flushTimer.start()
+
+    def rescan(self, dirPath, new):
+        """new 为重新列出的结果，返回与上次相比变化的文件；第一次列出只作为基准"""
+        old = self._listings.get(dirPath)
+        self._listings[dirPath] = new
+        changes = []
+        if old is not None:
+            for name, stamp in new.items():
+                if old.get(name) != stamp:
+                    changes.append((os.path.join(dirPath, name), True))
+            for name in old:
+                if name not in new:
+                    changes.append((os.path.join(dirPath, name), False))
+        # 目录被删除后重建时需要重新加入监视
+        if os.path.isdir(dirPath) and dirPath not in self.watcher.directories():
+            self.watcher.addPath(dirPath)
+        return changes
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 文件列表模型：不为每张图片创建列表项，视图只向模型查询可见行的数据
+
+import os
+
+try:
+    from PyQt5.QtGui import QColor
+    from PyQt5.QtCore import Qt, QAbstractListModel, QModelIndex
+except ImportError:
+    from PyQt4.QtGui import QColor
+    from PyQt4.QtCore import Qt, QAbstractListModel, QModelIndex
+
+
+class FileListModel(QAbstractListModel):
+    """图片路径列表的只读模型
+
+    statusFunc(row) 返回该行是否已标注，tooltipFunc(row) 返回已标注行的提示文字，
+    两者都只在视图绘制到该行时才调用。
+    """
+
+    annotatedColor = QColor(34, 139, 34)  # Forest Green
+    defaultColor = QColor(0, 0, 0)
+
+    def __init__(self, statusFunc=None, tooltipFunc=None, parent=None):
+        super(FileListModel, self).__init__(parent)
+        self.statusFunc = statusFunc
+        self.tooltipFunc = tooltipFunc
+        self._paths = []
+        self._rows = None
+
+    def setPaths(self, paths):
+        """替换整个列表；paths 直接引用，不复制"""
+        self.beginResetModel()
+        self._paths = paths
+        self._rows = None
+        self.endResetModel()
+
+    def appendPaths(self, paths):
+        """在末尾追加一批路径（扫描目录时逐批加入）"""
+        if not paths:
+            return
+        start = len(self._paths)
+        self.beginInsertRows(QModelIndex(), start, start + len(paths) - 1)
+        self._paths.extend(paths)
+        if self._rows is not None:
+            for i, p in enumerate(paths, start):
+                self._rows.setdefault(p, i)
+        self.endInsertRows()
+
+    def paths(self):
+        return self._paths
+
+    def path(self, row):
+        return self._paths[row]
+
+    def rowOf(self, path):
+        """路径所在的行，不在列表中时返回 -1；路径到行号的映射在首次查询时建立"""
+        if self._rows is None:
+            self._rows = dict((p, i) for i, p in enumerate(self._paths))
+        return self._rows.get(path, -1)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._paths)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._paths):
+            return None
+        row = index.row()
+        if role == Qt.DisplayRole:
+            return os.path.basename(self._paths[row])
+        if role in (Qt.ForegroundRole, Qt.ToolTipRole):
+            annotated = bool(self.statusFunc and self.statusFunc(row))
+            if role == Qt.ForegroundRole:
+                return self.annotatedColor if annotated else self.defaultColor
+            if annotated:
+                return self.tooltipFunc(row) if self.tooltipFunc else None
+            return u"未标注"
+        return None
+
+    def refreshRows(self, rows=None):
+        """通知视图这些行的标注状态变了，rows 为空时刷新全部"""
+        if not self._paths:
+            return
+        if rows is None:
+            self.dataChanged.emit(self.index(0), self.index(len(self._paths) - 1))
+            return
+        for row in sorted(set(rows)):
+            if 0 <= row < len(self._paths):
+                index = self.index(row)
+                self.dataChanged.emit(index, index)
@@ -0,0 +1,403 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 图像预读取：后台线程解码前后几张图片（以及对应的 XML），放入按内存大小限制的 LRU 缓存
+# 异步加载：在线程池中解码当前图片，先给出缩小的预览图，再给出原图；
+# 超大图片只解码总览图，原图由 tileRenderer 按瓦片从文件解码
+
+import os
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtGui import QImage, QImageReader
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, pyqtSignal
+except ImportError:
+    from PyQt4.QtGui import QImage, QImageReader
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, QSize, Qt, pyqtSignal
+
+from pascal_voc_io import PascalVocReader
+from tileRenderer import isTiledSize, readOverview
+
+
+def fileStamp(path):
+    """文件的 (修改时间, 大小)，文件不存在时返回 None"""
+    try:
+        st = os.stat(path)
+    except (OSError, TypeError, ValueError):
+        return None
+    return (getattr(st, 'st_mtime_ns', st.st_mtime), st.st_size)
+
+
+def imageBytes(image):
+    if image is None:
+        return 0
+    if hasattr(image, 'sizeInBytes'):
+        return image.sizeInBytes()
+    return image.byteCount()
+
+
+def imageShapeOf(image):
+    """已解码图片的 [高, 宽, 通道数]，与 PascalVocWriter 的 imgSize 相同"""
+    return [image.height(), image.width(), 1 if image.isGrayscale() else 3]
+
+
+_GRAYSCALE_FORMATS = tuple(getattr(QImage, name) for name in
+                           ('Format_Mono', 'Format_MonoLSB', 'Format_Grayscale8', 'Format_Grayscale16')
+                           if hasattr(QImage, name))
+
+
+def probeImageShape(path):
+    """只读文件头得到 [高, 宽, 通道数]，读不出尺寸时返回 None
+
+    灰度由文件头给出的像素格式判断；调色板图片按彩色计。
+    """
+    reader = QImageReader(path)
+    size = reader.size()
+    if not size.isValid():
+        return None
+    gray = reader.imageFormat() in _GRAYSCALE_FORMATS
+    return [size.height(), size.width(), 1 if gray else 3]
+
+
+class ImageShapeCache(object):
+    """按路径缓存图片的 [高, 宽, 通道数]，文件的 (修改时间, 大小) 变化后失效"""
+
+    def __init__(self, maxEntries=4096):
+        self.maxEntries = maxEntries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path, stamp):
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None or stamp is None or entry[0] != stamp:
+                return None
+            self._entries.move_to_end(path)
+            return list(entry[1])
+
+    def put(self, path, stamp, shape):
+        if stamp is None:
+            return
+        with self._lock:
+            self._entries[path] = (stamp, list(shape))
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.maxEntries:
+                self._entries.popitem(last=False)
+
+    def shapeFor(self, path, image=None):
+        """优先用缓存，其次用已解码的 image，最后只读文件头；都不行时返回 None"""
+        stamp = fileStamp(path)
+        shape = self.get(path, stamp)
+        if shape is not None:
+            return shape
+        if image is not None and not image.isNull():
+            shape = imageShapeOf(image)
+        else:
+            shape = probeImageShape(path)
+        if shape is not None:
+            self.put(path, stamp, shape)
+        return shape
+
+
+class CachedImage(object):
+    """一张图片的解码结果，xmlShapes 为 PascalVocReader.getShapes() 的结果
+
+    超大图片的 image 只是总览图，fullSize 为原图尺寸，data 为 None；普通图片的 fullSize 为 None。
+    """
+
+    def __init__(self, path, data, image, stamp, xmlPath=None, xmlStamp=None,
+                 xmlShapes=None, verified=False, fullSize=None):
+        self.path = path
+        self.data = data
+        self.image = image
+        self.stamp = stamp
+        self.fullSize = fullSize
+        self.xmlPath = xmlPath
+        self.xmlStamp = xmlStamp
+        self.xmlShapes = xmlShapes
+        self.verified = verified
+
+    def nbytes(self):
+        return len(self.data or b'') + imageBytes(self.image)
+
+    def xmlFor(self, xmlPath):
+        """XML 未变化时返回缓存的 (shapes, verified)，否则返回 None"""
+        if self.xmlShapes is None or xmlPath != self.xmlPath:
+            return None
+        if fileStamp(xmlPath) != self.xmlStamp:
+            return None
+        return self.xmlShapes, self.verified
+
+
+class ImageCache(object):
+    """按字节数限制的 LRU 缓存，可在工作线程中写入"""
+
+    def __init__(self, maxBytes=512 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, path):
+        return path in self._entries
+
+    def totalBytes(self):
+        return self._bytes
+
+    def get(self, path):
+        """命中且文件未被修改时返回 CachedImage，并标记为最近使用"""
+        with self._lock:
+            entry = self._entries.get(path)
+        if entry is None:
+            return None
+        if fileStamp(path) != entry.stamp:
+            self.remove(path)
+            return None
+        with self._lock:
+            if path in self._entries:
+                self._entries.move_to_end(path)
+        return entry
+
+    def put(self, entry):
+        size = entry.nbytes()
+        if size > self.maxBytes:
+            return False
+        with self._lock:
+            old = self._entries.pop(entry.path, None)
+            if old is not None:
+                self._bytes -= old.nbytes()
+            self._entries[entry.path] = entry
+            self._bytes += size
+            while self._bytes > self.maxBytes and len(self._entries) > 1:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= evicted.nbytes()
+        return True
+
+    def remove(self, path):
+        with self._lock:
+            entry = self._entries.pop(path, None)
+            if entry is not None:
+                self._bytes -= entry.nbytes()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+
+def decodeImage(path, xmlPath=None):
+    """读取并解码一张图片，同时解析对应的 XML；失败时返回 None
+
+    超大图片只按总览图尺寸解码，不读入文件内容。
+    """
+    stamp = fileStamp(path)
+    fullSize = QImageReader(path).size()
+    if isTiledSize(fullSize):
+        image = readOverview(path, fullSize)
+        if image.isNull():
+            return None
+        entry = CachedImage(path, None, image, stamp, fullSize=fullSize)
+        loadXml(entry, xmlPath)
+        return entry
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except (IOError, OSError):
+        return None
+    image = QImage.fromData(data)
+    if image.isNull():
+        return None
+    entry = CachedImage(path, data, image, stamp)
+    loadXml(entry, xmlPath)
+    return entry
+
+
+def loadXml(entry, xmlPath):
+    xmlStamp = fileStamp(xmlPath) if xmlPath else None
+    if xmlStamp is None:
+        return
+    try:
+        reader = PascalVocReader(xmlPath)
+    except Exception:
+        return
+    entry.xmlPath = xmlPath
+    entry.xmlStamp = xmlStamp
+    entry.xmlShapes = reader.getShapes()
+    entry.verified = reader.verified
+
+
+def withXml(entry, xmlPath):
+    """换上重新解析的 XML 的副本，图片数据共用；XML 读不出时返回 None
+
+    缓存中的 CachedImage 可能正被其他线程使用，不原地修改，由调用方用 ImageCache.put 整体替换。
+    """
+    fresh = CachedImage(entry.path, entry.data, entry.image, entry.stamp, fullSize=entry.fullSize)
+    loadXml(fresh, xmlPath)
+    return fresh if fresh.xmlShapes is not None else None
+
+
+class _PrefetchTask(QRunnable):
+
+    def __init__(self, prefetcher, path, xmlPath):
+        super(_PrefetchTask, self).__init__()
+        self.prefetcher = prefetcher
+        self.path = path
+        self.xmlPath = xmlPath
+
+    def run(self):
+        prefetcher = self.prefetcher
+        try:
+            # 已经不在预读范围内（用户跳到了别处）就不再解码
+            if not prefetcher.isWanted(self.path):
+                return
+            entry = prefetcher.cache.get(self.path)
+            if entry is None:
+                entry = decodeImage(self.path, self.xmlPath)
+            elif self.xmlPath and entry.xmlFor(self.xmlPath) is None:
+                # 图片已缓存，只补读变化了的 XML
+                entry = withXml(entry, self.xmlPath)
+            else:
+                return
+            if entry is not None and prefetcher.isWanted(self.path):
+                prefetcher.cache.put(entry)
+        finally:
+            prefetcher._taskDone(self.path)
+
+
+class ImagePrefetcher(QObject):
+    """在线程池中预读取图片到 ImageCache"""
+
+    def __init__(self, cache, maxThreads=2, parent=None):
+        super(ImagePrefetcher, self).__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(maxThreads)
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._pending = {}
+
+    def isWanted(self, path):
+        with self._lock:
+            return path in self._wanted
+
+    def prefetch(self, items):
+        """items 为按优先级排列的 (imagePath, xmlPath)；替换之前的预读请求"""
+        items = [(path, xmlPath) for path, xmlPath in items if path]
+        with self._lock:
+            self._wanted = set(path for path, _ in items)
+        # 是否已缓存、XML 是否变化都在工作线程中检查，GUI 线程不读文件
+        for path, xmlPath in items:
+            with self._lock:
+                if path in self._pending:
+                    continue
+                task = _PrefetchTask(self, path, xmlPath)
+                self._pending[path] = task
+            self.pool.start(task)
+
+    def _taskDone(self, path):
+        with self._lock:
+            self._pending.pop(path, None)
+
+    def cancel(self):
+        with self._lock:
+            self._wanted = set()
+
+    def shutdown(self, msecs=3000):
+        self.cancel()
+        self.pool.clear()
+        self.pool.waitForDone(msecs)
+
+
+class _LoadTask(QRunnable):
+
+    def __init__(self, loader, requestId, path, xmlPath, previewSize):
+        super(_LoadTask, self).__init__()
+        self.loader = loader
+        self.requestId = requestId
+        self.path = path
+        self.xmlPath = xmlPath
+        self.previewSize = previewSize
+
+    def run(self):
+        loader, requestId, path = self.loader, self.requestId, self.path
+        if not loader.isCurrent(requestId):
+            return
+        entry = loader.cache.get(path)
+        if entry is None:
+            self.emitPreview()
+            if not loader.isCurrent(requestId):
+                return
+            entry = decodeImage(path, self.xmlPath)
+            if entry is not None:
+                loader.cache.put(entry)
+        if not loader.isCurrent(requestId):
+            return
+        if entry is None:
+            loader.failed.emit(requestId, path)
+        else:
+            loader.loaded.emit(requestId, entry)
+
+    def emitPreview(self):
+        """大图先按显示区域大小解码一张预览图"""
+        if self.previewSize is None or self.previewSize.isEmpty():
+            return
+        reader = QImageReader(self.path)
+        fullSize = reader.size()
+        if not fullSize.isValid() or isTiledSize(fullSize) or \
+                fullSize.width() * fullSize.height() < self.loader.previewMinPixels:
+            # 超大图片加载得到的本来就是总览图，不再单独生成预览
+            return
+        scaled = fullSize.scaled(self.previewSize, Qt.KeepAspectRatio)
+        if scaled.width() >= fullSize.width():
+            return
+        reader.setScaledSize(scaled)
+        preview = reader.read()
+        if not preview.isNull() and self.loader.isCurrent(self.requestId):
+            self.loader.previewReady.emit(self.requestId, self.path, preview, fullSize)
+
+
+class ImageLoader(QObject):
+    """在工作线程中加载当前图片；新的请求会让旧请求作废
+
+    信号都在工作线程中发出，接收方所在的 GUI 线程通过排队连接处理。
+    """
+
+    previewReady = pyqtSignal(int, str, QImage, QSize)
+    loaded = pyqtSignal(int, object)
+    failed = pyqtSignal(int, str)
+
+    # 像素数小于这个值的图片直接解码原图，不再生成预览
+    previewMinPixels = 4000 * 3000
+
+    def __init__(self, cache, parent=None):
+        super(ImageLoader, self).__init__(parent)
+        self.cache = cache
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._lock = threading.Lock()
+        self._requestId = 0
+
+    def isCurrent(self, requestId):
+        with self._lock:
+            return requestId == self._requestId
+
+    def load(self, path, xmlPath=None, previewSize=None):
+        """开始加载 path，返回请求编号"""
+        with self._lock:
+            self._requestId += 1
+            requestId = self._requestId
+        self.pool.clear()
+        self.pool.start(_LoadTask(self, requestId, path, xmlPath, previewSize))
+        return requestId
+
+    def cancel(self):
+        with self._lock:
+            self._requestId += 1
+        self.pool.clear()
+
+    def shutdown(self, msecs=3000):
+        self.cancel()
+        self.pool.waitForDone(msecs)
@@ -1,17 +1,15 @@
 # Copyright (c) 2016 Tzutalin
 # Create by TzuTaLin <tzu.ta.lin@gmail.com>
 
-try:
-    from PyQt5.QtGui import QImage
-except ImportError:
-    from PyQt4.QtGui import QImage
-
 from base64 import b64encode, b64decode
 from pascal_voc_io import PascalVocWriter
 from pascal_voc_io import XML_EXT
+from boxGeometry import bounds, cornersToRbox
+from imageLoader import ImageShapeCache
+from annotationFingerprint import FingerprintStore
+import numpy as np
 import os.path
 import sys
-import math
 
 class LabelFileError(Exception):
     pass
@@ -21,6 +19,10 @@ class LabelFile(object):
     # It might be changed as window creates. By default, using XML ext
     # suffix = '.lif'
     suffix = XML_EXT
+    # 保存时需要的图片尺寸，所有 LabelFile 共用
+    imageShapes = ImageShapeCache()
+    # 已写出的 XML 的内容指纹，内容不变的保存跳过写入
+    fingerprints = FingerprintStore()
 
     def __init__(self, filename=None):
         self.shapes = ()
@@ -29,41 +31,40 @@ class LabelFile(object):
         self.verified = False
 
     def savePascalVocFormat(self, filename, shapes, imagePath, imageData,
-                            lineColor=None, fillColor=None, databaseSrc=None):
+                            lineColor=None, fillColor=None, databaseSrc=None, imageShape=None):
+        """imageShape 为 [高, 宽, 通道数]，不给出时从缓存或文件头得到，不解码图片
+
+        内容与已有文件相同时不写入，返回是否写入。
+        """
         imgFolderPath = os.path.dirname(imagePath)
         imgFolderName = os.path.split(imgFolderPath)[-1]
         imgFileName = os.path.basename(imagePath)
         imgFileNameWithoutExt = os.path.splitext(imgFileName)[0]
-        # Read from file path because self.imageData might be empty if saving to
-        # Pascal format
-        image = QImage()
-        image.load(imagePath)
-        imageShape = [image.height(), image.width(),
-                      1 if image.isGrayscale() else 3]
+        if imageShape is None:
+            # 读不出尺寸时与以前加载失败的结果相同
+            imageShape = self.imageShapes.shapeFor(imagePath) or [0, 0, 3]
         writer = PascalVocWriter(imgFolderName, imgFileNameWithoutExt,
                                  imageShape, localImgPath=imagePath)
         writer.verified = self.verified
 
-        for shape in shapes:
-            points = shape['points']
-            label = shape['label']
+        # 普通框和旋转框分别整批换算，writer 中两类框本来就是分开存放的
+        normalShapes = [shape for shape in shapes if not shape['isRotated']]
+        rotatedShapes = [shape for shape in shapes if shape['isRotated']]
+
+        bndboxes = LabelFile.convertShapes2BndBoxes(normalShapes)
+        for shape, bndbox in zip(normalShapes, bndboxes):
             # Add Chris
-            difficult = int(shape['difficult'])           
-            direction = shape['direction']
-            isRotated = shape['isRotated']
-            # if shape is normal box, save as bounding box 
-            # print('direction is %lf' % direction)
-            if not isRotated:
-                bndbox = LabelFile.convertPoints2BndBox(points)
-                writer.addBndBox(bndbox[0], bndbox[1], bndbox[2], 
-                    bndbox[3], label, difficult)
-            else: #if shape is rotated box, save as rotated bounding box
-                robndbox = LabelFile.convertPoints2RotatedBndBox(shape)
-                writer.addRotatedBndBox(robndbox[0],robndbox[1],
-                    robndbox[2],robndbox[3],robndbox[4],label,difficult)
-
-        writer.save(targetFile=filename)
-        return
+            difficult = int(shape['difficult'])
+            writer.addBndBox(bndbox[0], bndbox[1], bndbox[2],
+                bndbox[3], shape['label'], difficult)
+
+        robndboxes = LabelFile.convertShapes2RotatedBndBoxes(rotatedShapes)
+        for shape, robndbox in zip(rotatedShapes, robndboxes):
+            difficult = int(shape['difficult'])
+            writer.addRotatedBndBox(robndbox[0],robndbox[1],
+                robndbox[2],robndbox[3],robndbox[4],shape['label'],difficult)
+
+        return writer.save(targetFile=filename, fingerprints=self.fingerprints)
 
     def toggleVerify(self):
         self.verified = not self.verified
@@ -98,28 +99,41 @@ class LabelFile(object):
 
         return (int(xmin), int(ymin), int(xmax), int(ymax))
 
+    @staticmethod
+    def convertShapes2BndBoxes(shapes):
+        """convertPoints2BndBox 的批量版本"""
+        if not shapes:
+            return []
+        if any(len(shape['points']) != 4 for shape in shapes):
+            return [LabelFile.convertPoints2BndBox(shape['points']) for shape in shapes]
+        rects = bounds([shape['points'] for shape in shapes])
+        # 与 convertPoints2BndBox 相同，最小坐标不小于 1
+        rects[:, :2] = np.maximum(rects[:, :2], 1)
+        return [tuple(rect) for rect in rects.astype(np.int64).tolist()]
+
     # You Hao, 2017/06/121
     @staticmethod
     def convertPoints2RotatedBndBox(shape):
-        points = shape['points']
-        center = shape['center']
-        direction = shape['direction']
+        return LabelFile.convertShapes2RotatedBndBoxes([shape])[0]
 
-        # 如果center为None，计算中心点
+    @staticmethod
+    def convertShapes2RotatedBndBoxes(shapes):
+        """一次换算一批旋转框，返回 (cx, cy, w, h, angle) 列表"""
+        if not shapes:
+            return []
+        corners = np.array([shape['points'] for shape in shapes], dtype=np.float64)
+        # center 为 None 时使用四个顶点的中心
+        centers = np.array([LabelFile._centerXY(shape['center']) for shape in shapes],
+                           dtype=np.float64)
+        directions = [shape['direction'] for shape in shapes]
+        rboxes = cornersToRbox(corners, centers, directions)
+        return [(round(cx,4),round(cy,4),round(w,4),round(h,4),round(angle,6))
+                for cx, cy, w, h, angle in rboxes.tolist()]
+
+    @staticmethod
+    def _centerXY(center):
         if center is None:
-            # 计算四个点的中心
-            cx = sum(p[0] for p in points) / len(points)
-            cy = sum(p[1] for p in points) / len(points)
-        else:
-            cx = center.x()
-            cy = center.y()
-        
-        w = math.sqrt((points[0][0]-points[1][0]) ** 2 +
-            (points[0][1]-points[1][1]) ** 2)
-
-        h = math.sqrt((points[2][0]-points[1][0]) ** 2 +
-            (points[2][1]-points[1][1]) ** 2)
-
-        angle = direction % math.pi
-
-        return (round(cx,4),round(cy,4),round(w,4),round(h,4),round(angle,6))
+            return (float('nan'), float('nan'))
+        if hasattr(center, 'x'):
+            return (center.x(), center.y())
+        return tuple(center)
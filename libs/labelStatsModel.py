@@ -0,0 +1,113 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 标签分类统计模型：每个类别一行，数量变化时原地更新对应的行，不再为每个类别创建控件
+
+try:
+    from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+except ImportError:
+    from PyQt4.QtCore import Qt, QAbstractTableModel, QModelIndex, QTimer
+
+
+class LabelStatsModel(QAbstractTableModel):
+    """按标签名排序的 (标签, 当前图像数量, 数据集数量) 表格
+
+    setCounts / setDatasetCounts 只记录新的数量，同一轮事件循环内的多次调用
+    合并为一次刷新：已有的行发出 dataChanged，新出现或消失的类别插入、删除对应行。
+    """
+
+    HEADERS = (u"标签", u"当前图像", u"数据集")
+
+    def __init__(self, parent=None):
+        super(LabelStatsModel, self).__init__(parent)
+        self._labels = []
+        self._current = {}
+        self._dataset = {}
+        self._shown = {}
+        self._pending = None
+        self._scheduled = False
+
+    def setCounts(self, counts):
+        """当前图像的 {标签: 数量}"""
+        self._pendingCounts()[0] = dict(counts)
+        self._schedule()
+
+    def setDatasetCounts(self, counts):
+        """整个数据集的 {标签: 数量}"""
+        self._pendingCounts()[1] = dict(counts)
+        self._schedule()
+
+    def _pendingCounts(self):
+        if self._pending is None:
+            self._pending = [self._current, self._dataset]
+        return self._pending
+
+    def _schedule(self):
+        if not self._scheduled:
+            self._scheduled = True
+            QTimer.singleShot(0, self.flush)
+
+    def flush(self):
+        """立即应用尚未显示的数量变化"""
+        self._scheduled = False
+        if self._pending is None:
+            return
+        self._current, self._dataset = self._pending
+        self._pending = None
+        wanted = set(self._current)
+        wanted.update(self._dataset)
+
+        # 先删除消失的类别，再按排序位置插入新类别
+        for row in range(len(self._labels) - 1, -1, -1):
+            if self._labels[row] not in wanted:
+                self.beginRemoveRows(QModelIndex(), row, row)
+                self._shown.pop(self._labels.pop(row), None)
+                self.endRemoveRows()
+        existing = set(self._labels)
+        row = 0
+        for label in sorted(wanted):
+            if label not in existing:
+                self.beginInsertRows(QModelIndex(), row, row)
+                self._labels.insert(row, label)
+                self._shown[label] = self._values(label)
+                self.endInsertRows()
+            row += 1
+
+        for row, label in enumerate(self._labels):
+            values = self._values(label)
+            if self._shown.get(label) != values:
+                self._shown[label] = values
+                self.dataChanged.emit(self.index(row, 1), self.index(row, 2))
+
+    def _values(self, label):
+        return self._current.get(label, 0), self._dataset.get(label, 0)
+
+    def labels(self):
+        return list(self._labels)
+
+    def rowCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self._labels)
+
+    def columnCount(self, parent=QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid() or not 0 <= index.row() < len(self._labels):
+            return None
+        label = self._labels[index.row()]
+        column = index.column()
+        if role == Qt.DisplayRole:
+            if column == 0:
+                return label
+            return self._shown[label][column - 1]
+        if role == Qt.TextAlignmentRole and column > 0:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        return None
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role == Qt.DisplayRole and orientation == Qt.Horizontal and 0 <= section < len(self.HEADERS):
+            return self.HEADERS[section]
+        return None
@@ -30,11 +30,55 @@ except ImportError:
         except ImportError:
           print("Failed to import ElementTree from any known place")
 
-import codecs
-import math
+import os
+import re
+import shutil
+import threading
+from boxGeometry import rboxToCorners
 
 XML_EXT = '.xml'
 
+# XML 1.0 不允许的字符，lxml 重新解析时会拒绝
+_INVALID_XML_CHARS = re.compile(u'[\x00-\x08\x0b\x0c\x0e-\x1f\ud800-\udfff\ufffe\uffff]')
+
+
+def xmlText(value):
+    """元素文本转义，结果与 ElementTree 写出再经 lxml 解析、输出后的文本相同"""
+    text = value if isinstance(value, str) else str(value)
+    if '\r' in text:
+        # XML 解析器会把换行统一成 \n
+        text = text.replace('\r\n', '\n').replace('\r', '\n')
+    if _INVALID_XML_CHARS.search(text):
+        raise ValueError('invalid XML character in %r' % text)
+    if '&' in text:
+        text = text.replace('&', '&amp;')
+    if '<' in text:
+        text = text.replace('<', '&lt;')
+    if '>' in text:
+        text = text.replace('>', '&gt;')
+    return text
+
+def writeFileAtomic(path, data):
+    """先写同目录下的临时文件并落盘，再改名替换，读者只会看到完整的旧文件或新文件"""
+    dirName, baseName = os.path.split(os.path.abspath(path))
+    tmpPath = os.path.join(dirName, '.%s.%d.%d.tmp' % (baseName, os.getpid(), threading.get_ident()))
+    try:
+        with open(tmpPath, 'wb') as out_file:
+            out_file.write(data)
+            out_file.flush()
+            os.fsync(out_file.fileno())
+        if os.path.exists(path):
+            # 保留原文件的权限
+            shutil.copymode(path, tmpPath)
+        os.replace(tmpPath, path)
+    except BaseException:
+        try:
+            os.remove(tmpPath)
+        except OSError:
+            pass
+        raise
+
+
 class PascalVocWriter:
 
     def __init__(self, foldername, filename, imgSize,databaseSrc='Unknown', localImgPath=None):
@@ -114,6 +158,14 @@ class PascalVocWriter:
         robndbox['difficult'] = difficult
         self.roboxlist.append(robndbox)
 
+    def truncated(self, each_object):
+        if int(each_object['ymax']) == int(self.imgSize[0]) or (int(each_object['ymin'])== 1):
+            return "1" # max == height or min
+        elif (int(each_object['xmax'])==int(self.imgSize[1])) or (int(each_object['xmin'])== 1):
+            return "1" # max == width or min
+        else:
+            return "0"
+
     def appendObjects(self, top):
         for each_object in self.boxlist:
             object_item = SubElement(top, 'object')
@@ -128,12 +180,7 @@ class PascalVocWriter:
             pose = SubElement(object_item, 'pose')
             pose.text = "Unspecified"
             truncated = SubElement(object_item, 'truncated')
-            if int(each_object['ymax']) == int(self.imgSize[0]) or (int(each_object['ymin'])== 1):
-                truncated.text = "1" # max == height or min
-            elif (int(each_object['xmax'])==int(self.imgSize[1])) or (int(each_object['xmin'])== 1):
-                truncated.text = "1" # max == width or min
-            else:
-                truncated.text = "0"
+            truncated.text = self.truncated(each_object)
             difficult = SubElement(object_item, 'difficult')
             difficult.text = str( bool(each_object['difficult']) & 1 )            
             bndbox = SubElement(object_item, 'bndbox')
@@ -181,106 +228,219 @@ class PascalVocWriter:
             angle = SubElement(robndbox, 'angle')
             angle.text = str(each_object['angle'])
 
-    def save(self, targetFile=None):
-        root = self.genXML()
-        self.appendObjects(root)
-        out_file = None
-        if targetFile is None:
-            out_file = codecs.open(
-                self.filename + XML_EXT, 'w', encoding='utf-8')
-        else:
-            out_file = codecs.open(targetFile, 'w', encoding='utf-8')
+    _BNDBOX_TEMPLATE = ('    <pose>Unspecified</pose>\n    <truncated>%s</truncated>\n'
+                        '    <difficult>%d</difficult>\n    <bndbox>\n'
+                        '      <xmin>%s</xmin>\n      <ymin>%s</ymin>\n'
+                        '      <xmax>%s</xmax>\n      <ymax>%s</ymax>\n'
+                        '    </bndbox>\n  </object>\n')
+    _ROBNDBOX_TEMPLATE = ('    <pose>Unspecified</pose>\n    <truncated>0</truncated>\n'
+                          '    <difficult>%d</difficult>\n    <robndbox>\n'
+                          '      <cx>%s</cx>\n      <cy>%s</cy>\n'
+                          '      <w>%s</w>\n      <h>%s</h>\n'
+                          '      <angle>%s</angle>\n'
+                          '    </robndbox>\n  </object>\n')
+
+    def toXML(self):
+        """一次写出带缩进的 XML，返回 bytes
+
+        输出与 genXML + appendObjects 再经 prettify 的结果逐字节相同：
+        两个空格缩进，空文本写成 <tag/>，非 ASCII 字符写成 &#NNNN;。
+        """
+        if self.filename is None or \
+                self.foldername is None or \
+                self.imgSize is None:
+            return None
+        parts = []
+        add = parts.append
 
-        prettifyResult = self.prettify(root)
-        out_file.write(prettifyResult.decode('utf8'))
-        out_file.close()
+        def element(indent, tag, value):
+            if value is None or value == '':
+                add('%s<%s/>\n' % (indent, tag))
+            else:
+                add('%s<%s>%s</%s>\n' % (indent, tag, xmlText(value), tag))
+
+        add('<annotation verified="%s">\n' % ('yes' if self.verified else 'no'))
+        element('  ', 'folder', self.foldername)
+        element('  ', 'filename', self.filename)
+        element('  ', 'path', self.localImgPath)
+        add('  <source>\n')
+        element('    ', 'database', self.databaseSrc)
+        add('  </source>\n  <size>\n')
+        element('    ', 'width', str(self.imgSize[1]))
+        element('    ', 'height', str(self.imgSize[0]))
+        element('    ', 'depth', str(self.imgSize[2]) if len(self.imgSize) == 3 else '1')
+        add('  </size>\n  <segmented>0</segmented>\n')
+
+        # 坐标是数字，str() 的结果不需要转义，整个对象用一个模板写出；标签名重复很多，转义结果按名字缓存
+        nameLines = {}
+
+        def nameLine(name):
+            line = nameLines.get(name)
+            if line is None:
+                line = nameLines[name] = ('    <name/>\n' if name is None or name == ''
+                                          else '    <name>%s</name>\n' % xmlText(name))
+            return line
+
+        for each_object in self.boxlist:
+            add('  <object>\n    <type>bndbox</type>\n')
+            add(nameLine(each_object['name']))
+            add(self._BNDBOX_TEMPLATE % (self.truncated(each_object),
+                                         bool(each_object['difficult']) & 1,
+                                         each_object['xmin'], each_object['ymin'],
+                                         each_object['xmax'], each_object['ymax']))
+
+        for each_object in self.roboxlist:
+            add('  <object>\n    <type>robndbox</type>\n')
+            add(nameLine(each_object['name']))
+            add(self._ROBNDBOX_TEMPLATE % (bool(each_object['difficult']) & 1,
+                                           each_object['cx'], each_object['cy'],
+                                           each_object['w'], each_object['h'],
+                                           each_object['angle']))
+
+        add('</annotation>\n')
+        return ''.join(parts).encode('ascii', 'xmlcharrefreplace')
+
+    def save(self, targetFile=None, fingerprints=None):
+        """fingerprints 为 annotationFingerprint.FingerprintStore 时内容不变则不写，返回是否写入"""
+        data = self.toXML()
+        if targetFile is None:
+            targetFile = self.filename + XML_EXT
+        if fingerprints is not None:
+            return fingerprints.writeIfChanged(targetFile, data)
+        writeFileAtomic(targetFile, data)
+        return True
 
 
 class PascalVocReader:
 
-    def __init__(self, filepath):
+    def __init__(self, filepath, lazy=False):
         # shapes type:
         # [labbel, [(x1,y1), (x2,y2), (x3,y3), (x4,y4)], color, color, difficult]
+        # lazy=True 时不在这里解析，由调用方用 iterShapes() 逐批读取
         self.shapes = []
         self.filepath = filepath
         self.verified = False
-        self.parseXML()
+        if not lazy:
+            self.parseXML()
 
     def getShapes(self):
         return self.shapes
 
-    def addShape(self, label, bndbox, difficult):
+    @staticmethod
+    def parseBox(bndbox):
         xmin = int(bndbox.find('xmin').text)
         ymin = int(bndbox.find('ymin').text)
         xmax = int(bndbox.find('xmax').text)
         ymax = int(bndbox.find('ymax').text)
-        points = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
-        self.shapes.append((label, points, 0, False, None, None, difficult))
+        return [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+
+    def addShape(self, label, bndbox, difficult):
+        self.shapes.append((label, self.parseBox(bndbox), 0, False, None, None, difficult))
 
     # You Hao 2017/06/21
     # add to analysis robndbox load from xml
     def addRotatedShape(self, label, robndbox, difficult):
-        cx = float(robndbox.find('cx').text)
-        cy = float(robndbox.find('cy').text)
-        w = float(robndbox.find('w').text)
-        h = float(robndbox.find('h').text)
-        angle = float(robndbox.find('angle').text)
-
-        p0x,p0y = self.rotatePoint(cx,cy, cx - w/2, cy - h/2, -angle)
-        p1x,p1y = self.rotatePoint(cx,cy, cx + w/2, cy - h/2, -angle)
-        p2x,p2y = self.rotatePoint(cx,cy, cx + w/2, cy + h/2, -angle)
-        p3x,p3y = self.rotatePoint(cx,cy, cx - w/2, cy + h/2, -angle)
-
-        points = [(p0x, p0y), (p1x, p1y), (p2x, p2y), (p3x, p3y)]
-        self.shapes.append((label, points, angle, True, None, None, difficult))
-
-    def rotatePoint(self, xc,yc, xp,yp, theta):        
-        xoff = xp-xc;
-        yoff = yp-yc;
-
-        cosTheta = math.cos(theta)
-        sinTheta = math.sin(theta)
-        pResx = cosTheta * xoff + sinTheta * yoff
-        pResy = - sinTheta * xoff + cosTheta * yoff
-        # pRes = (xc + pResx, yc + pResy)
-        return xc+pResx,yc+pResy
+        rbox = self.parseRotatedBox(robndbox)
+        points = [tuple(p) for p in rboxToCorners([rbox])[0].tolist()]
+        self.shapes.append((label, points, rbox[4], True, None, None, difficult))
+
+    @staticmethod
+    def parseRotatedBox(robndbox):
+        return tuple(float(robndbox.find(tag).text)
+                     for tag in ('cx', 'cy', 'w', 'h', 'angle'))
+
+    @staticmethod
+    def fillRotatedShapes(shapes, rotated):
+        """rotated 为 (index, label, rbox, difficult) 列表，整批换算顶点后放回 shapes 的原位置"""
+        if not rotated:
+            return
+        corners = rboxToCorners([rbox for _, _, rbox, _ in rotated]).tolist()
+        for (index, label, rbox, difficult), points in zip(rotated, corners):
+            points = [tuple(p) for p in points]
+            shapes[index] = (label, points, rbox[4], True, None, None, difficult)
+
+    def addRotatedShapes(self, rotated):
+        self.fillRotatedShapes(self.shapes, rotated)
+
+    def _iterElements(self):
+        """逐个产生根元素 annotation 的开始事件和它的直接子元素 object 的结束事件，处理过的元素随即释放
+
+        与原来的 findall('object') 一样只取根元素下的 object；根元素不是 annotation 时不产生任何事件。
+        """
+        lxml = hasattr(etree, 'LXML_VERSION')
+        if lxml:
+            context = etree.iterparse(self.filepath, events=('start', 'end'),
+                                      tag=('annotation', 'object'), encoding='utf-8')
+        else:
+            context = ElementTree.iterparse(self.filepath, events=('start', 'end'))
+        root = None
+        depth = 0
+        for event, elem in context:
+            if event == 'start':
+                depth += 1
+                if root is None:
+                    if elem.tag != 'annotation' or (lxml and elem.getparent() is not None):
+                        return
+                    root = elem
+                    yield event, elem
+                continue
+            depth -= 1
+            if elem.tag != 'object' or not (elem.getparent() is root if lxml else depth == 1):
+                continue
+            yield event, elem
+            elem.clear()
+            if lxml:
+                while elem.getprevious() is not None:
+                    del root[0]
+            else:
+                # ElementTree 没有 getprevious，object 结束时根元素下的子元素都已处理完
+                del root[:]
 
-    def parseXML(self):
+    def iterShapes(self, batchSize=500):
+        """流式解析，每读完 batchSize 个对象产生一批 shapes，格式与 getShapes() 相同
+
+        整个文件不会一次载入内存，对象数很多时调用方可以边读边显示。
+        """
         assert self.filepath.endswith(XML_EXT), "Unsupport file format"
-        parser = etree.XMLParser(encoding='utf-8')
-        xmltree = ElementTree.parse(self.filepath, parser=parser).getroot()
-        filename = xmltree.find('filename').text
-        try:
-            verified = xmltree.attrib['verified']
-            if verified == 'yes':
-                self.verified = True
-        except KeyError:
-            self.verified = False
-
-        for object_iter in xmltree.findall('object'):
-            typeItem = object_iter.find('type')
-
-            # print(typeItem.text)
-            if typeItem.text == 'bndbox':
-                bndbox = object_iter.find("bndbox")
-                label = object_iter.find('name').text
-                # Add chris
-                difficult = False
-                if object_iter.find('difficult') is not None:
-                    difficult = bool(int(object_iter.find('difficult').text))
-                self.addShape(label, bndbox, difficult)
-
-            # You Hao 2017/06/21
-            # add to load robndbox
-            elif typeItem.text == 'robndbox':
-                robndbox = object_iter.find('robndbox')
-                label = object_iter.find('name').text
-                difficult = False
-                if object_iter.find('difficult') is not None:
-                    difficult = bool(int(object_iter.find('difficult').text))
-                self.addRotatedShape(label, robndbox, difficult)
-            
-            else: 
-                pass
+        batch = []
+        rotated = []
+        for event, elem in self._iterElements():
+            if event == 'start':
+                self.verified = elem.get('verified') == 'yes'
+                continue
+            # 每个对象只遍历一次子元素，不再逐个 find
+            fields = dict((child.tag, child) for child in elem)
+            typeItem = fields.get('type')
+            boxType = typeItem.text if typeItem is not None else None
+            if boxType not in ('bndbox', 'robndbox') or boxType not in fields:
+                continue
+            label = fields['name'].text
+            # Add chris
+            difficult = False
+            if 'difficult' in fields:
+                difficult = bool(int(fields['difficult'].text))
+            values = dict((child.tag, child.text) for child in fields[boxType])
+            if boxType == 'bndbox':
+                xmin, ymin = int(values['xmin']), int(values['ymin'])
+                xmax, ymax = int(values['xmax']), int(values['ymax'])
+                points = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+                batch.append((label, points, 0, False, None, None, difficult))
+            else:
+                # You Hao 2017/06/21
+                # 先占位，整批换算顶点，保持原有的对象顺序
+                rbox = (float(values['cx']), float(values['cy']), float(values['w']),
+                        float(values['h']), float(values['angle']))
+                rotated.append((len(batch), label, rbox, difficult))
+                batch.append(None)
+            if len(batch) >= batchSize:
+                self.fillRotatedShapes(batch, rotated)
+                yield batch
+                batch, rotated = [], []
+        if batch:
+            self.fillRotatedShapes(batch, rotated)
+            yield batch
 
+    def parseXML(self):
+        for batch in self.iterShapes():
+            self.shapes.extend(batch)
         return True
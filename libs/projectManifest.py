@@ -0,0 +1,350 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 项目清单：在图片目录中保存一个 SQLite 数据库，记录图片列表、目录清单、标注状态、
+# 图片尺寸、每张图片的标签统计和 XML 的内容指纹，重新打开项目时直接读出，再在后台按修改时间校验；
+# 界面上产生的写入交给后台写线程合并提交，翻页、保存不等待磁盘
+
+import json
+import os
+import sqlite3
+import threading
+
+MANIFEST_NAME = '.roLabelImg.db'
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS dirs (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    files TEXT,
+    subdirs TEXT
+);
+CREATE TABLE IF NOT EXISTS images (
+    path TEXT PRIMARY KEY,
+    row INTEGER,
+    annotated INTEGER DEFAULT 0,
+    mtime INTEGER,
+    size INTEGER,
+    width INTEGER,
+    height INTEGER,
+    xmlMtime INTEGER,
+    xmlSize INTEGER,
+    boxes INTEGER,
+    rotated INTEGER,
+    labels TEXT,
+    sizeHist TEXT,
+    angleHist TEXT
+);
+CREATE INDEX IF NOT EXISTS images_row ON images (row);
+CREATE TABLE IF NOT EXISTS fingerprints (
+    path TEXT PRIMARY KEY,
+    mtime INTEGER,
+    size INTEGER,
+    digest TEXT
+);
+'''
+
+
+def _dirStamp(dirPath):
+    try:
+        return os.stat(dirPath).st_mtime_ns
+    except OSError:
+        return None
+
+
+class ProjectManifest(object):
+    """一个图片目录的清单数据库
+
+    每个线程使用自己的连接：GUI 线程用 self.conn 读，工作线程调用 connect() 另开连接。
+    GUI 线程的写入（setAnnotated、setImageInfo 等）只是排队，由后台写线程每 batchDelay 秒
+    合并成一个事务提交；flush() 等待排队的写入完成，close() 时自动 flush。
+    清单放在图片目录中，常位于多人共用的网络盘上，SQLite 的 WAL 依赖共享内存加锁，在网络文件系统上
+    不可靠，因此固定使用默认的回滚日志；合并提交也减少了日志文件的创建和删除。
+    回滚日志的创建和删除会改变所在目录的修改时间，onCommit 不为空时写线程每次提交后调用
+    onCommit(目录, 提交前目录修改时间, 提交后目录修改时间)，供目录监视区分自己的写入。
+    数据库不可用（目录只读、网络盘加锁失败等）时各方法静默返回空结果。
+    """
+
+    SCHEMA_VERSION = '3'
+    batchDelay = 0.5
+    onCommit = None
+
+    def __init__(self, root, path=None):
+        self.root = root
+        self.path = path or os.path.join(root, MANIFEST_NAME)
+        self._conn = None
+        self._cond = threading.Condition()
+        self._writes = []
+        self._writing = False
+        self._closing = False
+        self._writer = None
+
+    @classmethod
+    def open(cls, root):
+        """打开或创建 root 下的清单，无法创建时返回 None"""
+        if not root or not os.path.isdir(root):
+            return None
+        manifest = cls(root)
+        try:
+            manifest.conn
+        except (sqlite3.Error, OSError):
+            return None
+        return manifest
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5)
+        # WAL 模式会记在数据库文件中，旧版本建立的清单在这里改回回滚日志
+        conn.execute('PRAGMA journal_mode=DELETE')
+        conn.executescript(_SCHEMA)
+        row = conn.execute("SELECT value FROM meta WHERE key='version'").fetchone()
+        if row is None or row[0] != self.SCHEMA_VERSION:
+            # 清单只是缓存，格式变化时直接重建
+            conn.executescript('DROP TABLE IF EXISTS dirs; DROP TABLE IF EXISTS images; '
+                               'DROP TABLE IF EXISTS fingerprints;' + _SCHEMA)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('version', ?)",
+                             (self.SCHEMA_VERSION,))
+        return conn
+
+    @property
+    def conn(self):
+        if self._conn is None:
+            self._conn = self.connect()
+        return self._conn
+
+    def close(self):
+        with self._cond:
+            self._closing = True
+            self._cond.notify_all()
+            writer = self._writer
+        if writer is not None:
+            writer.join()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+    # 后台写线程
+
+    def _queue(self, statements):
+        """statements 为 [(sql, 参数行列表), ...]，在同一个事务中执行"""
+        with self._cond:
+            if self._closing:
+                return
+            self._writes.append(statements)
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._writeLoop, name='manifest-writer')
+                self._writer.daemon = True
+                self._writer.start()
+            self._cond.notify_all()
+
+    def _writeLoop(self):
+        conn = None
+        while True:
+            with self._cond:
+                while not self._writes and not self._closing:
+                    self._cond.wait()
+                if not self._writes:
+                    break
+                if not self._closing:
+                    # 稍等片刻，把连续翻页、保存产生的写入合并到一个事务
+                    self._cond.wait(self.batchDelay)
+                batch, self._writes = self._writes, []
+                self._writing = True
+            try:
+                if conn is None:
+                    conn = self.connect()
+                dirPath = os.path.dirname(self.path)
+                before = _dirStamp(dirPath)
+                with conn:
+                    for statements in batch:
+                        for sql, rows in statements:
+                            conn.executemany(sql, rows)
+                if self.onCommit is not None:
+                    self.onCommit(dirPath, before, _dirStamp(dirPath))
+            except sqlite3.Error:
+                pass
+            finally:
+                with self._cond:
+                    self._writing = False
+                    self._cond.notify_all()
+        if conn is not None:
+            conn.close()
+
+    def flush(self, timeout=None):
+        """等待排队的写入提交，超时返回 False"""
+        with self._cond:
+            return self._cond.wait_for(lambda: not self._writes and not self._writing, timeout)
+
+    # 目录清单，格式与 dirScanner.scanImages 的 manifest 相同，在扫描线程中读写
+
+    def loadDirs(self):
+        try:
+            conn = self.connect()
+            try:
+                return dict((path, [mtime, json.loads(files), json.loads(subdirs)])
+                            for path, mtime, files, subdirs in
+                            conn.execute('SELECT path, mtime, files, subdirs FROM dirs'))
+            finally:
+                conn.close()
+        except (sqlite3.Error, ValueError):
+            return {}
+
+    def saveDirs(self, dirs):
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.execute('DELETE FROM dirs')
+                    conn.executemany('INSERT INTO dirs VALUES (?, ?, ?, ?)',
+                                     ((path, e[0], json.dumps(e[1]), json.dumps(e[2]))
+                                      for path, e in dirs.items()))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    # 图片列表和标注状态
+
+    def images(self):
+        """按顺序返回 (图片路径列表, 是否已标注的 bytearray)"""
+        try:
+            rows = self.conn.execute('SELECT path, annotated FROM images ORDER BY row').fetchall()
+        except sqlite3.Error:
+            return [], bytearray()
+        return [r[0] for r in rows], bytearray(1 if r[1] else 0 for r in rows)
+
+    def saveImages(self, paths, annotated):
+        """保存新的图片列表，已有图片的尺寸和标签统计保留"""
+        self._queue([
+            ('UPDATE images SET row = -1', [()]),
+            ('INSERT INTO images (path, row, annotated) VALUES (?, ?, ?) '
+             'ON CONFLICT(path) DO UPDATE SET row = excluded.row, annotated = excluded.annotated',
+             [(p, i, 1 if annotated[i] else 0) for i, p in enumerate(paths)]),
+            ('DELETE FROM images WHERE row = -1', [()])])
+
+    def setAnnotated(self, items):
+        """items 为 [(图片路径, 是否已标注), ...]"""
+        self._queue([('UPDATE images SET annotated = ? WHERE path = ?',
+                      [(1 if annotated else 0, path) for path, annotated in items])])
+
+    # 图片尺寸，按图片文件的 (修改时间, 大小) 校验
+
+    def setImageInfo(self, path, stamp, width, height):
+        if stamp is None:
+            return
+        self._queue([('UPDATE images SET mtime = ?, size = ?, width = ?, height = ? WHERE path = ?',
+                      [(stamp[0], stamp[1], width, height, path)])])
+
+    def imageInfo(self, path, stamp):
+        """文件未变化时返回 (宽, 高)，否则返回 None"""
+        try:
+            row = self.conn.execute('SELECT mtime, size, width, height FROM images WHERE path = ?',
+                                    (path,)).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None or row[2] is None or stamp is None or (row[0], row[1]) != tuple(stamp):
+            return None
+        return row[2], row[3]
+
+    # 每张图片的标签统计摘要，一行为 (XML 修改时间, 大小, 框数, 旋转框数, 标签, 尺寸直方图, 角度直方图)，
+    # 由 datasetStats.LabelSummary 生成和解释
+
+    _STATS_COLUMNS = 'xmlMtime, xmlSize, boxes, rotated, labels, sizeHist, angleHist'
+
+    def setLabelStats(self, path, row):
+        self._queue([('UPDATE images SET xmlMtime = ?, xmlSize = ?, boxes = ?, rotated = ?, labels = ?, '
+                      'sizeHist = ?, angleHist = ? WHERE path = ?', [tuple(row) + (path,)])])
+
+    def labelStatsFor(self, path):
+        """单张图片保存的统计行，没有时返回 None"""
+        try:
+            return self.conn.execute(
+                'SELECT %s FROM images WHERE path = ? AND labels IS NOT NULL' % self._STATS_COLUMNS,
+                (path,)).fetchone()
+        except sqlite3.Error:
+            return None
+
+    def loadLabelStats(self, paths=None):
+        """在工作线程中读出 {图片路径: 统计行}，paths 为空时读出全部"""
+        query = 'SELECT path, %s FROM images WHERE labels IS NOT NULL' % self._STATS_COLUMNS
+        stats = {}
+        try:
+            conn = self.connect()
+            try:
+                if paths is None:
+                    rows = conn.execute(query).fetchall()
+                else:
+                    rows = []
+                    for start in range(0, len(paths), 500):
+                        chunk = paths[start:start + 500]
+                        rows.extend(conn.execute(
+                            query + ' AND path IN (%s)' % ','.join('?' * len(chunk)), chunk))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            return stats
+        for row in rows:
+            stats[row[0]] = row[1:]
+        return stats
+
+    def saveLabelStats(self, items):
+        """在工作线程中写入 [(图片路径, 统计行), ...]"""
+        try:
+            conn = self.connect()
+            try:
+                with conn:
+                    conn.executemany(
+                        'UPDATE images SET xmlMtime = ?, xmlSize = ?, boxes = ?, rotated = ?, '
+                        'labels = ?, sizeHist = ?, angleHist = ? WHERE path = ?',
+                        (tuple(row) + (path,) for path, row in items))
+            finally:
+                conn.close()
+        except sqlite3.Error:
+            pass
+
+    # XML 的内容指纹，按 XML 路径保存 ((修改时间, 大小), 指纹)，格式与 annotationFingerprint.FingerprintStore 相同，
+    # 增量导出时与上次导出记下的指纹比较即可知道哪些文件变了
+
+    def setFingerprint(self, path, stamp, digest):
+        if stamp is None:
+            return
+        self._queue([('INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?, ?)',
+                      [(path, stamp[0], stamp[1], digest)])])
+
+    def fingerprints(self):
+        """{XML 路径: ((修改时间, 大小), 指纹)}"""
+        try:
+            rows = self.conn.execute('SELECT path, mtime, size, digest FROM fingerprints').fetchall()
+        except sqlite3.Error:
+            return {}
+        return dict((path, ((mtime, size), digest)) for path, mtime, size, digest in rows)
+
+
+class ManifestStore(object):
+    """DirScanner 的目录清单存储：放进扫描根目录的项目清单，目录不可写时交给 fallback"""
+
+    def __init__(self, fallback=None):
+        self.fallback = fallback
+
+    def load(self, root):
+        manifest = ProjectManifest.open(root)
+        if manifest is None:
+            return self.fallback.load(root) if self.fallback is not None else {}
+        try:
+            return manifest.loadDirs()
+        finally:
+            manifest.close()
+
+    def save(self, root, dirs):
+        manifest = ProjectManifest.open(root)
+        if manifest is None:
+            if self.fallback is not None:
+                self.fallback.save(root, dirs)
+            return
+        try:
+            manifest.saveDirs(dirs)
+        finally:
+            manifest.close()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 后台保存队列：界面线程只交出标注的快照，写文件在工作线程中进行；
+# 同一文件还没写出的旧快照被新快照替换，写完或失败都通过信号通知界面
+
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+except ImportError:
+    from PyQt4.QtCore import QObject, QRunnable, QThreadPool, pyqtSignal
+
+from labelFile import LabelFile
+
+
+class SaveJob(object):
+    """一次保存的快照，只含 Python 基本类型，之后界面上的修改不会影响它
+
+    shapes 为 LabelFile.savePascalVocFormat 接受的 dict 列表，imageShape 为 [高, 宽, 通道数]。
+    """
+
+    __slots__ = ('xmlPath', 'imagePath', 'shapes', 'imageShape', 'verified', 'lineColor', 'fillColor')
+
+    def __init__(self, xmlPath, imagePath, shapes, imageShape, verified=False,
+                 lineColor=None, fillColor=None):
+        self.xmlPath = xmlPath
+        self.imagePath = imagePath
+        self.shapes = tuple(shapes)
+        self.imageShape = list(imageShape) if imageShape is not None else None
+        self.verified = verified
+        self.lineColor = lineColor
+        self.fillColor = fillColor
+
+
+def writeSaveJob(job):
+    """按快照写出 PascalVOC 文件，内容未变化时不写，返回是否写入"""
+    labelFile = LabelFile()
+    labelFile.verified = job.verified
+    return labelFile.savePascalVocFormat(job.xmlPath, list(job.shapes), job.imagePath, None,
+                                  job.lineColor, job.fillColor, imageShape=job.imageShape)
+
+
+class _WriterTask(QRunnable):
+
+    def __init__(self, queue):
+        super(_WriterTask, self).__init__()
+        self.queue = queue
+
+    def run(self):
+        queue = self.queue
+        while True:
+            item = queue._next()
+            if item is None:
+                return
+            key, job = item
+            try:
+                written = queue.writeFunc(job)
+            except Exception as e:
+                queue.failed.emit(key, job, u'%s' % e)
+            else:
+                queue.saved.emit(key, job, written is not False)
+            finally:
+                queue._done()
+
+
+class SaveQueue(QObject):
+    """按文件合并的后台写队列
+
+    submit(key, job) 立即返回；同一个 key 还在排队时只保留最新的 job。
+    只有一个写线程，同一文件的多次保存按提交顺序写出。
+    saved 的第三个参数为是否真的写入，writeFunc 返回 False 表示内容未变化、跳过了写入。
+    """
+
+    saved = pyqtSignal(str, object, bool)
+    failed = pyqtSignal(str, object, str)
+
+    def __init__(self, writeFunc=writeSaveJob, parent=None):
+        super(SaveQueue, self).__init__(parent)
+        self.writeFunc = writeFunc
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(1)
+        self._cond = threading.Condition()
+        self._pending = OrderedDict()
+        self._writing = None
+        self._running = False
+
+    def submit(self, key, job):
+        with self._cond:
+            # 已在排队的文件保持原来的位置，只换成新的快照
+            self._pending[key] = job
+            start = not self._running
+            self._running = True
+        if start:
+            self.pool.start(_WriterTask(self))
+
+    def _next(self):
+        with self._cond:
+            if not self._pending:
+                self._running = False
+                self._cond.notify_all()
+                return None
+            key, job = self._pending.popitem(last=False)
+            self._writing = key
+            return key, job
+
+    def _done(self):
+        with self._cond:
+            self._writing = None
+            self._cond.notify_all()
+
+    def pendingJob(self, key):
+        """还没开始写的快照，没有时返回 None"""
+        with self._cond:
+            return self._pending.get(key)
+
+    def isPending(self, key=None):
+        with self._cond:
+            if key is None:
+                return self._running
+            return key in self._pending or self._writing == key
+
+    def waitFor(self, key=None, timeout=None):
+        """等到 key（为空时为全部）写完，超时返回 False"""
+        with self._cond:
+            if key is None:
+                return self._cond.wait_for(lambda: not self._running, timeout)
+            return self._cond.wait_for(
+                lambda: key not in self._pending and self._writing != key, timeout)
+
+    def flush(self, timeout=None):
+        return self.waitFor(None, timeout)
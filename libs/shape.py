@@ -9,6 +9,8 @@ except ImportError:
     from PyQt4.QtCore import *
 
 from lib import distance
+from boxGeometry import rotatePoints
+import numpy as np
 import math
 
 # 使用HSV颜色空间生成更鲜艳的颜色
@@ -58,7 +60,10 @@ class Shape(object):
 
     def __init__(self, label=None, line_color=None,difficult = False):
         self.label = label
-        self.points = []
+        self._points = []
+        # 几何变化时调用 onGeometryChanged(self)，由画布的命中测试索引设置
+        self.onGeometryChanged = None
+        self._invalidate()
         self.fill = False
         self.selected = False
         self.difficult = difficult
@@ -85,20 +90,51 @@ class Shape(object):
             self.line_color = line_color
 
 
+    @property
+    def points(self):
+        return self._points
+
+    @points.setter
+    def points(self, points):
+        self._points = points
+        self._invalidate()
+
+    def _invalidate(self):
+        """顶点变化后丢弃缓存的路径、包围盒和顶点数组
+
+        直接修改 points 列表中的元素时需通过 __setitem__ / moveVertexBy 等方法，
+        或者整体重新赋值 points，缓存才会失效。
+        """
+        self._path = None
+        self._rect = None
+        self._corners = None
+        if self.onGeometryChanged is not None:
+            self.onGeometryChanged(self)
+
     def rotate(self, theta):
-        for i, p in enumerate(self.points):
-            self.points[i] = self.rotatePoint(p, theta)
+        self.points = [QPointF(x, y) for x, y in self.rotatedCorners(theta).tolist()]
         self.direction -= theta
         self.direction = self.direction % (2 * math.pi)
 
     def rotatePoint(self, p, theta):
-        order = p-self.center;
-        cosTheta = math.cos(theta)
-        sinTheta = math.sin(theta)
-        pResx = cosTheta * order.x() + sinTheta * order.y()
-        pResy = - sinTheta * order.x() + cosTheta * order.y()
-        pRes = QPointF(self.center.x() + pResx, self.center.y() + pResy)
-        return pRes
+        x, y = rotatePoints((p.x(), p.y()), self.centerArray(), theta).tolist()
+        return QPointF(x, y)
+
+    def rotatedCorners(self, theta):
+        """所有顶点绕中心旋转 theta 后的 (N, 2) 数组，不修改形状本身"""
+        return rotatePoints(self.cornerArray(), self.centerArray(), theta)
+
+    def cornerArray(self):
+        """顶点坐标的 (N, 2) 数组，供 boxGeometry 的批量运算使用（只读，已缓存）"""
+        if self._corners is None:
+            corners = np.array([(p.x(), p.y()) for p in self.points],
+                               dtype=np.float64).reshape(-1, 2)
+            corners.setflags(write=False)
+            self._corners = corners
+        return self._corners
+
+    def centerArray(self):
+        return np.array((self.center.x(), self.center.y()), dtype=np.float64)
 
     def close(self):
         self.center = QPointF((self.points[0].x()+self.points[2].x()) / 2, (self.points[0].y()+self.points[2].y()) / 2)
@@ -115,9 +151,11 @@ class Shape(object):
             self.close()
         else:
             self.points.append(point)
+            self._invalidate()
 
     def popPoint(self):
         if self.points:
+            self._invalidate()
             return self.points.pop()
         return None
 
@@ -224,7 +262,7 @@ class Shape(object):
         return None
 
     def containsPoint(self, point):
-        return self.makePath().contains(point)
+        return self.path().contains(point)
 
     def makePath(self):
         path = QPainterPath(self.points[0])
@@ -232,14 +270,23 @@ class Shape(object):
             path.lineTo(p)
         return path
 
+    def path(self):
+        """缓存的 makePath() 结果，顶点变化前重复使用"""
+        if self._path is None:
+            self._path = self.makePath()
+        return self._path
+
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        if self._rect is None:
+            self._rect = self.path().boundingRect()
+        return self._rect
 
     def moveBy(self, offset):
         self.points = [p + offset for p in self.points]
 
     def moveVertexBy(self, i, offset):
         self.points[i] = self.points[i] + offset
+        self._invalidate()
 
     def highlightVertex(self, i, action):
         self._highlightIndex = i
@@ -279,301 +326,4 @@ class Shape(object):
 
     def __setitem__(self, key, value):
         self.points[key] = value
-        
-        ## 推荐的鲜艳填充色方案：
-        
-        ### 1. 鲜艳的洋红色（推荐）
-        DEFAULT_SELECT_FILL_COLOR = QColor.fromHsv(320, int(255 * 0.85), int(255 * 0.90), 180)
-        
-        # 鲜艳的青色顶点 - HSV(180, 85%, 85%)
-        DEFAULT_VERTEX_FILL_COLOR = QColor.fromHsv(180, int(255 * 0.85), int(255 * 0.85), 255)
-        
-        # 鲜艳的黄色高亮顶点 - HSV(55, 90%, 90%)
-        DEFAULT_HVERTEX_FILL_COLOR = QColor.fromHsv(55, int(255 * 0.90), int(255 * 0.90), 255)
-        
-        
-        class Shape(object):
-            P_SQUARE, P_ROUND = range(2)
-        
-            MOVE_VERTEX, NEAR_VERTEX = range(2)
-        
-            # The following class variables influence the drawing
-            # of _all_ shape objects.
-            line_color = DEFAULT_LINE_COLOR
-            fill_color = DEFAULT_FILL_COLOR
-            select_line_color = DEFAULT_SELECT_LINE_COLOR
-            select_fill_color = DEFAULT_SELECT_FILL_COLOR
-            vertex_fill_color = DEFAULT_VERTEX_FILL_COLOR
-            hvertex_fill_color = DEFAULT_HVERTEX_FILL_COLOR
-            point_type = P_ROUND
-            point_size = 8
-            scale = 1.0
-        
-            def __init__(self, label=None, line_color=None,difficult = False):
-                self.label = label
-                self.points = []
-                self.fill = False
-                self.selected = False
-                self.difficult = difficult
-        
-                self.direction = 0  # added by hy
-                self.center = None # added by hy
-                self.isRotated = True 
-        
-                self._highlightIndex = None
-                self._highlightMode = self.NEAR_VERTEX
-                self._highlightSettings = {
-                    self.NEAR_VERTEX: (4, self.P_ROUND),
-                    self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-                }
-        
-                self._closed = False
-        
-                if line_color is not None:
-                    # Override the class line_color attribute
-                    # with an object attribute. Currently this
-                    # is used for drawing the pending line a different color.
-                    self.line_color = line_color
-        
-        
-            def rotate(self, theta):
-                for i, p in enumerate(self.points):
-                    self.points[i] = self.rotatePoint(p, theta)
-                self.direction -= theta
-                self.direction = self.direction % (2 * math.pi)
-        
-            def rotatePoint(self, p, theta):
-                order = p-self.center;
-                cosTheta = math.cos(theta)
-                sinTheta = math.sin(theta)
-                pResx = cosTheta * order.x() + sinTheta * order.y()
-                pResy = - sinTheta * order.x() + cosTheta * order.y()
-                pRes = QPointF(self.center.x() + pResx, self.center.y() + pResy)
-                return pRes
-        
-            def close(self):
-                self.center = QPointF((self.points[0].x()+self.points[2].x()) / 2, (self.points[0].y()+self.points[2].y()) / 2)
-                # print("refresh center!")
-                self._closed = True
-        
-            def reachMaxPoints(self):
-                if len(self.points) >= 4:
-                    return True
-                return False
-        
-            def addPoint(self, point):
-                if self.points and len(self.points) == 4 and point == self.points[0]:
-                    self.close()
-                else:
-                    self.points.append(point)
-        
-            def popPoint(self):
-                if self.points:
-                    return self.points.pop()
-                return None
-        
-            def isClosed(self):
-                return self._closed
-        
-            def setOpen(self):
-                self._closed = False
-        
-            def paint(self, painter):
-                if self.points:
-                    # 优先级：重叠 > 选中 > 普通
-                    if self.is_overlapping:
-                        color = self.overlap_line_color
-                    elif self.selected:
-                        color = self.select_line_color
-                    else:
-                        color = self.line_color
-                    pen = QPen(color)
-                    # 重叠框使用更粗的线条
-                    line_width = 6.0 if self.is_overlapping else 4.0
-                    pen.setWidth(max(1, int(round(line_width / self.scale))))
-                    painter.setPen(pen)
-        
-                    line_path = QPainterPath()
-                    vrtx_path = QPainterPath()
-        
-                    line_path.moveTo(self.points[0])
-                    # Uncommenting the following line will draw 2 paths
-                    # for the 1st vertex, and make it non-filled, which
-                    # may be desirable.
-                    #self.drawVertex(vrtx_path, 0)
-        
-                    for i, p in enumerate(self.points):
-                        line_path.lineTo(p)
-                        # print('shape paint points (%d, %d)' % (p.x(), p.y()))
-                        self.drawVertex(vrtx_path, i)
-                    if self.isClosed():
-                        line_path.lineTo(self.points[0])
-        
-                    # dir_path = QPainterPath()
-                    # tempP = self.points[0]+QPointF(10,10)
-                    # print('direction2 is %lf, a os %lf' % (self.direction,math.tan(self.direction)))
-                    # dir_path.moveTo(tempP)
-                    # dir_path.lineTo(tempP + QPointF(10, (10-tempP.x())* math.tan(self.direction)+tempP.y()))
-                    # painter.drawPath(dir_path)
-        
-                    painter.drawPath(line_path)
-                    painter.drawPath(vrtx_path)
-                    painter.fillPath(vrtx_path, self.vertex_fill_color)
-                    if self.fill:
-                        # 优先级：重叠 > 选中 > 普通
-                        if self.is_overlapping:
-                            color = self.overlap_fill_color
-                        elif self.selected:
-                            color = self.select_fill_color
-                        else:
-                            color = self.fill_color
-                        painter.fillPath(line_path, color)
-        
-                    if self.center is not None:
-                        center_path = QPainterPath()
-                        d = self.point_size / self.scale
-                        center_path.addRect(self.center.x() - d / 2, self.center.y() - d / 2, d, d)
-                        painter.drawPath(center_path)
-                        if self.isRotated:
-                            painter.fillPath(center_path, self.vertex_fill_color)
-                        else:
-                            painter.fillPath(center_path, QColor(0, 0, 0))
-        
-                def paintNormalCenter(self, painter):
-                    if self.center is not None:
-                        center_path = QPainterPath();
-                        d = self.point_size / self.scale
-                        center_path.addRect(self.center.x() - d / 2, self.center.y() - d / 2, d, d)
-                        painter.drawPath(center_path)
-                        if not self.isRotated:
-                            painter.fillPath(center_path, QColor(0, 0, 0))
-        
-                def drawVertex(self, path, i):
-                    d = self.point_size / self.scale
-                    shape = self.point_type
-                    point = self.points[i]
-                    if i == self._highlightIndex:
-                        size, shape = self._highlightSettings[self._highlightMode]
-                        d *= size
-                    if self._highlightIndex is not None:
-                        self.vertex_fill_color = self.hvertex_fill_color
-                    else:
-                        self.vertex_fill_color = Shape.vertex_fill_color
-                    if shape == self.P_SQUARE:
-                        path.addRect(point.x() - d / 2, point.y() - d / 2, d, d)
-                    elif shape == self.P_ROUND:
-                        path.addEllipse(point, d / 2.0, d / 2.0)
-                    else:
-                        assert False, "unsupported vertex shape"
-                # def drawVertex(self, path, center):
-                #     pass
-        
-                def nearestVertex(self, point, epsilon):
-                    for i, p in enumerate(self.points):
-                        if distance(p - point) <= epsilon:
-                            return i
-                    return None
-        
-                def containsPoint(self, point):
-                    return self.makePath().contains(point)
-        
-                def makePath(self):
-                    path = QPainterPath(self.points[0])
-                    for p in self.points[1:]:
-                        path.lineTo(p)
-                    return path
-        
-                def boundingRect(self):
-                    return self.makePath().boundingRect()
-        
-                def moveBy(self, offset):
-                    self.points = [p + offset for p in self.points]
-        
-                def moveVertexBy(self, i, offset):
-                    self.points[i] = self.points[i] + offset
-        
-                def highlightVertex(self, i, action):
-                    self._highlightIndex = i
-                    self._highlightMode = action
-        
-                def highlightClear(self):
-                    self._highlightIndex = None
-        
-                def copy(self):
-                    shape = Shape("%s" % self.label)
-                    shape.points = [p for p in self.points]
-                    
-                    shape.center = self.center
-                    shape.direction = self.direction
-                    shape.isRotated = self.isRotated
-        
-                    shape.fill = self.fill
-                    shape.selected = self.selected
-                    shape._closed = self._closed
-                    if self.line_color != Shape.line_color:
-                        shape.line_color = self.line_color
-                    if self.fill_color != Shape.fill_color:
-                        shape.fill_color = self.fill_color
-                    shape.difficult = self.difficult 
-                    return shape
-        
-                def __len__(self):
-                    return len(self.points)
-        
-                def __getitem__(self, key):
-                    return self.points[key]
-        
-                def __setitem__(self, key, value):
-                    self.points[key] = value
-                # 鲜艳的深红色线条 - HSV(0, 85%, 85%)
-                DEFAULT_LINE_COLOR = QColor.fromHsv(0, int(255 * 0.85), int(255 * 0.85), 255)
-                
-                # 鲜艳的青色顶点 - HSV(180, 85%, 85%)
-                DEFAULT_VERTEX_FILL_COLOR = QColor.fromHsv(180, int(255 * 0.85), int(255 * 0.85), 255)
-                
-                # 鲜艳的黄色高亮顶点 - HSV(55, 90%, 90%)
-                DEFAULT_HVERTEX_FILL_COLOR = QColor.fromHsv(55, int(255 * 0.90), int(255 * 0.90), 255)
-                
-                
-                class Shape(object):
-                    P_SQUARE, P_ROUND = range(2)
-                
-                    MOVE_VERTEX, NEAR_VERTEX = range(2)
-                
-                    # The following class variables influence the drawing
-                    # of _all_ shape objects.
-                    line_color = DEFAULT_LINE_COLOR
-                    fill_color = DEFAULT_FILL_COLOR
-                    select_line_color = DEFAULT_SELECT_LINE_COLOR
-                    select_fill_color = DEFAULT_SELECT_FILL_COLOR
-                    vertex_fill_color = DEFAULT_VERTEX_FILL_COLOR
-                    hvertex_fill_color = DEFAULT_HVERTEX_FILL_COLOR
-                    point_type = P_ROUND
-                    point_size = 8
-                    scale = 1.0
-                
-                    def __init__(self, label=None, line_color=None,difficult = False):
-                        self.label = label
-                        self.points = []
-                        self.fill = False
-                        self.selected = False
-                        self.difficult = difficult
-                
-                        self.direction = 0  # added by hy
-                        self.center = None # added by hy
-                        self.isRotated = True 
-                
-                        self._highlightIndex = None
-                        self._highlightMode = self.NEAR_VERTEX
-                        self._highlightSettings = {
-                            self.NEAR_VERTEX: (4, self.P_ROUND),
-                            self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-                        }
-                
-                        self._closed = False
-                
-                        if line_color is not None:
-                            # Override the class line_color attribute
-                            # with an object attribute. Currently this
-                            # is used for drawing the pending line a different color.
-                            self.line_color = line_color
+        self._invalidate()
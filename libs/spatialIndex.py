@@ -0,0 +1,366 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 宽相位空间索引：用均匀网格登记对象的包围盒，只对网格邻居做精确检测
+
+import math
+from collections import defaultdict
+
+
+class GridIndex(object):
+    """均匀网格空间索引，rect 统一使用 (x1, y1, x2, y2) 元组"""
+
+    # 单个对象最多登记的网格数，超过后放入"大对象"集合，每次查询都作为候选返回
+    maxCellsPerKey = 256
+
+    def __init__(self, cellSize=256.0):
+        self.cellSize = float(cellSize)
+        self._cells = defaultdict(set)
+        self._rects = {}
+        self._keyCells = {}
+        self._oversized = set()
+
+    def __len__(self):
+        return len(self._rects)
+
+    def __contains__(self, key):
+        return key in self._rects
+
+    def keys(self):
+        return self._rects.keys()
+
+    def rect(self, key):
+        return self._rects.get(key)
+
+    def clear(self):
+        self._cells.clear()
+        self._rects.clear()
+        self._keyCells.clear()
+        self._oversized.clear()
+
+    def _cellRange(self, rect):
+        s = self.cellSize
+        x1, y1, x2, y2 = rect
+        return (int(math.floor(x1 / s)), int(math.floor(y1 / s)),
+                int(math.floor(x2 / s)), int(math.floor(y2 / s)))
+
+    def insert(self, key, rect):
+        if key in self._rects:
+            self.remove(key)
+        rect = (min(rect[0], rect[2]), min(rect[1], rect[3]),
+                max(rect[0], rect[2]), max(rect[1], rect[3]))
+        self._rects[key] = rect
+        cx1, cy1, cx2, cy2 = self._cellRange(rect)
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > self.maxCellsPerKey:
+            self._oversized.add(key)
+            self._keyCells[key] = ()
+            return
+        cells = tuple((i, j) for i in range(cx1, cx2 + 1)
+                      for j in range(cy1, cy2 + 1))
+        for cell in cells:
+            self._cells[cell].add(key)
+        self._keyCells[key] = cells
+
+    def remove(self, key):
+        if key not in self._rects:
+            return False
+        for cell in self._keyCells.pop(key):
+            bucket = self._cells.get(cell)
+            if bucket is not None:
+                bucket.discard(key)
+                if not bucket:
+                    del self._cells[cell]
+        self._oversized.discard(key)
+        del self._rects[key]
+        return True
+
+    def update(self, key, rect):
+        """对象移动后重新登记；网格位置没变时只更新包围盒"""
+        old = self._rects.get(key)
+        if old is not None and key not in self._oversized and \
+                self._cellRange(old) == self._cellRange(rect):
+            self._rects[key] = (min(rect[0], rect[2]), min(rect[1], rect[3]),
+                                max(rect[0], rect[2]), max(rect[1], rect[3]))
+            return
+        self.insert(key, rect)
+
+    def candidates(self, rect):
+        """返回与 rect 落在相同网格中的对象（未做精确相交过滤）"""
+        cx1, cy1, cx2, cy2 = self._cellRange(rect)
+        found = set(self._oversized)
+        cells = self._cells
+        if (cx2 - cx1 + 1) * (cy2 - cy1 + 1) > len(cells):
+            # 查询范围比已占用的网格还多时，直接遍历已占用的网格
+            for (i, j), bucket in cells.items():
+                if cx1 <= i <= cx2 and cy1 <= j <= cy2:
+                    found.update(bucket)
+            return found
+        for i in range(cx1, cx2 + 1):
+            for j in range(cy1, cy2 + 1):
+                bucket = cells.get((i, j))
+                if bucket:
+                    found.update(bucket)
+        return found
+
+    def query(self, rect):
+        """返回包围盒与 rect 相交（含边界接触）的对象"""
+        x1, y1, x2, y2 = rect
+        rects = self._rects
+        result = set()
+        for key in self.candidates(rect):
+            r = rects[key]
+            if r[0] <= x2 and x1 <= r[2] and r[1] <= y2 and y1 <= r[3]:
+                result.add(key)
+        return result
+
+    def queryPoint(self, x, y, radius=0.0):
+        return self.query((x - radius, y - radius, x + radius, y + radius))
+
+    @staticmethod
+    def suggestCellSize(rects, minimum=32.0, maximum=4096.0):
+        """按包围盒尺寸的中位数估计合适的网格大小"""
+        sizes = sorted(max(r[2] - r[0], r[3] - r[1]) for r in rects)
+        if not sizes:
+            return 256.0
+        median = sizes[len(sizes) // 2]
+        return float(min(maximum, max(minimum, 2.0 * median)))
+
+
+class OverlapIndex(object):
+    """增量维护"重叠对"集合
+
+    overlapFunc(a, b) 是窄相位判定，rectFunc(obj) 返回 (x1, y1, x2, y2)。
+    可选的 batchFunc(obj, others) 一次判定一批候选，返回与 others 等长的布尔序列。
+    移动一个对象时只和它的网格邻居重新判定，重叠集合就地修补而不是整体重建。
+    """
+
+    # 新增对象超过这个比例时直接整体重建（顺便重新估计网格大小）
+    rebuildRatio = 0.5
+
+    def __init__(self, overlapFunc, rectFunc, cellSize=256.0, batchFunc=None):
+        self.overlapFunc = overlapFunc
+        self.batchFunc = batchFunc
+        self.rectFunc = rectFunc
+        self.grid = GridIndex(cellSize)
+        self._partners = {}
+
+    def __len__(self):
+        return len(self._partners)
+
+    def __contains__(self, obj):
+        return obj in self._partners
+
+    def clear(self):
+        self.grid.clear()
+        self._partners.clear()
+
+    def partners(self, obj):
+        return self._partners.get(obj, ())
+
+    def isOverlapping(self, obj):
+        return bool(self._partners.get(obj))
+
+    def pairCount(self):
+        return sum(len(p) for p in self._partners.values()) // 2
+
+    def rebuild(self, objs):
+        """整体重建，返回所有对象（它们的重叠状态都可能改变）"""
+        objs = list(objs)
+        rects = [self.rectFunc(o) for o in objs]
+        self.clear()
+        self.grid.cellSize = GridIndex.suggestCellSize(rects)
+        for obj, rect in zip(objs, rects):
+            self._insert(obj, rect)
+        return set(objs)
+
+    def add(self, obj):
+        """加入一个对象，返回重叠状态可能改变的对象集合"""
+        if obj in self._partners:
+            return self.update(obj)
+        return self._insert(obj, self.rectFunc(obj))
+
+    def remove(self, obj):
+        """移除一个对象，返回重叠状态可能改变的对象集合"""
+        partners = self._partners.pop(obj, None)
+        if partners is None:
+            return set()
+        self.grid.remove(obj)
+        for other in partners:
+            self._partners[other].discard(obj)
+        return partners
+
+    def update(self, obj):
+        """对象几何变化后只和它的邻居重新判定"""
+        changed = self.remove(obj)
+        changed |= self._insert(obj, self.rectFunc(obj))
+        return changed
+
+    def sync(self, objs):
+        """让索引中的对象集合与 objs 一致：只处理新增和删除的对象"""
+        objs = list(objs)
+        current = set(objs)
+        stale = [o for o in self._partners if o not in current]
+        fresh = [o for o in objs if o not in self._partners]
+        if len(fresh) > max(8, self.rebuildRatio * len(objs)):
+            return self.rebuild(objs)
+        changed = set()
+        for obj in stale:
+            changed |= self.remove(obj)
+        for obj in fresh:
+            changed |= self._insert(obj, self.rectFunc(obj))
+        changed.difference_update(stale)
+        return changed
+
+    def pairs(self, order):
+        """按 order 中的先后顺序返回 (i, j, a, b) 列表，i < j"""
+        position = {obj: i for i, obj in enumerate(order)}
+        result = []
+        for a, partners in self._partners.items():
+            i = position.get(a)
+            if i is None:
+                continue
+            for b in partners:
+                j = position.get(b)
+                if j is not None and i < j:
+                    result.append((i, j, a, b))
+        result.sort(key=lambda pair: (pair[0], pair[1]))
+        return result
+
+    def _insert(self, obj, rect):
+        partners = set()
+        others = list(self.grid.query(rect))
+        if others and self.batchFunc is not None:
+            hits = self.batchFunc(obj, others)
+        else:
+            hits = [self.overlapFunc(obj, other) for other in others]
+        for other, hit in zip(others, hits):
+            if hit:
+                partners.add(other)
+                self._partners[other].add(obj)
+        self._partners[obj] = partners
+        self.grid.insert(obj, rect)
+        changed = set(partners)
+        changed.add(obj)
+        return changed
+
+
+class TrackedList(list):
+    """记录结构修改次数 (revision) 的列表，供 HitTestIndex 判断是否需要重建"""
+
+    def __init__(self, *args):
+        super(TrackedList, self).__init__(*args)
+        self.revision = 0
+
+    def _touch(self):
+        self.revision += 1
+
+    def append(self, item):
+        super(TrackedList, self).append(item)
+        self._touch()
+
+    def extend(self, items):
+        super(TrackedList, self).extend(items)
+        self._touch()
+
+    def insert(self, index, item):
+        super(TrackedList, self).insert(index, item)
+        self._touch()
+
+    def remove(self, item):
+        super(TrackedList, self).remove(item)
+        self._touch()
+
+    def pop(self, *args):
+        item = super(TrackedList, self).pop(*args)
+        self._touch()
+        return item
+
+    def clear(self):
+        del self[:]
+
+    def sort(self, *args, **kwargs):
+        super(TrackedList, self).sort(*args, **kwargs)
+        self._touch()
+
+    def reverse(self):
+        super(TrackedList, self).reverse()
+        self._touch()
+
+    def __setitem__(self, index, item):
+        super(TrackedList, self).__setitem__(index, item)
+        self._touch()
+
+    def __delitem__(self, index):
+        super(TrackedList, self).__delitem__(index)
+        self._touch()
+
+    def __iadd__(self, items):
+        result = super(TrackedList, self).__iadd__(items)
+        self._touch()
+        return result
+
+    def __imul__(self, n):
+        result = super(TrackedList, self).__imul__(n)
+        self._touch()
+        return result
+
+
+class HitTestIndex(object):
+    """按绘制顺序（后绘制的在上）返回某点附近的对象
+
+    objs 为 TrackedList；watchFunc(obj, callback) 让对象在几何变化时调用 callback(obj)，
+    变化的对象记入脏集合，下次查询前只重新登记这些对象，不检查其余对象。
+    """
+
+    def __init__(self, rectFunc, watchFunc, cellSize=256.0):
+        self.rectFunc = rectFunc
+        self.watchFunc = watchFunc
+        self.grid = GridIndex(cellSize)
+        self._objs = None
+        self._listRevision = None
+        self._order = {}
+        self._dirty = set()
+
+    def invalidate(self):
+        self._objs = None
+
+    def markDirty(self, obj):
+        """obj 的几何发生了变化"""
+        self._dirty.add(obj)
+
+    def sync(self, objs):
+        listRevision = getattr(objs, 'revision', None)
+        if objs is not self._objs or listRevision is None or \
+                listRevision != self._listRevision:
+            self._rebuild(objs)
+        elif self._dirty:
+            # 只重新登记几何发生变化的对象，已移出列表的忽略
+            dirty, self._dirty = self._dirty, set()
+            for obj in dirty:
+                if obj in self._order:
+                    self._place(obj)
+        self._objs = objs
+        self._listRevision = listRevision
+
+    def _rebuild(self, objs):
+        self._dirty = set()
+        rects = [self.rectFunc(o) for o in objs]
+        self.grid.clear()
+        self.grid.cellSize = GridIndex.suggestCellSize([r for r in rects if r is not None])
+        self._order = {}
+        for i, (obj, rect) in enumerate(zip(objs, rects)):
+            self._order[obj] = i
+            self.watchFunc(obj, self.markDirty)
+            if rect is not None:
+                self.grid.insert(obj, rect)
+
+    def _place(self, obj):
+        rect = self.rectFunc(obj)
+        if rect is None:
+            self.grid.remove(obj)
+        else:
+            self.grid.update(obj, rect)
+
+    def candidates(self, x, y, radius=0.0):
+        """包围盒扩大 radius 后包含 (x, y) 的对象，最上层的在前"""
+        found = self.grid.queryPoint(x, y, radius)
+        return sorted(found, key=self._order.get, reverse=True)
@@ -0,0 +1,257 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 超大图像的分块多级绘制：按缩放比例选择金字塔层级，只绘制与可见区域相交的瓦片；
+# 瓦片在工作线程中直接从文件按区域、按缩小比例解码，不持有整张原图；
+# 不支持按区域解码的格式（PNG、BMP、TIFF 等）退回为整张解码一次，各瓦片共用
+
+import math
+import threading
+from collections import OrderedDict
+
+try:
+    from PyQt5.QtGui import QImage, QImageIOHandler, QImageReader, QPixmap
+    from PyQt5.QtCore import QObject, QRect, QRectF, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+except ImportError:
+    from PyQt4.QtGui import QImage, QImageIOHandler, QImageReader, QPixmap
+    from PyQt4.QtCore import QObject, QRect, QRectF, QRunnable, QSize, QThreadPool, Qt, pyqtSignal
+
+# 像素数达到这个值的图片不再整张解码，改为总览图加按需解码的瓦片
+TILED_MIN_PIXELS = 6000 * 6000
+# 总览图的最长边
+OVERVIEW_MAX_SIDE = 2048
+
+
+def isTiledSize(size):
+    return size.isValid() and size.width() * size.height() >= TILED_MIN_PIXELS
+
+
+def readOverview(path, fullSize, maxSide=OVERVIEW_MAX_SIDE):
+    """按缩小后的尺寸解码整张图，JPEG 等格式解码时即缩小，不生成原图"""
+    factor = max(1.0, float(max(fullSize.width(), fullSize.height())) / maxSide)
+    reader = QImageReader(path)
+    reader.setScaledSize(QSize(max(1, int(fullSize.width() / factor)),
+                               max(1, int(fullSize.height() / factor))))
+    return reader.read()
+
+
+def tileSourceRect(fullSize, tileSize, level, col, row):
+    """第 level 层 (col, row) 瓦片在原图中的区域和它在该层的尺寸"""
+    factor = 2 ** level
+    span = tileSize * factor
+    source = QRect(col * span, row * span, span, span).intersected(
+        QRect(0, 0, fullSize.width(), fullSize.height()))
+    size = QSize(max(1, -(-source.width() // factor)), max(1, -(-source.height() // factor)))
+    return source, size
+
+
+def supportsClipRect(path):
+    """图片格式能否只解码指定区域；不能时 setClipRect 会先解码整张图再裁剪"""
+    return QImageReader(path).supportsOption(QImageIOHandler.ClipRect)
+
+
+def readTile(path, fullSize, tileSize, level, col, row):
+    """只解码一块瓦片：setClipRect 取原图中的区域，setScaledSize 缩小到该层的尺寸"""
+    source, size = tileSourceRect(fullSize, tileSize, level, col, row)
+    if source.isEmpty():
+        return QImage()
+    reader = QImageReader(path)
+    reader.setClipRect(source)
+    if size != source.size():
+        reader.setScaledSize(size)
+    return reader.read()
+
+
+def cutTile(image, tileSize, level, col, row):
+    """从已解码的整张图中裁出一块瓦片"""
+    source, size = tileSourceRect(image.size(), tileSize, level, col, row)
+    if source.isEmpty():
+        return QImage()
+    tile = image.copy(source)
+    if size != source.size():
+        tile = tile.scaled(size, Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+    return tile
+
+
+class _TileTask(QRunnable):
+
+    def __init__(self, pyramid, key):
+        super(_TileTask, self).__init__()
+        self.pyramid = pyramid
+        self.key = key
+
+    def run(self):
+        pyramid, key = self.pyramid, self.key
+        image = QImage()
+        try:
+            # 已经滚出可见区域的瓦片不再解码
+            if pyramid.isWanted(key):
+                image = pyramid.decodeTile(key)
+        finally:
+            pyramid._taskDone(key, image)
+
+
+class TilePyramid(QObject):
+    """图像瓦片金字塔
+
+    第 0 层为原图，第 k 层宽高各缩小到 1/2^k。各层不整体生成，瓦片按需在工作线程中
+    从文件解码，解码好的瓦片 QPixmap 放在按字节数限制的 LRU 缓存中；
+    瓦片还没解码好时先用总览图拉伸显示。tileReady 在 GUI 线程中发出，接收方据此重绘。
+    格式不支持按区域解码时，第一次需要瓦片时整张解码一次，之后的瓦片都从这张图裁出，
+    这张图不计入 maxBytes，shutdown 时释放。
+    """
+
+    tileReady = pyqtSignal()
+    _decoded = pyqtSignal(object, QImage)
+
+    def __init__(self, path, fullSize, overview=None, tileSize=512,
+                 maxBytes=256 * 1024 * 1024, maxThreads=2, parent=None):
+        super(TilePyramid, self).__init__(parent)
+        self.path = path
+        self.fullSize = QSize(fullSize)
+        self.tileSize = tileSize
+        self.maxBytes = maxBytes
+        self.width = fullSize.width()
+        self.height = fullSize.height()
+        self.overview = QPixmap.fromImage(overview) if overview is not None and not overview.isNull() \
+            else QPixmap()
+        self._tiles = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._wanted = set()
+        self._pending = set()
+        self.clipSupported = supportsClipRect(path)
+        self._source = None
+        self._sourceLock = threading.Lock()
+        self._closed = False
+        self.pool = QThreadPool(self)
+        self.pool.setMaxThreadCount(maxThreads)
+        self._decoded.connect(self._storeTile)
+        # 最高层级缩小到一块瓦片以内
+        self.maxLevel = 0
+        while max(self.width, self.height) > tileSize * (2 ** self.maxLevel):
+            self.maxLevel += 1
+
+    def levelFor(self, scale):
+        """缩放比例 scale 下应当使用的层级"""
+        if scale >= 1 or scale <= 0:
+            return 0
+        level = int(math.floor(math.log(1.0 / scale, 2)))
+        return min(level, self.maxLevel)
+
+    def levelSize(self, level):
+        factor = 2 ** level
+        return (max(1, -(-self.width // factor)), max(1, -(-self.height // factor)))
+
+    def tileRange(self, level, rect):
+        """与原图坐标系下的 rect (x1, y1, x2, y2) 相交的瓦片行列范围"""
+        w, h = self.levelSize(level)
+        fx, fy = float(self.width) / w, float(self.height) / h
+        ts = self.tileSize
+        cols = -(-w // ts)
+        rows = -(-h // ts)
+        c1 = max(0, int(math.floor(rect[0] / fx / ts)))
+        r1 = max(0, int(math.floor(rect[1] / fy / ts)))
+        c2 = min(cols - 1, int(math.floor(rect[2] / fx / ts)))
+        r2 = min(rows - 1, int(math.floor(rect[3] / fy / ts)))
+        return c1, r1, c2, r2
+
+    # 后台解码
+
+    def isWanted(self, key):
+        with self._lock:
+            return key in self._wanted
+
+    def decodeTile(self, key):
+        """在工作线程中解码一块瓦片"""
+        if self.clipSupported:
+            return readTile(self.path, self.fullSize, self.tileSize, *key)
+        source = self.sourceImage()
+        if source.isNull():
+            return QImage()
+        return cutTile(source, self.tileSize, *key)
+
+    def sourceImage(self):
+        """整张原图，多个工作线程同时需要时只解码一次"""
+        with self._sourceLock:
+            if self._source is None and not self._closed:
+                self._source = QImageReader(self.path).read()
+            return self._source if self._source is not None else QImage()
+
+    def request(self, keys):
+        """keys 为当前需要的瓦片，替换之前的请求；已缓存或正在解码的不重复提交"""
+        with self._lock:
+            self._wanted = set(keys)
+            todo = [key for key in keys if key not in self._pending and key not in self._tiles]
+            self._pending.update(todo)
+        for key in todo:
+            self.pool.start(_TileTask(self, key))
+
+    def _taskDone(self, key, image):
+        with self._lock:
+            self._pending.discard(key)
+        if not image.isNull():
+            self._decoded.emit(key, image)
+
+    def _storeTile(self, key, image):
+        if key in self._tiles:
+            return
+        pixmap = QPixmap.fromImage(image)
+        self._tiles[key] = pixmap
+        self._bytes += self.pixmapBytes(pixmap)
+        self.trim()
+        self.tileReady.emit()
+
+    def tile(self, level, col, row):
+        """已解码的瓦片，还没有时返回 None"""
+        key = (level, col, row)
+        pixmap = self._tiles.get(key)
+        if pixmap is not None:
+            self._tiles.move_to_end(key)
+        return pixmap
+
+    @staticmethod
+    def pixmapBytes(pixmap):
+        return pixmap.width() * pixmap.height() * max(1, pixmap.depth() // 8)
+
+    def trim(self):
+        while self._bytes > self.maxBytes and len(self._tiles) > 1:
+            _, pixmap = self._tiles.popitem(last=False)
+            self._bytes -= self.pixmapBytes(pixmap)
+
+    def paint(self, painter, rect, scale):
+        """rect 为原图坐标系下需要重绘的区域"""
+        level = self.levelFor(scale)
+        w, h = self.levelSize(level)
+        fx, fy = float(self.width) / w, float(self.height) / h
+        ts = self.tileSize
+        c1, r1, c2, r2 = self.tileRange(level, rect)
+        missing = []
+        for row in range(r1, r2 + 1):
+            for col in range(c1, c2 + 1):
+                pixmap = self.tile(level, col, row)
+                target = QRectF(col * ts * fx, row * ts * fy,
+                                min(ts, w - col * ts) * fx, min(ts, h - row * ts) * fy)
+                if pixmap is None:
+                    missing.append((level, col, row))
+                    self.paintOverview(painter, target)
+                else:
+                    painter.drawPixmap(target, pixmap, QRectF(pixmap.rect()))
+        if missing:
+            self.request(missing)
+
+    def paintOverview(self, painter, target):
+        """用总览图中对应的部分临时填充还没解码好的瓦片"""
+        if self.overview.isNull():
+            return
+        sx = float(self.overview.width()) / self.width
+        sy = float(self.overview.height()) / self.height
+        source = QRectF(target.x() * sx, target.y() * sy, target.width() * sx, target.height() * sy)
+        painter.drawPixmap(target, self.overview, source)
+
+    def shutdown(self):
+        with self._lock:
+            self._wanted = set()
+        self.pool.clear()
+        with self._sourceLock:
+            self._closed = True
+            self._source = None
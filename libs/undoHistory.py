@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 撤销/重做：每一步是一个只记录变化部分的命令（增删形状、顶点和方向、标签），
+# 形状按画布 shapes 中的下标引用；每张图片一个命令栈，切换图片后仍保留，
+# 所有栈共用一个按估算内存计算的上限，超出时先丢弃最久未用的图片中最早的命令
+
+from collections import OrderedDict, deque
+
+# 一个命令的基础开销和每个坐标点的估算字节数
+_COMMAND_BYTES = 200
+_POINT_BYTES = 80
+
+
+def _stateBytes(state):
+    return _COMMAND_BYTES + _POINT_BYTES * len(state[1]) + len(state[0] or '') * 2
+
+
+class UndoCommand(object):
+    """命令基类，target 为提供 insertShapes / removeShapes / setShapeGeometry / setShapeLabel 的编辑对象
+
+    命令在画布上已经执行后才入栈，redo 用于撤销后重做。
+    """
+
+    text = u''
+
+    def undo(self, target):
+        raise NotImplementedError
+
+    def redo(self, target):
+        raise NotImplementedError
+
+    def cost(self):
+        return _COMMAND_BYTES
+
+
+class AddShapes(UndoCommand):
+    """添加形状，entries 为 [(下标, 状态)]，状态为 (label, points, direction, isRotated, difficult)"""
+
+    text = u'添加标签'
+
+    def __init__(self, entries):
+        self.entries = sorted(entries, key=lambda e: e[0])
+
+    def undo(self, target):
+        target.removeShapes([index for index, _ in self.entries])
+
+    def redo(self, target):
+        target.insertShapes(self.entries)
+
+    def cost(self):
+        return sum(_stateBytes(state) for _, state in self.entries)
+
+
+class DeleteShapes(AddShapes):
+    """删除一个或一批形状，entries 为删除前的 [(下标, 状态)]"""
+
+    text = u'删除标签'
+
+    def undo(self, target):
+        AddShapes.redo(self, target)
+
+    def redo(self, target):
+        AddShapes.undo(self, target)
+
+
+class ChangeGeometry(UndoCommand):
+    """移动、拖动顶点或旋转：只记录一个形状前后的顶点和方向"""
+
+    def __init__(self, index, oldPoints, newPoints, oldDirection, newDirection):
+        self.index = index
+        self.old = (tuple(oldPoints), oldDirection)
+        self.new = (tuple(newPoints), newDirection)
+        self.text = u'旋转' if oldDirection != newDirection else u'移动'
+
+    def undo(self, target):
+        target.setShapeGeometry(self.index, *self.old)
+
+    def redo(self, target):
+        target.setShapeGeometry(self.index, *self.new)
+
+    def cost(self):
+        return _COMMAND_BYTES + _POINT_BYTES * (len(self.old[0]) + len(self.new[0]))
+
+
+class Relabel(UndoCommand):
+
+    text = u'修改标签'
+
+    def __init__(self, index, oldLabel, newLabel):
+        self.index = index
+        self.oldLabel = oldLabel
+        self.newLabel = newLabel
+
+    def undo(self, target):
+        target.setShapeLabel(self.index, self.oldLabel)
+
+    def redo(self, target):
+        target.setShapeLabel(self.index, self.newLabel)
+
+    def cost(self):
+        return _COMMAND_BYTES + 2 * (len(self.oldLabel or '') + len(self.newLabel or ''))
+
+
+class UndoStack(object):
+    """一张图片的命令栈，commands[:index] 可撤销，commands[index:] 可重做
+
+    check 为离开图片时画布的校验值，重新打开图片后第一次撤销前由调用方比较，确认画布与命令栈对应。
+    """
+
+    def __init__(self):
+        self.commands = deque()
+        self.index = 0
+        self.cost = 0
+        self.check = None
+
+    def canUndo(self):
+        return self.index > 0
+
+    def canRedo(self):
+        return self.index < len(self.commands)
+
+    def undoText(self):
+        return self.commands[self.index - 1].text if self.canUndo() else None
+
+    def redoText(self):
+        return self.commands[self.index].text if self.canRedo() else None
+
+    def push(self, command):
+        # 新命令使可重做的部分失效
+        while len(self.commands) > self.index:
+            self.cost -= self.commands.pop().cost()
+        self.commands.append(command)
+        self.index += 1
+        self.cost += command.cost()
+
+    def dropOldest(self):
+        """丢弃离当前状态最远的一步：有可撤销的命令时丢最早的，全部已撤销时从重做链的末尾丢"""
+        if self.index > 0:
+            command = self.commands.popleft()
+            self.index -= 1
+        else:
+            command = self.commands.pop()
+        self.cost -= command.cost()
+
+
+class UndoHistory(object):
+    """按图片保存的命令栈，总估算内存不超过 maxBytes"""
+
+    def __init__(self, maxBytes=32 * 1024 * 1024):
+        self.maxBytes = maxBytes
+        self._stacks = OrderedDict()
+        self.cost = 0
+
+    def __len__(self):
+        return len(self._stacks)
+
+    def stackFor(self, key):
+        """key 的命令栈，没有时返回 None"""
+        return self._stacks.get(key)
+
+    def push(self, key, command):
+        stack = self._stacks.get(key)
+        if stack is None:
+            stack = self._stacks[key] = UndoStack()
+        self._stacks.move_to_end(key)
+        before = stack.cost
+        stack.push(command)
+        self.cost += stack.cost - before
+        self._shrink()
+
+    def _shrink(self):
+        # 从最久未用的图片开始丢弃最早的命令，当前图片至少保留最后一步
+        for key in list(self._stacks):
+            if self.cost <= self.maxBytes:
+                return
+            stack = self._stacks[key]
+            last = next(reversed(self._stacks))
+            while stack.commands and self.cost > self.maxBytes and \
+                    (key != last or len(stack.commands) > 1):
+                before = stack.cost
+                stack.dropOldest()
+                self.cost += stack.cost - before
+            if not stack.commands:
+                del self._stacks[key]
+
+    def undo(self, key, target):
+        """撤销 key 的最后一步，返回执行的命令，没有可撤销的命令时返回 None"""
+        stack = self._stacks.get(key)
+        if stack is None or not stack.canUndo():
+            return None
+        self._stacks.move_to_end(key)
+        stack.index -= 1
+        command = stack.commands[stack.index]
+        command.undo(target)
+        return command
+
+    def redo(self, key, target):
+        stack = self._stacks.get(key)
+        if stack is None or not stack.canRedo():
+            return None
+        self._stacks.move_to_end(key)
+        command = stack.commands[stack.index]
+        stack.index += 1
+        command.redo(target)
+        return command
+
+    def drop(self, key):
+        stack = self._stacks.pop(key, None)
+        if stack is not None:
+            self.cost -= stack.cost
+
+    def clear(self):
+        self._stacks.clear()
+        self.cost = 0
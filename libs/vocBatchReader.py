@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# 批量读取 PascalVOC 标注：按块分给多个进程解析，结果为紧凑的 numpy 数组，
+# 不创建 Shape / QPointF，也不导入 Qt，可在审核、导出脚本中单独使用
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from lxml import etree as _etree
+except ImportError:
+    import xml.etree.ElementTree as _etree
+
+XML_EXT = '.xml'
+
+
+class VocArrays(object):
+    """一批标注文件的解析结果，每个对象一行
+
+    imageIds / labelIds 为 int32，boxes 为 (N, 5) 的 (cx, cy, w, h, angle)，
+    difficult / rotated 为 bool；imageIds 是 paths 的下标，labelIds 是 labelNames 的下标，
+    行按文件顺序、文件内按对象顺序排列。failed 为解析失败的文件下标。
+    """
+
+    def __init__(self, paths, labelNames=None, imageIds=None, labelIds=None,
+                 boxes=None, difficult=None, rotated=None, failed=None):
+        self.paths = paths
+        self.labelNames = labelNames if labelNames is not None else []
+        self.imageIds = imageIds if imageIds is not None else np.zeros(0, np.int32)
+        self.labelIds = labelIds if labelIds is not None else np.zeros(0, np.int32)
+        self.boxes = boxes if boxes is not None else np.zeros((0, 5))
+        self.difficult = difficult if difficult is not None else np.zeros(0, bool)
+        self.rotated = rotated if rotated is not None else np.zeros(0, bool)
+        self.failed = failed if failed is not None else []
+
+    def __len__(self):
+        return len(self.imageIds)
+
+    def rowsOf(self, imageId):
+        """第 imageId 个文件的对象所在的行范围"""
+        return slice(int(np.searchsorted(self.imageIds, imageId, 'left')),
+                     int(np.searchsorted(self.imageIds, imageId, 'right')))
+
+
+def parseVocObjects(xmlPath):
+    """按 PascalVocReader 的规则解析一个文件
+
+    返回 [(label, cx, cy, w, h, angle, difficult, rotated), ...]；bndbox 换算为中心和宽高，角度为 0。
+    """
+    root = _etree.parse(xmlPath).getroot()
+    objects = []
+    for obj in root.findall('object'):
+        boxType = obj.findtext('type')
+        if boxType not in ('bndbox', 'robndbox'):
+            continue
+        label = obj.findtext('name') or ''
+        difficultText = obj.findtext('difficult')
+        difficult = bool(int(difficultText)) if difficultText is not None else False
+        box = obj.find(boxType)
+        if boxType == 'bndbox':
+            xmin, ymin, xmax, ymax = [int(box.findtext(tag))
+                                      for tag in ('xmin', 'ymin', 'xmax', 'ymax')]
+            objects.append((label, (xmin + xmax) / 2.0, (ymin + ymax) / 2.0,
+                            float(xmax - xmin), float(ymax - ymin), 0.0, difficult, False))
+        else:
+            cx, cy, w, h, angle = [float(box.findtext(tag))
+                                   for tag in ('cx', 'cy', 'w', 'h', 'angle')]
+            objects.append((label, cx, cy, w, h, angle, difficult, True))
+    return objects
+
+
+def _parseChunk(paths):
+    """在工作进程中解析一块文件，标签编号只在本块内有效"""
+    labelNames = []
+    labelIndex = {}
+    imageIds, labelIds, boxes, difficult, rotated, failed = [], [], [], [], [], []
+    for i, path in enumerate(paths):
+        try:
+            objects = parseVocObjects(path)
+        except Exception:
+            failed.append(i)
+            continue
+        for label, cx, cy, w, h, angle, isDifficult, isRotated in objects:
+            labelId = labelIndex.get(label)
+            if labelId is None:
+                labelId = labelIndex[label] = len(labelNames)
+                labelNames.append(label)
+            imageIds.append(i)
+            labelIds.append(labelId)
+            boxes.append((cx, cy, w, h, angle))
+            difficult.append(isDifficult)
+            rotated.append(isRotated)
+    return (labelNames, np.array(imageIds, np.int32), np.array(labelIds, np.int32),
+            np.array(boxes, np.float64).reshape(-1, 5), np.array(difficult, bool),
+            np.array(rotated, bool), failed)
+
+
+def processPool(workers):
+    """解析用的进程池
+
+    固定用 spawn 启动子进程：调用方常在 Qt 的工作线程中，fork 带着其他线程的进程可能死锁。
+    """
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def readVocFiles(paths, processes=None, chunkSize=256, onProgress=None, executor=None):
+    """并行解析一批 XML，返回 VocArrays
+
+    processes 为进程数，缺省为 CPU 数；文件少于一块或 processes 为 1 时直接在当前进程解析。
+    executor 为调用方持有的进程池，多次调用时可避免反复启动进程。
+    onProgress(已完成文件数, 总数) 在每块完成后调用。
+    """
+    paths = list(paths)
+    chunks = [paths[i:i + chunkSize] for i in range(0, len(paths), chunkSize)]
+    if executor is not None and len(chunks) > 1:
+        return _merge(paths, chunks, executor.map(_parseChunk, chunks), onProgress)
+    if len(chunks) <= 1 or processes == 1:
+        return _merge(paths, chunks, map(_parseChunk, chunks), onProgress)
+    workers = min(processes or os.cpu_count() or 1, len(chunks))
+    with processPool(workers) as pool:
+        return _merge(paths, chunks, pool.map(_parseChunk, chunks), onProgress)
+
+
+def readVocDirectory(dirPath, processes=None, chunkSize=256, onProgress=None):
+    """解析目录（不含子目录）下的所有 XML，文件按名称排序"""
+    paths = sorted(os.path.join(dirPath, name) for name in os.listdir(dirPath)
+                   if name.lower().endswith(XML_EXT))
+    return readVocFiles(paths, processes, chunkSize, onProgress)
+
+
+def _merge(paths, chunks, results, onProgress=None):
+    """把各块的局部编号换算为全局的文件和标签编号"""
+    labelNames = []
+    labelIndex = {}
+    parts = []
+    failed = []
+    start = 0
+    for chunk, (names, imageIds, labelIds, boxes, difficult, rotated, chunkFailed) in zip(chunks, results):
+        remap = np.empty(len(names), np.int32)
+        for i, name in enumerate(names):
+            labelId = labelIndex.get(name)
+            if labelId is None:
+                labelId = labelIndex[name] = len(labelNames)
+                labelNames.append(name)
+            remap[i] = labelId
+        parts.append((imageIds + start, remap[labelIds] if len(labelIds) else labelIds,
+                      boxes, difficult, rotated))
+        failed.extend(i + start for i in chunkFailed)
+        start += len(chunk)
+        if onProgress is not None:
+            onProgress(start, len(paths))
+    if not parts:
+        return VocArrays(paths, failed=failed)
+    columns = list(zip(*parts))
+    return VocArrays(paths, labelNames,
+                     np.concatenate(columns[0]).astype(np.int32),
+                     np.concatenate(columns[1]).astype(np.int32),
+                     np.concatenate(columns[2]).reshape(-1, 5),
+                     np.concatenate(columns[3]).astype(bool),
+                     np.concatenate(columns[4]).astype(bool), failed)
@@ -6,10 +6,13 @@ import re
 import sys
 import subprocess
 import hashlib
+import multiprocessing
 
 from functools import partial
 from collections import defaultdict
 
+import numpy as np
+
 try:
     from PyQt5.QtGui import *
     from PyQt5.QtCore import *
@@ -44,6 +47,19 @@ try:
     from colorDialog import ColorDialog
     from labelFile import LabelFile, LabelFileError
     from toolBar import ToolBar
+    from spatialIndex import OverlapIndex
+    from boxGeometry import overlapWith, polygonArea
+    from imageLoader import ImageCache, ImagePrefetcher, ImageLoader, decodeImage, fileStamp
+    from annotationIndex import AnnotationIndex
+    from dirWatcher import DirectoryWatcher
+    from fileListModel import FileListModel
+    from dirScanner import DirScanner, ScanManifestStore, scanImages
+    from projectManifest import ProjectManifest, ManifestStore
+    from saveQueue import SaveJob, SaveQueue
+    from annotationJournal import AnnotationJournal, recoverJournals, shapeState, stateToShape
+    from undoHistory import UndoHistory, AddShapes, DeleteShapes, ChangeGeometry, Relabel
+    from labelStatsModel import LabelStatsModel
+    from datasetStats import DatasetStats, StatsAggregator, summarizeShapes, SIZE_BINS, ANGLE_BIN_DEGREES
 except ImportError:
     # 如果直接导入失败，尝试从libs包导入
     from libs.lib import struct, newAction, newIcon, addActions, fmtShortcut
@@ -54,6 +70,19 @@ except ImportError:
     from libs.colorDialog import ColorDialog
     from libs.labelFile import LabelFile, LabelFileError
     from libs.toolBar import ToolBar
+    from libs.spatialIndex import OverlapIndex
+    from libs.boxGeometry import overlapWith, polygonArea
+    from libs.imageLoader import ImageCache, ImagePrefetcher, ImageLoader, decodeImage, fileStamp
+    from libs.annotationIndex import AnnotationIndex
+    from libs.dirWatcher import DirectoryWatcher
+    from libs.fileListModel import FileListModel
+    from libs.dirScanner import DirScanner, ScanManifestStore, scanImages
+    from libs.projectManifest import ProjectManifest, ManifestStore
+    from libs.saveQueue import SaveJob, SaveQueue
+    from libs.annotationJournal import AnnotationJournal, recoverJournals, shapeState, stateToShape
+    from libs.undoHistory import UndoHistory, AddShapes, DeleteShapes, ChangeGeometry, Relabel
+    from libs.labelStatsModel import LabelStatsModel
+    from libs.datasetStats import DatasetStats, StatsAggregator, summarizeShapes, SIZE_BINS, ANGLE_BIN_DEGREES
 try:
     # 首先尝试直接导入
     from pascal_voc_io import PascalVocReader
@@ -131,7 +160,30 @@ class LabelListWidget(QListWidget):
 
 class MainWindow(QMainWindow, WindowMixin):
     FIT_WINDOW, FIT_WIDTH, MANUAL_ZOOM = list(range(3))
+
+    # 预读前后各几张图片，以及解码缓存的内存上限
+    PREFETCH_COUNT = 2
+    IMAGE_CACHE_BYTES = 1024 * 1024 * 1024
+    # 形状停止移动多久后复查重叠（毫秒）
+    OVERLAP_DEBOUNCE_MS = 200
+    # 目录扫描清单的缓存位置
+    SCAN_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.roLabelImgCache')
+    # 数据集统计的刷新间隔（毫秒），后台分批送来的摘要合并为一次显示
+    DATASET_STATS_DELAY_MS = 100
+    # 超过这个大小的 XML 边解析边显示，每轮事件循环加入 LABEL_STREAM_BATCH 个框
+    STREAM_XML_BYTES = 256 * 1024
+    LABEL_STREAM_BATCH = 500
+    # 读取期间画布最多每隔这么久重绘一次（毫秒），形状很多时每次重绘都不便宜
+    LABEL_STREAM_REPAINT_MS = 1000
+    # 未保存操作的日志目录，以及日志最多隔多久 fsync 一次（毫秒）
+    JOURNAL_DIR = os.path.join(os.path.expanduser('~'), '.roLabelImgJournal')
+    JOURNAL_SYNC_MS = 500
+    # 所有图片的撤销历史共用的估算内存上限
+    UNDO_HISTORY_BYTES = 32 * 1024 * 1024
+
     selectionChanged = pyqtSignal(bool)  # 添加选择改变信号
+    # 项目清单写线程提交后发出，参数为 (目录, 提交前目录修改时间, 提交后目录修改时间)
+    manifestCommitted = pyqtSignal(str, object, object)
 
     def __init__(self, defaultFilename=None, defaultPrefdefClassFile=None):
         super(MainWindow, self).__init__()
@@ -157,6 +209,72 @@ class MainWindow(QMainWindow, WindowMixin):
         # 初始化撤销系统
         self.initUndoSystem()
 
+        # 重叠检测的空间索引，形状移动时只复查它的邻居
+        self.overlapIndex = OverlapIndex(self._overlapTest, self.shapeBounds,
+                                         batchFunc=self._overlapBatch)
+        # 拖动过程中只记录被移动的形状，手势结束或停顿后再统一复查重叠
+        self._movedShapes = set()
+        self._reportedOverlaps = set()
+        self.overlapTimer = QTimer(self)
+        self.overlapTimer.setSingleShot(True)
+        self.overlapTimer.setInterval(self.OVERLAP_DEBOUNCE_MS)
+        self.overlapTimer.timeout.connect(self.flushMovedShapes)
+
+        # 后台预读前后几张图片，切换图片时直接命中缓存
+        self.imageCache = ImageCache(self.IMAGE_CACHE_BYTES)
+        self.prefetcher = ImagePrefetcher(self.imageCache, parent=self)
+        # 缓存未命中时在后台线程加载当前图片
+        self.imageLoader = ImageLoader(self.imageCache, parent=self)
+        self.imageLoader.previewReady.connect(self.onImagePreview)
+        self.imageLoader.loaded.connect(self.onImageLoaded)
+        self.imageLoader.failed.connect(self.onImageLoadFailed)
+        # 后台解码中的图片路径，解码完成前画布为空，不能保存或校验
+        self.loadingImage = None
+
+        # 各图片是否已有 XML 标注，打开目录时建立，保存时原地更新
+        self.annotationIndex = AnnotationIndex(self.xmlPathForImage)
+        # 其他人或脚本在打开期间写入、删除的 XML 也要及时反映到标注状态
+        self.xmlWatcher = DirectoryWatcher(XML_EXT, parent=self)
+        self.xmlWatcher.filesChanged.connect(self.onAnnotationFilesChanged)
+        # 清单的回滚日志就在图片目录中，自己提交引起的目录变化不必重新列出
+        self.manifestCommitted.connect(self.xmlWatcher.noteDirWritten)
+        # 后台扫描图片目录，找到的图片逐批加入文件列表；目录清单优先存放在项目目录中
+        self.dirScanner = DirScanner(ManifestStore(ScanManifestStore(self.SCAN_CACHE_DIR)), parent=self)
+        # 图片目录中的项目清单，重新打开时直接读出图片列表和标注状态
+        self.projectManifest = None
+        self._streamScan = False
+        # 保存在后台写出，切换图片不必等待磁盘
+        self.saveQueue = SaveQueue(parent=self)
+        self.saveQueue.saved.connect(self.onSaveFinished)
+        self.saveQueue.failed.connect(self.onSaveFailed)
+        # 未保存操作的日志，见 initJournal；形状到日志编号 [编号, 记录时的方向] 的映射
+        self.journal = None
+        self._journalIds = {}
+        self._journalBaseCount = 0
+        self._journalStamp = None
+        # xmlPath -> (job, imagePath, seq)，同一文件只记最新提交的保存；被合并掉的旧任务不会再回调
+        self._journalSaves = {}
+        self._journalRecovered = set()
+        self._journalView = None
+        self.journalTimer = QTimer(self)
+        self.journalTimer.setSingleShot(True)
+        self.journalTimer.setInterval(self.JOURNAL_SYNC_MS)
+        self.journalTimer.timeout.connect(self.syncJournal)
+        # 正在分批加入画布的标注，见 streamLabels
+        self._labelStream = None
+        self._labelStreamCount = 0
+        self.dirScanner.batchFound.connect(self.onScanBatch)
+        self.dirScanner.progress.connect(self.onScanProgress)
+        self.dirScanner.finished.connect(self.onScanFinished)
+        # 全数据集的标签统计由每个 XML 的摘要累加，摘要在后台生成并缓存在项目清单中
+        self.datasetStats = DatasetStats()
+        self.statsAggregator = StatsAggregator(parent=self)
+        self.statsAggregator.summariesReady.connect(self.onLabelSummaries)
+        self.datasetStatsTimer = QTimer(self)
+        self.datasetStatsTimer.setSingleShot(True)
+        self.datasetStatsTimer.setInterval(self.DATASET_STATS_DELAY_MS)
+        self.datasetStatsTimer.timeout.connect(self.updateDatasetStatistics)
+
         # Enble auto saving if pressing next
         self.autoSaving = True
         self._noSelectionSlot = False
@@ -272,8 +390,16 @@ class MainWindow(QMainWindow, WindowMixin):
         self.dock.setWidget(labelListContainer)
 
         # Tzutalin 20160906 : Add file list and dock to move faster
-        self.fileListWidget = QListWidget()
-        self.fileListWidget.itemDoubleClicked.connect(self.fileitemDoubleClicked)
+        # 文件列表只保存路径，标注状态在绘制可见行时才查询
+        self.fileListModel = FileListModel(self.isImageAnnotated, self.annotationTooltip, parent=self)
+        self.fileListWidget = QListView()
+        self.fileListWidget.setUniformItemSizes(True)
+        # 分批布局，百万级列表打开时也能立即显示第一屏
+        self.fileListWidget.setLayoutMode(QListView.Batched)
+        self.fileListWidget.setBatchSize(2000)
+        self.fileListWidget.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.fileListWidget.setModel(self.fileListModel)
+        self.fileListWidget.doubleClicked.connect(self.fileitemDoubleClicked)
         filelistLayout = QVBoxLayout()
         filelistLayout.setContentsMargins(0, 0, 0, 0)
         filelistLayout.addWidget(self.fileListWidget)
@@ -303,6 +429,7 @@ class MainWindow(QMainWindow, WindowMixin):
 
         self.canvas.newShape.connect(self.newShape)
         self.canvas.shapeMoved.connect(self.onShapeMoved)
+        self.canvas.shapeMoveFinished.connect(self.flushMovedShapes)
         self.canvas.selectionChanged.connect(self.shapeSelectionChanged)
         self.canvas.drawingPolygon.connect(self.toggleDrawingSensitive)
         self.canvas.status.connect(self.status)
@@ -385,6 +512,10 @@ class MainWindow(QMainWindow, WindowMixin):
         undo = action('&Undo', self.undo,
                       'Ctrl+Z', 'undo', u'Undo the last action',
                       enabled=True)
+        redo = action('&Redo', self.redo,
+                      'Ctrl+Y', 'undo', u'Redo the last undone action',
+                      enabled=True)
+        redo.setShortcuts(["Ctrl+Y", "Ctrl+Shift+Z"])
 
         # 批量操作动作
         selectAll = action('全选标签', self.selectAllLabels,
@@ -481,9 +612,9 @@ class MainWindow(QMainWindow, WindowMixin):
             self.popLabelListMenu)
 
         # Store actions for further handling.
-        self.actions = struct(save=save, saveAs=saveAs, open=open, close=close,
+        self.actions = struct(save=save, saveAs=saveAs, verify=verify, open=open, close=close,
                               lineColor=color1, fillColor=color2,
-                              create=create, createRo=createRo, delete=delete, edit=edit, copy=copy, undo=undo,
+                              create=create, createRo=createRo, delete=delete, edit=edit, copy=copy, undo=undo, redo=redo,
                               selectAll=selectAll, batchDelete=batchDelete,
                               createMode=createMode, editMode=editMode, advancedMode=advancedMode,
                               autoAnnotate=autoAnnotate, deleteOverlapping=deleteOverlapping,
@@ -496,7 +627,7 @@ class MainWindow(QMainWindow, WindowMixin):
                               fileMenuActions=(
                                   open, opendir, save, saveAs, close, quit),
                               beginner=(), advanced=(),
-                              editMenu=(undo, None, edit, copy, delete,
+                              editMenu=(undo, redo, None, edit, copy, delete,
                                         None, color1, color2),
                               beginnerContext=(create, edit, copy, delete),
                               advancedContext=(createMode, editMode, edit, copy,
@@ -660,6 +791,8 @@ class MainWindow(QMainWindow, WindowMixin):
             self.actions.advancedMode.setChecked(True)
             self.toggleAdvancedMode()
 
+        self.initJournal()
+
         # Populate the File menu dynamically.
         self.updateFileMenu()
         # Since loading the file may take some time, make sure it runs in the
@@ -831,16 +964,19 @@ class MainWindow(QMainWindow, WindowMixin):
         labelStatsGroup = QGroupBox("标签分类统计")
         labelStatsLayout = QVBoxLayout()
         
-        # 创建标签统计的滚动区域
-        self.labelStatsScrollArea = QScrollArea()
-        self.labelStatsWidget = QWidget()
-        self.labelStatsLayout = QVBoxLayout()
-        self.labelStatsWidget.setLayout(self.labelStatsLayout)
-        self.labelStatsScrollArea.setWidget(self.labelStatsWidget)
-        self.labelStatsScrollArea.setWidgetResizable(True)
-        self.labelStatsScrollArea.setMaximumHeight(150)
-        
-        labelStatsLayout.addWidget(self.labelStatsScrollArea)
+        # 各标签的数量由表格模型提供，数量变化时只更新对应的行
+        self.labelStatsModel = LabelStatsModel(self)
+        self.labelStatsView = QTableView()
+        self.labelStatsView.setModel(self.labelStatsModel)
+        self.labelStatsView.verticalHeader().setVisible(False)
+        self.labelStatsView.verticalHeader().setDefaultSectionSize(22)
+        self.labelStatsView.horizontalHeader().setSectionResizeMode(0, QHeaderView.Stretch)
+        self.labelStatsView.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.labelStatsView.setSelectionMode(QAbstractItemView.NoSelection)
+        self.labelStatsView.setShowGrid(False)
+        self.labelStatsView.setMaximumHeight(150)
+        
+        labelStatsLayout.addWidget(self.labelStatsView)
         labelStatsGroup.setLayout(labelStatsLayout)
         statsLayout.addWidget(labelStatsGroup)
         
@@ -883,6 +1019,16 @@ class MainWindow(QMainWindow, WindowMixin):
         projectStatsGroup.setLayout(projectStatsLayout)
         statsLayout.addWidget(projectStatsGroup)
         
+        # 数据集统计区域（所有标注文件）
+        datasetStatsGroup = QGroupBox("数据集统计")
+        datasetStatsLayout = QVBoxLayout()
+        self.datasetStatsLabel = QLabel("尚未统计")
+        self.datasetStatsLabel.setWordWrap(True)
+        self.datasetStatsLabel.setStyleSheet("color: #495057;")
+        datasetStatsLayout.addWidget(self.datasetStatsLabel)
+        datasetStatsGroup.setLayout(datasetStatsLayout)
+        statsLayout.addWidget(datasetStatsGroup)
+        
         # 添加弹性空间
         statsLayout.addStretch()
         
@@ -949,51 +1095,24 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def updateLabelStatistics(self, shapes):
         """更新标签分类统计"""
-        # 清除现有的标签统计
-        self.clearLabelStatistics()
-        
         # 统计各标签的数量
         label_counts = {}
         for shape in shapes:
             label = shape.label if hasattr(shape, 'label') and shape.label else "未命名"
             label_counts[label] = label_counts.get(label, 0) + 1
         
-        # 显示标签统计
-        for label, count in sorted(label_counts.items()):
-            label_item = QLabel(f"{label}: {count}")
-            label_item.setStyleSheet("padding: 2px; border-bottom: 1px solid #E0E0E0;")
-            self.labelStatsLayout.addWidget(label_item)
+        # 同一轮事件循环内的多次更新合并为一次表格刷新
+        self.labelStatsModel.setCounts(label_counts)
 
     def clearLabelStatistics(self):
         """清除标签统计显示"""
-        while self.labelStatsLayout.count():
-            child = self.labelStatsLayout.takeAt(0)
-            if child.widget():
-                child.widget().deleteLater()
+        self.labelStatsModel.setCounts({})
 
     def updateProjectStatistics(self):
         """更新项目整体统计"""
         if hasattr(self, 'mImgList') and self.mImgList:
-            total_images = len(self.mImgList)
-            annotated_count = 0
-            
-            # 计算已标注的图像数量
-            for img_path in self.mImgList:
-                img_dir = os.path.dirname(img_path)
-                img_name = os.path.basename(img_path)
-                xml_name = os.path.splitext(img_name)[0] + XML_EXT
-                
-                if self.defaultSaveDir:
-                    xml_path = os.path.join(self.defaultSaveDir, xml_name)
-                else:
-                    xml_path = os.path.join(img_dir, xml_name)
-                    
-                if os.path.exists(xml_path):
-                    annotated_count += 1
-            
-            # 计算进度百分比
-            progress_percent = (annotated_count / total_images * 100) if total_images > 0 else 0
-            
+            annotated_count, total_images, progress_percent = self.annotationIndex.progress()
+
             # 更新显示
             self.totalImagesLabel.setText(f"总图像数: {total_images}")
             self.annotatedImagesLabel.setText(f"已标注: {annotated_count}")
@@ -1021,12 +1140,23 @@ class MainWindow(QMainWindow, WindowMixin):
         self.statusBar().show()
 
     def resetState(self):
+        if self.dirty and self.filePath and self.journal is not None:
+            # 未保存就离开，日志中的修改随之放弃
+            self.journal.discard(self.filePath)
+        self.leaveUndoHistory()
+        self._journalIds = {}
+        self._journalBaseCount = 0
+        self._journalStamp = None
         self.itemsToShapes.clear()
         self.shapesToItems.clear()
         self.labelList.clear()
         self.filePath = None
         self.imageData = None
         self.labelFile = None
+        self._movedShapes.clear()
+        self.overlapTimer.stop()
+        self._labelStream = None
+        self._labelStreamCount = 0
         self.canvas.resetState()
 
     def currentItem(self):
@@ -1215,15 +1345,15 @@ class MainWindow(QMainWindow, WindowMixin):
 
     # Tzutalin 20160906 : Add file list and dock to move faster
     def fileitemDoubleClicked(self, item=None):
-        if item is None:
+        if item is None or not item.isValid():
             return
         
         # 获取当前项在文件列表中的索引
-        currIndex = self.fileListWidget.row(item)
+        currIndex = item.row()
         if 0 <= currIndex < len(self.mImgList):
             filename = self.mImgList[currIndex]
             if filename:
-                self.loadFile(filename)
+                self.loadFile(filename, asynchronous=True)
 
     # Add chris
     def btnstate(self, item= None):
@@ -1246,6 +1376,7 @@ class MainWindow(QMainWindow, WindowMixin):
         try:
             if difficult != shape.difficult:
                 shape.difficult = difficult
+                self.journalChange(shape, 'difficult', difficult=difficult)
                 self.setDirty()
             else:  # User probably changed item visibility
                 self.canvas.setShapeVisible(shape, item.checkState() == Qt.Checked)
@@ -1256,8 +1387,23 @@ class MainWindow(QMainWindow, WindowMixin):
     def onShapeMoved(self):
         """处理形状移动后的操作"""
         self.setDirty()
-        # 更新重叠检查和画布显示
-        self.updateOverlapWarning()
+        # 只记录被移动的形状，重叠复查推迟到手势结束（或停顿超过 OVERLAP_DEBOUNCE_MS）
+        for shape in (self.canvas.selectedShape, self.canvas.hShape):
+            if shape is not None:
+                self._movedShapes.add(shape)
+        self.overlapTimer.start()
+
+    def flushMovedShapes(self):
+        """对累计移动过的形状做一次增量重叠检测"""
+        self.overlapTimer.stop()
+        self.pushGeometryChanges()
+        if not self._movedShapes:
+            return
+        for shape in self._movedShapes:
+            self.journalGeometry(shape)
+        moved = [s for s in self._movedShapes if s in self.overlapIndex]
+        self._movedShapes.clear()
+        self.updateOverlapWarning(moved)
         self.canvas.update()
 
     def shapeSelectionChanged(self, selected=False):
@@ -1277,7 +1423,18 @@ class MainWindow(QMainWindow, WindowMixin):
         self.actions.shapeLineColor.setEnabled(selected)
         self.actions.shapeFillColor.setEnabled(selected)
 
-    def addLabel(self, shape, save_undo=True):
+    def addLabel(self, shape, save_undo=True, row=None):
+        self.addLabelItem(shape, row)
+        self.journalAdd(shape)
+        for action in self.actions.onShapesPresent:
+            action.setEnabled(True)
+        self.updateStatistics()
+        self.updateOverlapWarning()
+        if save_undo:
+            self.pushUndo(AddShapes([self.undoEntry(shape)]))
+
+    def addLabelItem(self, shape, row=None):
+        """为形状创建标签列表项，不刷新统计和重叠信息，row 为插入位置，默认加在最后"""
         shape.paintLabel = True
         item = HashableQListWidgetItem(shape.label)
         item.setFlags(item.flags() | Qt.ItemIsUserCheckable)
@@ -1287,25 +1444,18 @@ class MainWindow(QMainWindow, WindowMixin):
         shape.fill_color = QColor(shape.line_color.red(), shape.line_color.green(), shape.line_color.blue(), 128)
         self.itemsToShapes[item] = shape
         self.shapesToItems[shape] = item
-        self.labelList.addItem(item)
-        for action in self.actions.onShapesPresent:
-            action.setEnabled(True)
-        self.updateStatistics()
-        self.updateOverlapWarning()
-        
-        # 保存撤销操作
-        if save_undo:
-            self.saveUndoAction("添加标签", shape)
+        if row is None:
+            self.labelList.addItem(item)
+        else:
+            self.labelList.insertItem(row, item)
+        return item
 
-    def remLabel(self, shape, save_undo=True):
+    def remLabel(self, shape):
+        """移除形状的标签列表项，形状须已从画布移除；撤销命令由调用方记录"""
         if shape is None:
             # print('rm empty label')
             return
-        
-        # 保存撤销状态（在删除之前）
-        if save_undo:
-            self.saveStateForUndo("删除标签")
-            
+        self.journalDelete(shape)
         item = self.shapesToItems[shape]
         self.labelList.takeItem(self.labelList.row(item))
         del self.shapesToItems[shape]
@@ -1314,7 +1464,24 @@ class MainWindow(QMainWindow, WindowMixin):
         self.updateOverlapWarning()
 
     def loadLabels(self, shapes):
+        """批量加载标注：列表更新和信号暂停，统计与重叠检测只在最后各做一次"""
         s = []
+        self.labelList.setUpdatesEnabled(False)
+        self.labelList.blockSignals(True)
+        try:
+            self._buildShapes(shapes, s)
+        finally:
+            self.labelList.blockSignals(False)
+            self.labelList.setUpdatesEnabled(True)
+        if s:
+            for action in self.actions.onShapesPresent:
+                action.setEnabled(True)
+
+        self.canvas.loadShapes(s)
+        self.updateStatistics()
+        self.updateOverlapWarning()
+
+    def _buildShapes(self, shapes, s):
         for label, points, direction, isRotated, line_color, fill_color, difficult in shapes:
             shape = Shape(label=label)
             for x, y in points:
@@ -1333,14 +1500,15 @@ class MainWindow(QMainWindow, WindowMixin):
                 shape.fill_color = QColor(*fill_color) if fill_color else QColor(shape.line_color.red(), shape.line_color.green(), shape.line_color.blue(), 128)
                 
             s.append(shape)
-            self.addLabel(shape, save_undo=False)  # 加载标签时不保存撤销操作
-
-        self.canvas.loadShapes(s)
-        self.updateStatistics()
-        self.updateOverlapWarning()
-
-    def saveLabels(self, annotationFilePath):
-        annotationFilePath = ustr(annotationFilePath)
+            self.addLabelItem(shape)  # 加载标签时不保存撤销操作
+            # 读入的形状按文件中的顺序编号，日志中的操作以此引用
+            self._journalIds[shape] = [self._journalBaseCount, direction]
+            self._journalBaseCount += 1
+
+    def saveSnapshot(self, annotationFilePath):
+        """当前图片标注的快照，交给后台写线程后界面可以继续修改"""
+        # 还没读完的标注先全部读入，避免只保存一部分
+        self.finishLabelStream()
         if self.labelFile is None:
             self.labelFile = LabelFile()
             self.labelFile.verified = self.canvas.verified
@@ -1357,19 +1525,32 @@ class MainWindow(QMainWindow, WindowMixin):
                         # You Hao 2017/06/21
                         # add for rotated bounding box
                         direction = s.direction if hasattr(s, 'direction') else 0,
-                        center = s.center if hasattr(s, 'center') and s.center is not None else None,
+                        center = (s.center.x(), s.center.y())
+                        if hasattr(s, 'center') and s.center is not None else None,
                         isRotated = s.isRotated if hasattr(s, 'isRotated') else False)
 
         shapes = [format_shape(shape) for shape in self.canvas.shapes]
+        # 尺寸取自已解码的当前图片并按路径缓存，保存时不再重新解码；超大图片只有总览图，读文件头
+        image = self.image if self.canvas.tiles is None else None
+        imageShape = LabelFile.imageShapes.shapeFor(self.filePath, image)
+        return SaveJob(ustr(annotationFilePath), self.filePath, shapes, imageShape,
+                       self.labelFile.verified, self.lineColor.getRgb(), self.fillColor.getRgb())
+
+    def saveLabels(self, annotationFilePath):
+        """立即写出当前标注，写完才返回"""
+        annotationFilePath = ustr(annotationFilePath)
+        job = self.saveSnapshot(annotationFilePath)
         # Can add differrent annotation formats here
         try:
             if self.usingPascalVocFormat is True:
                 print ('Img: ' + self.filePath + ' -> Its xml: ' + annotationFilePath)
-                self.labelFile.savePascalVocFormat(annotationFilePath, shapes, self.filePath, self.imageData,
-                                                   self.lineColor.getRgb(), self.fillColor.getRgb())
+                self.saveQueue.waitFor(annotationFilePath)
+                self.labelFile.savePascalVocFormat(annotationFilePath, list(job.shapes), self.filePath,
+                                                   self.imageData, job.lineColor, job.fillColor,
+                                                   imageShape=job.imageShape)
             else:
-                self.labelFile.save(annotationFilePath, shapes, self.filePath, self.imageData,
-                                    self.lineColor.getRgb(), self.fillColor.getRgb())
+                self.labelFile.save(annotationFilePath, list(job.shapes), self.filePath, self.imageData,
+                                    job.lineColor, job.fillColor)
             return True
         except LabelFileError as e:
             self.errorMessage(u'Error saving label data',
@@ -1415,7 +1596,10 @@ class MainWindow(QMainWindow, WindowMixin):
         shape = self.itemsToShapes[item]
         label = item.text()
         if label != shape.label:
+            if not self._undoApplying:
+                self.pushUndo(Relabel(self.shapeIndex(shape), shape.label, label))
             shape.label = item.text()
+            self.journalChange(shape, 'relabel', label=shape.label)
             self.setDirty()
         else:  # User probably changed item visibility
             self.canvas.setShapeVisible(shape, item.checkState() == Qt.Checked)
@@ -1509,10 +1693,16 @@ class MainWindow(QMainWindow, WindowMixin):
         for item, shape in self.itemsToShapes.items():
             item.setCheckState(Qt.Checked if value else Qt.Unchecked)
 
-    def loadFile(self, filePath=None):
-        """Load the specified file, or the last opened file if None."""
+    def loadFile(self, filePath=None, asynchronous=False):
+        """Load the specified file, or the last opened file if None.
+
+        asynchronous 为 True 且图片不在缓存中时改为后台解码，
+        先显示预览图，解码完成后由 onImageLoaded 完成剩余步骤。
+        """
+        # 新的加载请求使进行中的后台加载作废
+        self.imageLoader.cancel()
+        self.setLoading(None)
         self.resetState()
-        self.clearUndoStack()  # 切换图片时清空撤销栈
         self.canvas.setEnabled(False)
         if filePath is None:
             filePath = self.settings.get('filename')
@@ -1520,10 +1710,10 @@ class MainWindow(QMainWindow, WindowMixin):
         unicodeFilePath = ustr(filePath)
         # Tzutalin 20160906 : Add file list and dock to move faster
         # Highlight the file item
-        if unicodeFilePath and self.fileListWidget.count() > 0:
-            index = self.mImgList.index(unicodeFilePath)
-            fileWidgetItem = self.fileListWidget.item(index)
-            fileWidgetItem.setSelected(True)
+        if unicodeFilePath and self.mImgList:
+            index = self.imageRow(unicodeFilePath)
+            if index >= 0:
+                self.fileListWidget.setCurrentIndex(self.fileListModel.index(index))
 
         if unicodeFilePath and os.path.exists(unicodeFilePath):
             if LabelFile.isLabelFile(unicodeFilePath):
@@ -1539,57 +1729,145 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.imageData = self.labelFile.imageData
                 self.lineColor = QColor(*self.labelFile.lineColor)
                 self.fillColor = QColor(*self.labelFile.fillColor)
+                image = QImage.fromData(self.imageData)
             else:
                 # Load image:
                 # read data first and store for saving into label file.
-                self.imageData = read(unicodeFilePath, None)
+                if asynchronous and self.imageCache.get(unicodeFilePath) is None:
+                    self.startImageLoad(unicodeFilePath)
+                    return True
+                cached = self.loadImageCached(unicodeFilePath)
+                self.imageData = cached.data if cached else None
+                image = cached.image if cached else QImage()
                 self.labelFile = None
-            image = QImage.fromData(self.imageData)
-            if image.isNull():
-                self.errorMessage(u'Error opening file',
-                                  u"<p>Make sure <i>%s</i> is a valid image file." % unicodeFilePath)
-                self.status("Error reading %s" % unicodeFilePath)
-                return False
-            self.status("Loaded %s" % os.path.basename(unicodeFilePath))
-            self.image = image
-            self.filePath = unicodeFilePath
-            self.canvas.loadPixmap(QPixmap.fromImage(image))
-            if self.labelFile:
-                self.loadLabels(self.labelFile.shapes)
-            self.setClean()
-            self.canvas.setEnabled(True)
-            self.adjustScale(initial=True)
-            self.paintCanvas()
-            self.addRecentFile(self.filePath)
-            self.toggleActions(True)
+                return self.showLoadedImage(unicodeFilePath, image,
+                                            cached.fullSize if cached else None)
+            return self.showLoadedImage(unicodeFilePath, image)
+        return False
 
-            # Label xml file and show bound box according to its filename
-            if self.usingPascalVocFormat is True:
-                if self.defaultSaveDir is not None:
-                    basename = os.path.basename(
-                        os.path.splitext(self.filePath)[0]) + XML_EXT
-                    xmlPath = os.path.join(self.defaultSaveDir, basename)
-                    self.loadPascalXMLByFilename(xmlPath)
-                else:
-                    xmlPath = filePath.split(".")[0] + XML_EXT
-                    if os.path.isfile(xmlPath):
-                        self.loadPascalXMLByFilename(xmlPath)
+    def showLoadedImage(self, unicodeFilePath, image, fullSize=None):
+        """图片解码完成后显示图片并加载标注
 
-            self.setWindowTitle(__appname__ + ' ' + filePath)
+        fullSize 不为空时 image 是超大图片的总览图，画布按瓦片从文件绘制原图。
+        """
+        if image.isNull():
+            self.errorMessage(u'Error opening file',
+                              u"<p>Make sure <i>%s</i> is a valid image file." % unicodeFilePath)
+            self.status("Error reading %s" % unicodeFilePath)
+            return False
+        self.setLoading(None)
+        self.status("Loaded %s" % os.path.basename(unicodeFilePath))
+        self.image = image
+        self.filePath = unicodeFilePath
+        self.canvas.loadImage(image, unicodeFilePath, fullSize)
+        if self.labelFile:
+            self.loadLabels(self.labelFile.shapes)
+        self.setClean()
+        self.canvas.setEnabled(True)
+        self.adjustScale(initial=True)
+        self.paintCanvas()
+        self.addRecentFile(self.filePath)
+        self.toggleActions(True)
 
-            # Default : select last item if there is at least one item
-            if self.labelList.count():
-                self.labelList.setCurrentItem(self.labelList.item(self.labelList.count()-1))
-                # self.labelList.setItemSelected(self.labelList.item(self.labelList.count()-1), True)
+        # Label xml file and show bound box according to its filename
+        if self.usingPascalVocFormat is True:
+            self.loadPascalXMLByFilename(self.xmlPathForImage(unicodeFilePath))
+        self.restoreJournal(unicodeFilePath)
 
-            self.canvas.setFocus(True)
-            
-            # 加载文件后更新进度显示
-            self.updateProgressDisplay()
-            self.updateFileListDisplay()
-            
-            return True
-        return False
+        self.setWindowTitle(__appname__ + ' ' + unicodeFilePath)
+
+        # Default : select last item if there is at least one item
+        if self.labelList.count():
+            self.labelList.setCurrentItem(self.labelList.item(self.labelList.count()-1))
+            # self.labelList.setItemSelected(self.labelList.item(self.labelList.count()-1), True)
+
+        self.canvas.setFocus(True)
+        
+        # 加载文件后复查当前图片的标注状态
+        self.refreshAnnotationStatus(unicodeFilePath)
+        self.recordImageInfo(unicodeFilePath, self.canvas.imageSize)
+
+        view = self._journalView
+        if view is not None and view.get('image') == unicodeFilePath:
+            self._journalView = None
+            self.setZoom(view['zoom'])
+            QTimer.singleShot(0, partial(self.restoreJournalView, view))
+
+        self.prefetchNeighbours()
+        
+        return True
+
+    def startImageLoad(self, filePath):
+        """在后台线程解码图片，期间窗口保持响应"""
+        self.filePath = filePath
+        self.image = QImage()
+        self.setClean()
+        self.setLoading(filePath)
+        self.status("Loading %s..." % os.path.basename(filePath))
+        xmlPath = self.xmlPathForImage(filePath) if self.usingPascalVocFormat else None
+        self.imageLoader.load(filePath, xmlPath, self.centralWidget().size())
+
+    def setLoading(self, filePath):
+        """filePath 为正在后台解码的图片，None 表示没有；解码期间禁用保存和校验，避免空标注覆盖已有的 XML"""
+        self.loadingImage = filePath
+        loading = filePath is not None
+        self.actions.verify.setEnabled(not loading)
+        if loading:
+            self.actions.save.setEnabled(False)
+            self.actions.saveAs.setEnabled(False)
+
+    def onImagePreview(self, requestId, filePath, preview, fullSize):
+        """先按原图尺寸显示缩小的预览图"""
+        if not self.imageLoader.isCurrent(requestId):
+            return
+        self.canvas.loadPixmap(QPixmap.fromImage(preview), fullSize)
+        self.adjustScale(initial=True)
+        self.paintCanvas()
+
+    def onImageLoaded(self, requestId, cached):
+        if not self.imageLoader.isCurrent(requestId):
+            return
+        self.imageData = cached.data
+        self.labelFile = None
+        self.showLoadedImage(cached.path, cached.image, cached.fullSize)
+
+    def onImageLoadFailed(self, requestId, filePath):
+        if not self.imageLoader.isCurrent(requestId):
+            return
+        self.setLoading(None)
+        self.filePath = None
+        self.showLoadedImage(filePath, QImage())
+
+    def xmlPathForImage(self, filePath):
+        """图片对应的 XML 标注文件路径（默认保存目录或图片同目录），加载、保存、索引都用它"""
+        xmlName = os.path.splitext(os.path.basename(filePath))[0] + XML_EXT
+        if self.defaultSaveDir:
+            return os.path.join(ustr(self.defaultSaveDir), xmlName)
+        return os.path.join(os.path.dirname(filePath), xmlName)
+
+    def loadImageCached(self, filePath):
+        """优先从预读缓存取解码好的图片，未命中时同步读取并放入缓存"""
+        cached = self.imageCache.get(filePath)
+        if cached is not None:
+            return cached
+        cached = decodeImage(filePath)
+        if cached is not None:
+            self.imageCache.put(cached)
+        return cached
+
+    def prefetchNeighbours(self):
+        """预读当前图片之后和之前的 PREFETCH_COUNT 张图片"""
+        currIndex = self.imageRow(self.filePath) if self.filePath else -1
+        if currIndex < 0:
+            return
+        order = []
+        for offset in range(1, self.PREFETCH_COUNT + 1):
+            # 向后翻页更常见，先预读下一张
+            for index in (currIndex + offset, currIndex - offset):
+                if 0 <= index < len(self.mImgList):
+                    order.append(self.mImgList[index])
+        xmlPath = self.xmlPathForImage if self.usingPascalVocFormat else (lambda path: None)
+        self.prefetcher.prefetch([(path, xmlPath(path)) for path in order])
 
     def resizeEvent(self, event):
         if self.canvas and not self.image.isNull()\
@@ -1598,7 +1876,7 @@ class MainWindow(QMainWindow, WindowMixin):
         super(MainWindow, self).resizeEvent(event)
 
     def paintCanvas(self):
-        assert not self.image.isNull(), "cannot paint null image"
+        assert not self.canvas.imageSize.isEmpty(), "cannot paint null image"
         self.canvas.scale = 0.01 * self.zoomWidget.value()
         self.canvas.adjustSize()
         self.canvas.update()
@@ -1614,15 +1892,15 @@ class MainWindow(QMainWindow, WindowMixin):
         h1 = self.centralWidget().height() - e
         a1 = w1 / h1
         # Calculate a new scale value based on the pixmap's aspect ratio.
-        w2 = self.canvas.pixmap.width() - 0.0
-        h2 = self.canvas.pixmap.height() - 0.0
+        w2 = self.canvas.imageSize.width() - 0.0
+        h2 = self.canvas.imageSize.height() - 0.0
         a2 = w2 / h2
         return w1 / w2 if a2 >= a1 else h1 / h2
 
     def scaleFitWidth(self):
         # The epsilon does not seem to work too well here.
         w = self.centralWidget().width() - 2.0
-        return w / self.canvas.pixmap.width()
+        return w / self.canvas.imageSize.width()
 
     def closeEvent(self, event):
         if not self.mayContinue():
@@ -1651,6 +1929,19 @@ class MainWindow(QMainWindow, WindowMixin):
         else:
             s['lastOpenDir'] = ""
 
+        if event.isAccepted():
+            self.imageLoader.shutdown()
+            self.prefetcher.shutdown()
+            self.dirScanner.shutdown()
+            self.statsAggregator.shutdown()
+            # 排队中的保存全部写完再退出，写完的通知在关闭日志前处理
+            self.saveQueue.flush()
+            QCoreApplication.sendPostedEvents(None, QEvent.MetaCall)
+            self.closeJournal()
+            if self.projectManifest is not None:
+                self.projectManifest.close()
+            self.xmlWatcher.clear()
+
     ## User Dialogs ##
 
     def loadRecent(self, filename):
@@ -1658,16 +1949,78 @@ class MainWindow(QMainWindow, WindowMixin):
             self.loadFile(filename)
 
     def scanAllImages(self, folderPath):
-        extensions = ['.jpeg', '.jpg', '.png', '.bmp']
-        images = []
+        return scanImages(folderPath)
+
+    def importDirImages(self, dirpath):
+        """在后台扫描目录，扫描完成前找到的图片已经可以在文件列表中看到
 
-        for root, dirs, files in os.walk(folderPath):
-            for file in files:
-                if file.lower().endswith(tuple(extensions)):
-                    relativePath = os.path.join(root, file)
-                    images.append(relativePath)
-        images.sort(key=lambda x: x.lower())
-        return images
+        目录中有项目清单时先显示清单里的图片列表和标注状态，扫描完成后再校正。
+        """
+        if self.projectManifest is not None:
+            self.projectManifest.close()
+        self.projectManifest = ProjectManifest.open(dirpath)
+        if self.projectManifest is not None:
+            self.projectManifest.onCommit = self.manifestCommitted.emit
+            self.mImgList, annotated = self.projectManifest.images()
+            # 上次记下的 XML 指纹，内容未变化的保存不必再读出比较
+            LabelFile.fingerprints.update(self.projectManifest.fingerprints())
+        else:
+            self.mImgList, annotated = [], None
+        self.fileListModel.setPaths(self.mImgList)
+        self.annotationIndex.build(self.mImgList, annotated)
+        self.xmlWatcher.clear()
+        self.statsAggregator.reset()
+        self.datasetStats.clear()
+        self.scheduleDatasetStatistics()
+        self._streamScan = not self.mImgList
+        self.dirScanner.scan(dirpath, self.buildAnnotationIndex)
+        self.status(u'正在扫描 %s' % dirpath, 0)
+        self.updateProgressDisplay()
+        self.updateProjectStatistics()
+        if self.mImgList and self.filePath is None:
+            self.openNextImg()
+
+    def onScanBatch(self, requestId, paths):
+        # 已经从项目清单显示了完整列表时，等扫描完成后再统一校正
+        if self.dirScanner.isCurrent(requestId) and self._streamScan:
+            self.fileListModel.appendPaths(paths)
+
+    def onScanProgress(self, requestId, imageCount, dirCount):
+        if self.dirScanner.isCurrent(requestId):
+            self.status(u'正在扫描: 已找到 %d 张图片 (%d 个目录)' % (imageCount, dirCount), 0)
+
+    def buildAnnotationIndex(self, paths):
+        """在扫描线程中为扫描结果建立标注状态索引"""
+        index = AnnotationIndex(self.xmlPathForImage)
+        index.build(paths)
+        index.xmlDirs()
+        return index
+
+    def onScanFinished(self, requestId, paths, index):
+        """扫描完成，换成排好序的完整列表和重新建立的标注状态索引"""
+        if not self.dirScanner.isCurrent(requestId):
+            return
+        previous = (self.annotationIndex.flags(), list(self.mImgList))
+        self.mImgList = paths
+        self.annotationIndex = index
+        self.fileListModel.setPaths(self.mImgList)
+        if self.filePath:
+            # 扫描线程列目录之后可能刚保存过当前图片
+            self.annotationIndex.refresh(self.filePath, self.imageRow(self.filePath))
+        self.xmlWatcher.setDirectories(self.annotationIndex.xmlDirs())
+        if self.projectManifest is not None and \
+                previous != (self.annotationIndex.flags(), self.mImgList):
+            self.projectManifest.saveImages(self.mImgList, self.annotationIndex.flags())
+        self.startDatasetStatistics()
+        self.status(u'共找到 %d 张图片' % len(paths))
+        if self.filePath is None:
+            self.openNextImg()
+        else:
+            row = self.imageRow(self.filePath)
+            if row >= 0:
+                self.fileListWidget.setCurrentIndex(self.fileListModel.index(row))
+        self.updateProgressDisplay()
+        self.updateProjectStatistics()
 
     def changeSavedir(self, _value=False):
         if self.defaultSaveDir is not None:
@@ -1681,6 +2034,7 @@ class MainWindow(QMainWindow, WindowMixin):
 
         if dirpath is not None and len(dirpath) > 1:
             self.defaultSaveDir = dirpath
+            self.rebuildAnnotationIndex()
 
         self.statusBar().showMessage('%s . Annotation will be saved to %s' %
                                      ('Change saved folder', self.defaultSaveDir))
@@ -1720,20 +2074,11 @@ class MainWindow(QMainWindow, WindowMixin):
 
         self.dirname = dirpath
         self.filePath = None
-        self.fileListWidget.clear()
-        self.mImgList = self.scanAllImages(dirpath)
-        self.openNextImg()
-        for imgPath in self.mImgList:
-            item = QListWidgetItem(os.path.basename(imgPath))
-            self.fileListWidget.addItem(item)
-        
-        # 打开目录后更新进度显示
-        self.updateProgressDisplay()
-        self.updateFileListDisplay()
+        self.importDirImages(dirpath)
 
     def verifyImg(self, _value=False):
         # Proceding next image without dialog if having any label
-         if self.filePath is not None:
+         if self.filePath is not None and self.loadingImage is None:
             try:
                 self.labelFile.toggleVerify()
             except AttributeError:
@@ -1764,14 +2109,11 @@ class MainWindow(QMainWindow, WindowMixin):
         if self.filePath is None:
             return
 
-        currIndex = self.mImgList.index(self.filePath)
+        currIndex = self.imageRow(self.filePath)
         if currIndex - 1 >= 0:
             filename = self.mImgList[currIndex - 1]
             if filename:
-                self.loadFile(filename)
-                # 更新进度显示和文件列表显示
-                self.updateProgressDisplay()
-                self.updateFileListDisplay()
+                self.loadFile(filename, asynchronous=True)
 
     def openNextImg(self, _value=False):
         # Proceding next image without dialog if having any label
@@ -1791,15 +2133,12 @@ class MainWindow(QMainWindow, WindowMixin):
         if self.filePath is None:
             filename = self.mImgList[0]
         else:
-            currIndex = self.mImgList.index(self.filePath)
+            currIndex = self.imageRow(self.filePath)
             if currIndex + 1 < len(self.mImgList):
                 filename = self.mImgList[currIndex + 1]
 
         if filename:
-            self.loadFile(filename)
-            # 更新进度显示和文件列表显示
-            self.updateProgressDisplay()
-            self.updateFileListDisplay()
+            self.loadFile(filename, asynchronous=True)
 
     def copyShapesToNextImage(self):
         # 检查是否有下一帧
@@ -1813,7 +2152,9 @@ class MainWindow(QMainWindow, WindowMixin):
             return
         
         # 获取当前帧索引和下一帧文件名
-        currIndex = self.mImgList.index(self.filePath)
+        currIndex = self.imageRow(self.filePath)
+        if currIndex < 0:
+            return
         if currIndex + 1 >= len(self.mImgList):
             # 已经是最后一帧，无法复制到下一帧
             self.status("已经是最后一帧，无法复制到下一帧")
@@ -1843,7 +2184,8 @@ class MainWindow(QMainWindow, WindowMixin):
         # 将选中的标注框添加到新图像
         for shape in selected_shapes:
             self.canvas.shapes.append(shape)
-            self.addLabel(shape)
+            self.addLabel(shape, save_undo=False)
+        self.pushUndo(AddShapes([self.undoEntry(shape) for shape in selected_shapes]))
         
         # 设置为已修改并自动保存
         self.setDirty()
@@ -1863,7 +2205,9 @@ class MainWindow(QMainWindow, WindowMixin):
             return
         
         # 获取当前帧索引和下一帧文件名
-        currIndex = self.mImgList.index(self.filePath)
+        currIndex = self.imageRow(self.filePath)
+        if currIndex < 0:
+            return
         if currIndex + 1 >= len(self.mImgList):
             # 已经是最后一帧，无法复制到下一帧
             self.status("已经是最后一帧，无法复制到下一帧")
@@ -1886,7 +2230,8 @@ class MainWindow(QMainWindow, WindowMixin):
         # 将当前帧的所有标注框添加到新图像
         for shape in current_shapes:
             self.canvas.shapes.append(shape)
-            self.addLabel(shape)
+            self.addLabel(shape, save_undo=False)
+        self.pushUndo(AddShapes([self.undoEntry(shape) for shape in current_shapes]))
         
         # 设置为已修改并自动保存
         self.setDirty()
@@ -1908,21 +2253,20 @@ class MainWindow(QMainWindow, WindowMixin):
             self.loadFile(filename)
 
     def saveFile(self, _value=False):
-        if self.defaultSaveDir is not None and len(ustr(self.defaultSaveDir)):
+        if self.loadingImage is not None:
+            # 图片还没解码完，画布上没有它的标注，保存会用空标注覆盖已有的 XML
+            return
+        if self.defaultSaveDir:
             if self.filePath:
-                imgFileName = os.path.basename(self.filePath)
-                savedFileName = os.path.splitext(imgFileName)[0] + XML_EXT
-                savedPath = os.path.join(ustr(self.defaultSaveDir), savedFileName)
-                self._saveFile(savedPath)
+                self._saveFile(self.xmlPathForImage(self.filePath))
         else:
-            imgFileDir = os.path.dirname(self.filePath)
-            imgFileName = os.path.basename(self.filePath)
-            savedFileName = os.path.splitext(imgFileName)[0] + XML_EXT
-            savedPath = os.path.join(imgFileDir, savedFileName)
+            savedPath = self.xmlPathForImage(self.filePath)
             self._saveFile(savedPath if self.labelFile
                            else self.saveFileDialog())
 
     def saveFileAs(self, _value=False):
+        if self.loadingImage is not None:
+            return
         assert not self.image.isNull(), "cannot save empty image"
         self._saveFile(self.saveFileDialog())
 
@@ -1941,13 +2285,195 @@ class MainWindow(QMainWindow, WindowMixin):
         return ''
 
     def _saveFile(self, annotationFilePath):
-        if annotationFilePath and self.saveLabels(annotationFilePath):
-            self.setClean()
+        if not annotationFilePath:
+            return
+        if self.usingPascalVocFormat is not True:
+            seq = self.journalSave(annotationFilePath)
+            if self.saveLabels(annotationFilePath):
+                self.setClean()
+                self.onSaveFinished(ustr(annotationFilePath), None)
+                if seq is not None:
+                    self.journal.markSaved(self.filePath, seq, fileStamp(annotationFilePath))
+            return
+        # 交出快照后立即返回，写完由 onSaveFinished / onSaveFailed 处理
+        job = self.saveSnapshot(annotationFilePath)
+        seq = self.journalSave(job.xmlPath)
+        if seq is not None:
+            self._journalSaves[job.xmlPath] = (job, job.imagePath, seq)
+        self.saveQueue.submit(job.xmlPath, job)
+        self.setClean()
+        self.status(u'正在保存 %s' % job.xmlPath)
+
+    def onSaveFinished(self, annotationFilePath, job, written=True):
+        saved = self.popJournalSave(annotationFilePath, job)
+        if saved is not None:
+            self.journal.markSaved(saved[1], saved[2], fileStamp(annotationFilePath))
+        img_path = job.imagePath if job is not None else self.filePath
+        if written:
+            # 自己写出的文件不再由目录监视当作外部修改
+            self.xmlWatcher.noteWritten(annotationFilePath, fileStamp(annotationFilePath))
             self.statusBar().showMessage('Saved to  %s' % annotationFilePath)
-            self.statusBar().show()
-            # 保存后更新进度显示
-            self.updateProgressDisplay()
-            self.updateFileListDisplay()
+            entry = LabelFile.fingerprints.get(annotationFilePath)
+            if entry is not None and self.projectManifest is not None:
+                self.projectManifest.setFingerprint(annotationFilePath, entry[0], entry[1])
+        else:
+            # 内容与磁盘上相同，文件和修改时间都保持不变
+            self.statusBar().showMessage(u'标注未变化，未重写 %s' % annotationFilePath)
+        self.statusBar().show()
+        # 保存后只更新这一个 XML 对应的标注状态
+        self.refreshAnnotationStatus(img_path, xml_path=annotationFilePath, exists=True)
+        shapes = None
+        if job is not None:
+            shapes = [(s['label'], s['points'], s['direction'], s['isRotated']) for s in job.shapes]
+        self.recordLabelStats(img_path, annotationFilePath, shapes)
+
+    def popJournalSave(self, annotationFilePath, job):
+        """取出 job 对应的日志记录；已有更新的保存提交时保留记录，等它完成"""
+        saved = self._journalSaves.get(annotationFilePath)
+        if saved is None or saved[0] is not job:
+            return None
+        return self._journalSaves.pop(annotationFilePath)
+
+    def onSaveFailed(self, annotationFilePath, job, message):
+        # 写入失败的修改留在日志中
+        self.popJournalSave(annotationFilePath, job)
+        if job.imagePath == self.filePath and not self.saveQueue.isPending(annotationFilePath):
+            # 仍在当前图片上时标记为未保存，用户可以再次保存
+            self.setDirty()
+        self.errorMessage(u'Error saving label data',
+                          u'<b>%s</b><p>%s</p>' % (annotationFilePath, message))
+
+    def initJournal(self):
+        """新建本会话的日志，并接收异常退出的会话留下的未保存修改"""
+        try:
+            self.journal = AnnotationJournal.create(self.JOURNAL_DIR)
+            images, view = recoverJournals(self.JOURNAL_DIR, exclude=self.journal.path)
+            if images or view:
+                self.journal.adopt(images, view)
+        except (OSError, ValueError) as e:
+            print('Annotation journal disabled: %s' % e)
+            self.journal = None
+            return
+        # 恢复的修改在打开对应图片时重放
+        self._journalRecovered = set(images)
+        if view is not None and os.path.exists(view.get('image') or ''):
+            self._journalView = view
+            if not self.filePath:
+                self.filePath = view['image']
+        if images:
+            self.status(u'已从日志恢复 %d 张图片的未保存修改，打开图片时载入' % len(images), 0)
+        self.zoomWidget.valueChanged.connect(self.scheduleJournalSync)
+        for bar in self.scrollBars.values():
+            bar.valueChanged.connect(self.scheduleJournalSync)
+
+    def scheduleJournalSync(self, *args):
+        """记录后最多 JOURNAL_SYNC_MS 毫秒写到磁盘，期间的多次修改共用一次 fsync"""
+        if self.journal is not None and not self.journalTimer.isActive():
+            self.journalTimer.start()
+
+    def syncJournal(self):
+        if self.journal is None:
+            return
+        if self.filePath and not self.image.isNull():
+            self.journal.setView(self.filePath, self.zoomWidget.value(),
+                                 self.scrollBars[Qt.Horizontal].value(),
+                                 self.scrollBars[Qt.Vertical].value())
+        try:
+            self.journal.sync()
+        except OSError as e:
+            self.status(u'写入标注日志失败: %s' % e)
+
+    def closeJournal(self):
+        if self.journal is None:
+            return
+        if self.dirty and self.filePath:
+            self.journal.discard(self.filePath)
+        self.journalTimer.stop()
+        try:
+            self.journal.close()
+        except OSError:
+            pass
+        self.journal = None
+
+    def journalBegin(self):
+        """当前图片的第一次修改前写入它的 XML 基准"""
+        if self.journal is None or not self.filePath:
+            return False
+        if not self.journal.tracks(self.filePath):
+            self.journal.begin(self.filePath, self.xmlPathForImage(self.filePath), self._journalStamp)
+        self.scheduleJournalSync()
+        return True
+
+    def journalAdd(self, shape):
+        if not self.journalBegin():
+            return
+        shapeId = self.journal.newId()
+        self._journalIds[shape] = [shapeId, shape.direction]
+        self.journal.record(self.filePath, 'add', shapeId, shape=shapeState(
+            shape.label, [(p.x(), p.y()) for p in shape.points],
+            shape.direction, shape.isRotated, shape.difficult))
+
+    def journalDelete(self, shape):
+        entry = self._journalIds.pop(shape, None)
+        if entry is not None and self.journalBegin():
+            self.journal.record(self.filePath, 'delete', entry[0])
+
+    def journalChange(self, shape, op, **fields):
+        entry = self._journalIds.get(shape)
+        if entry is not None and self.journalBegin():
+            self.journal.record(self.filePath, op, entry[0], **fields)
+
+    def journalGeometry(self, shape):
+        """记录形状移动、拖动顶点或旋转后的顶点"""
+        entry = self._journalIds.get(shape)
+        if entry is None:
+            return
+        points = [[p.x(), p.y()] for p in shape.points]
+        if shape.direction != entry[1]:
+            entry[1] = shape.direction
+            self.journalChange(shape, 'rotate', points=points, direction=shape.direction)
+        else:
+            self.journalChange(shape, 'move', points=points)
+
+    def journalSave(self, xmlPath):
+        """开始保存当前图片，之后的操作以保存后的 XML 为基准，形状按画布顺序重新编号"""
+        if self.journal is None or not self.filePath:
+            return None
+        seq = self.journal.markSave(self.filePath, ustr(xmlPath))
+        self._journalIds = dict((shape, [i, shape.direction])
+                                for i, shape in enumerate(self.canvas.shapes))
+        self.scheduleJournalSync()
+        return seq
+
+    def restoreJournal(self, filePath):
+        """打开异常退出前未保存的图片时，在读入的标注上重放日志"""
+        if filePath not in self._journalRecovered:
+            return
+        self._journalRecovered.discard(filePath)
+        edits = self.journal.images.get(filePath) if self.journal is not None else None
+        if edits is None:
+            return
+        self.finishLabelStream()
+        base = [shapeState(s.label, [(p.x(), p.y()) for p in s.points],
+                           s.direction, s.isRotated, s.difficult) for s in self.canvas.shapes]
+        restored = edits.replay(base, self._journalStamp)
+        if restored is None:
+            self.journal.discard(filePath)
+            self.scheduleJournalSync()
+            self.status(u'%s 的标注文件已在别处修改，日志中的修改未恢复' % os.path.basename(filePath))
+            return
+        self.clearAllShapes()
+        self.loadLabels([stateToShape(state) for _, state in restored])
+        self._journalIds = dict((shape, [shapeId, shape.direction])
+                                for shape, (shapeId, _) in zip(self.canvas.shapes, restored))
+        self.setDirty()
+        self.status(u'已恢复 %s 未保存的修改' % os.path.basename(filePath))
+
+    def restoreJournalView(self, view):
+        """恢复异常退出前的滚动位置"""
+        for orientation, key in ((Qt.Horizontal, 'h'), (Qt.Vertical, 'v')):
+            bar = self.scrollBars[orientation]
+            bar.setValue(max(bar.minimum(), min(bar.maximum(), int(view.get(key, 0)))))
 
     def closeFile(self, _value=False):
         if not self.mayContinue():
@@ -2020,14 +2546,12 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.deleteSelectedShape()
 
     def deleteSelectedShape(self):
-        # 在删除前保存撤销操作
-        if self.canvas.selectedShape:
-            self.saveUndoAction("删除标签", self.canvas.selectedShape)
-        
-        # 删除选中的形状
+        # 删除前记下下标和状态，撤销时放回原位
+        entry = self.undoEntry(self.canvas.selectedShape) if self.canvas.selectedShape else None
         deleted_shape = self.canvas.deleteSelected()
         if deleted_shape:
-            self.remLabel(deleted_shape, save_undo=False)  # 不再保存撤销操作，因为已经保存了
+            self.remLabel(deleted_shape)
+            self.pushUndo(DeleteShapes([entry]))
         
         self.setDirty()
         if self.noShapes():
@@ -2064,22 +2588,14 @@ class MainWindow(QMainWindow, WindowMixin):
         if reply != QMessageBox.Yes:
             return
         
-        # 保存撤销状态
-        self.saveUndoAction("批量删除标签")
-        
         # 获取要删除的形状
         shapes_to_delete = []
         for item in selected_items:
             if item in self.itemsToShapes:
                 shapes_to_delete.append(self.itemsToShapes[item])
         
-        # 批量删除
-        for shape in shapes_to_delete:
-            # 从画布中移除
-            if shape in self.canvas.shapes:
-                self.canvas.shapes.remove(shape)
-            # 从标签列表中移除
-            self.remLabel(shape, save_undo=False)  # 不重复保存撤销状态
+        # 批量删除，整批作为一步撤销
+        self.removeShapesWithUndo(shapes_to_delete)
         
         # 更新界面
         self.canvas.update()
@@ -2111,9 +2627,7 @@ class MainWindow(QMainWindow, WindowMixin):
                                    f'确定要删除选中的 {len(selected_shapes)} 个标注框吗？',
                                    QMessageBox.Yes | QMessageBox.No)
         if reply == QMessageBox.Yes:
-            for shape in selected_shapes:
-                self.canvas.deleteShape(shape)
-                self.remLabel(shape)
+            self.removeShapesWithUndo(selected_shapes)
             self.setDirty()
             self.status(f"已删除 {len(selected_shapes)} 个标注框")
 
@@ -2165,7 +2679,11 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def moveShape(self):
         self.canvas.endMove(copy=False)
+        self.pushGeometryChanges()
         self.setDirty()
+        if self.canvas.selectedShape:
+            self.journalGeometry(self.canvas.selectedShape)
+            self.updateOverlapWarning([self.canvas.selectedShape])
 
     def showAutoAnnotateDialog(self):
         """显示半自动标注功能的占位对话框"""
@@ -2185,31 +2703,132 @@ class MainWindow(QMainWindow, WindowMixin):
                     else:
                         self.labelHist.append(line)
 
+    def rebuildAnnotationIndex(self):
+        """图片列表或保存目录变化后重建标注状态索引"""
+        self.annotationIndex.build(self.mImgList)
+        self.xmlWatcher.setDirectories(self.annotationIndex.xmlDirs())
+        self.startDatasetStatistics()
+        self.updateProgressDisplay()
+        self.updateFileListDisplay()
+        self.updateProjectStatistics()
+
+    def refreshAnnotationStatus(self, img_path=None, xml_path=None, exists=None):
+        """单张图片的标注状态可能变化时调用，只更新变化的那一行"""
+        if xml_path is not None:
+            if exists is None:
+                exists = os.path.exists(xml_path)
+            if img_path is not None and os.path.normpath(xml_path) == \
+                    os.path.normpath(self.xmlPathForImage(img_path)):
+                changed = self.annotationIndex.setImageXml(self.imageRow(img_path), img_path, exists)
+            else:
+                changed = self.annotationIndex.setXmlExists(xml_path, exists)
+        elif img_path is not None:
+            changed = self.annotationIndex.refresh(img_path, self.imageRow(img_path))
+        else:
+            changed = []
+        self.showAnnotationChanges(changed)
+
+    def onAnnotationFilesChanged(self, changes):
+        """目录监视发现 XML 被创建、修改或删除"""
+        changed = []
+        items = []
+        for xml_path, exists in changes:
+            changed.extend(self.annotationIndex.setXmlExists(xml_path, exists))
+            for row in self.annotationIndex.rowsOf(AnnotationIndex.normPath(xml_path)):
+                items.append((self.mImgList[row], xml_path))
+        self.showAnnotationChanges(changed)
+        # 被修改或删除的 XML 重新生成摘要，已是最新的（如本程序刚保存的）会被跳过
+        self.statsAggregator.update(
+            items, dict((img, self.datasetStats.stampFor(img)) for img, _ in items),
+            self.projectManifest)
+
+    def showAnnotationChanges(self, rows):
+        self.updateProgressDisplay()
+        if rows and self.projectManifest is not None:
+            self.projectManifest.setAnnotated(
+                [(self.mImgList[row], self.annotationIndex.isAnnotated(row)) for row in rows])
+        if rows:
+            self.updateFileListDisplay(rows)
+            self.updateProjectStatistics()
+
+    def recordImageInfo(self, img_path, size):
+        """图片尺寸写入项目清单，文件未变化时不重复写"""
+        if self.projectManifest is None:
+            return
+        stamp = fileStamp(img_path)
+        if self.projectManifest.imageInfo(img_path, stamp) != (size.width(), size.height()):
+            self.projectManifest.setImageInfo(img_path, stamp, size.width(), size.height())
+
+    def recordLabelStats(self, img_path, xml_path, shapes=None):
+        """图片的标签摘要计入数据集统计并写入项目清单，XML 未变化时跳过
+
+        shapes 为 (label, points, direction, isRotated) 列表，缺省时取画布上的形状。
+        """
+        if not img_path or self.imageRow(img_path) < 0:
+            return
+        stamp = fileStamp(xml_path)
+        if stamp is None or self.datasetStats.stampFor(img_path) == stamp:
+            return
+        if shapes is None:
+            shapes = [(shape.label, [(p.x(), p.y()) for p in shape.points],
+                       shape.direction, shape.isRotated) for shape in self.canvas.shapes]
+        summary = summarizeShapes(shapes, stamp)
+        self.datasetStats.setSummary(img_path, summary)
+        if self.projectManifest is not None:
+            self.projectManifest.setLabelStats(img_path, summary.toRow())
+        self.scheduleDatasetStatistics()
+
+    def startDatasetStatistics(self):
+        """为所有已标注图片重新汇总数据集统计，缓存未过期的摘要直接从项目清单读出"""
+        self.statsAggregator.reset()
+        self.datasetStats.clear()
+        items = [(path, self.xmlPathForImage(path))
+                 for row, path in enumerate(self.mImgList)
+                 if self.annotationIndex.isAnnotated(row)]
+        self.statsAggregator.update(items, {}, self.projectManifest)
+        self.scheduleDatasetStatistics()
+
+    def onLabelSummaries(self, generation, results):
+        if not self.statsAggregator.isCurrent(generation):
+            return
+        for img_path, summary in results:
+            self.datasetStats.setSummary(img_path, summary)
+        self.scheduleDatasetStatistics()
+
+    def scheduleDatasetStatistics(self):
+        if not self.datasetStatsTimer.isActive():
+            self.datasetStatsTimer.start()
+
+    def updateDatasetStatistics(self):
+        """显示数据集统计：类别数量、旋转框比例、尺寸和角度分布"""
+        stats = self.datasetStats
+        # 各类别的数量显示在标签分类统计表格的“数据集”一列
+        self.labelStatsModel.setDatasetCounts(stats.labels)
+        if not stats.total:
+            self.datasetStatsLabel.setText("尚未统计" if not len(stats) else "标注框总数: 0")
+            return
+        lines = ["标注文件: %d  标注框: %d" % (len(stats), stats.total),
+                 "旋转框: %d (%.1f%%)  普通框: %d" % (stats.rotated, stats.rotatedRatio() * 100,
+                                                   stats.total - stats.rotated)]
+        lines.append("类别数: %d" % len(stats.labels))
+        sizes = []
+        for i, count in enumerate(stats.sizeHist):
+            if count:
+                upper = SIZE_BINS[i + 1] if i + 1 < len(SIZE_BINS) else None
+                sizes.append("%s: %d" % ("%d-%d" % (SIZE_BINS[i], upper) if upper
+                                         else ">=%d" % SIZE_BINS[i], count))
+        lines.append("尺寸分布: " + ", ".join(sizes))
+        if stats.rotated:
+            angles = ["%d°: %d" % (i * ANGLE_BIN_DEGREES, count)
+                      for i, count in enumerate(stats.angleHist) if count]
+            lines.append("角度分布: " + ", ".join(angles))
+        self.datasetStatsLabel.setText("\n".join(lines))
+
     def calculateAnnotationProgress(self):
         """计算当前目录的标注进度"""
         if not self.mImgList or not self.dirname:
             return 0, 0, 0.0
-            
-        total_images = len(self.mImgList)
-        annotated_count = 0
-        
-        for img_path in self.mImgList:
-            # 生成对应的XML文件路径
-            img_dir = os.path.dirname(img_path)
-            img_name = os.path.basename(img_path)
-            xml_name = os.path.splitext(img_name)[0] + XML_EXT
-            
-            # 检查默认保存目录或图片同目录下是否存在XML文件
-            if self.defaultSaveDir:
-                xml_path = os.path.join(self.defaultSaveDir, xml_name)
-            else:
-                xml_path = os.path.join(img_dir, xml_name)
-                
-            if os.path.exists(xml_path):
-                annotated_count += 1
-                
-        progress_percentage = (annotated_count / total_images * 100) if total_images > 0 else 0.0
-        return annotated_count, total_images, progress_percentage
+        return self.annotationIndex.progress()
     
     def updateProgressDisplay(self):
         """更新进度显示"""
@@ -2223,47 +2842,122 @@ class MainWindow(QMainWindow, WindowMixin):
         else:
             self.progressLabel.setText("")
     
-    def updateFileListDisplay(self):
-        """更新文件列表显示，为已标注的图片添加视觉标识"""
-        if not self.fileListWidget or not self.mImgList:
-            return
-            
-        for i in range(self.fileListWidget.count()):
-            item = self.fileListWidget.item(i)
-            if item:
-                img_path = self.mImgList[i]
-                img_dir = os.path.dirname(img_path)
-                img_name = os.path.basename(img_path)
-                xml_name = os.path.splitext(img_name)[0] + XML_EXT
-                
-                # 检查是否已标注
-                if self.defaultSaveDir:
-                    xml_path = os.path.join(self.defaultSaveDir, xml_name)
-                else:
-                    xml_path = os.path.join(img_dir, xml_name)
-                    
-                if os.path.exists(xml_path):
-                    # 已标注 - 设置为绿色
-                    item.setForeground(QColor(34, 139, 34))  # Forest Green
-                    item.setToolTip(f"已标注: {xml_path}")
-                else:
-                    # 未标注 - 设置为默认颜色
-                    item.setForeground(QColor(0, 0, 0))  # Black
-                    item.setToolTip("未标注")
+    def updateFileListDisplay(self, rows=None):
+        """更新文件列表显示，为已标注的图片添加视觉标识；rows 为空时更新全部"""
+        if self.fileListModel.paths() is not self.mImgList:
+            self.fileListModel.setPaths(self.mImgList)
+        else:
+            self.fileListModel.refreshRows(rows)
+
+    def imageRow(self, img_path):
+        """图片在 mImgList 中的行号，不在列表中时返回 -1"""
+        if self.fileListModel.paths() is not self.mImgList:
+            # 图片列表被整体替换过，同步到文件列表模型
+            self.fileListModel.setPaths(self.mImgList)
+        return self.fileListModel.rowOf(img_path)
+
+    def isImageAnnotated(self, row):
+        return row < len(self.annotationIndex) and self.annotationIndex.isAnnotated(row)
+
+    def annotationTooltip(self, row):
+        return f"已标注: {self.xmlPathForImage(self.mImgList[row])}"
 
     def loadPascalXMLByFilename(self, xmlPath):
         if self.filePath is None:
             return
+        # 这个文件还在后台保存时等它写完，不读到旧内容
+        self.saveQueue.waitFor(xmlPath)
+        # 日志中的操作以此时的 XML 为基准
+        self._journalStamp = fileStamp(xmlPath)
         if os.path.isfile(xmlPath) is False:
             return
 
-        tVocParseReader = PascalVocReader(xmlPath)
-        shapes = tVocParseReader.getShapes()
+        # 预读时已经解析过且文件未变化，直接使用缓存的结果
+        cached = self.imageCache.get(self.filePath)
+        parsed = cached.xmlFor(xmlPath) if cached is not None else None
+        batchSize = self.LABEL_STREAM_BATCH
+        if parsed is None and os.path.getsize(xmlPath) >= self.STREAM_XML_BYTES:
+            reader = PascalVocReader(xmlPath, lazy=True)
+            self.streamLabels(reader.iterShapes(batchSize), lambda: reader.verified, xmlPath)
+            return
+        if parsed is None:
+            tVocParseReader = PascalVocReader(xmlPath)
+            parsed = (tVocParseReader.getShapes(), tVocParseReader.verified)
+        shapes, verified = parsed
+        if len(shapes) > 2 * batchSize:
+            self.streamLabels((shapes[i:i + batchSize] for i in range(0, len(shapes), batchSize)),
+                              lambda: verified, xmlPath)
+            return
         self.loadLabels(shapes)
-        self.canvas.verified = tVocParseReader.verified
-        # 更新进度显示和文件列表显示
+        self.loadLabelsFinished(verified, xmlPath)
+
+    def loadLabelsFinished(self, verified, xmlPath):
+        self.canvas.verified = verified
+        self.recordLabelStats(self.filePath, xmlPath)
+        # 更新进度显示
         self.updateProgressDisplay()
-        self.updateFileListDisplay()
+
+    def streamLabels(self, batches, verifiedFunc, xmlPath):
+        """标注很多时分批加入画布：第一批立即显示，其余每轮事件循环加入一批
+
+        batches 逐批产生 getShapes() 格式的 shapes，verifiedFunc() 在读完后给出 verified。
+        切换图片会放弃未读完的部分，保存前由 finishLabelStream 读完。
+        """
+        self._labelStream = (batches, verifiedFunc, xmlPath)
+        self._labelStreamCount = len(self.canvas.shapes)
+        self._labelStreamClock = QElapsedTimer()
+        self.continueLabelStream(self._labelStream)
+
+    def continueLabelStream(self, stream, drain=False):
+        if stream is None or stream is not self._labelStream:
+            return
+        batches, verifiedFunc, xmlPath = stream
+        try:
+            for batch in batches:
+                self.appendLabels(batch)
+                if not drain:
+                    clock = self._labelStreamClock
+                    if not clock.isValid() or clock.elapsed() >= self.LABEL_STREAM_REPAINT_MS:
+                        self.canvas.update()
+                        clock.start()
+                    self.status(u'正在读取标注: %d 个' % len(self.canvas.shapes), 0)
+                    QTimer.singleShot(0, lambda: self.continueLabelStream(stream))
+                    return
+        except Exception as e:
+            self.status(u'读取 %s 失败: %s' % (os.path.basename(xmlPath), e))
+        self._labelStream = None
+        self.canvas.update()
+        self.status(u'已读取标注: %d 个' % len(self.canvas.shapes))
+        self.updateStatistics()
+        self.updateOverlapWarning()
+        self.loadLabelsFinished(verifiedFunc(), xmlPath)
+
+    def finishLabelStream(self):
+        self.continueLabelStream(self._labelStream, drain=True)
+
+    def appendLabels(self, shapes):
+        """把一批读入的标注加到画布，不做统计和重叠检测
+
+        读取期间用户新画的形状保持在最后，撤销“添加标签”时删除的仍是它。
+        """
+        s = []
+        self.labelList.setUpdatesEnabled(False)
+        self.labelList.blockSignals(True)
+        try:
+            self._buildShapes(shapes, s)
+        finally:
+            self.labelList.blockSignals(False)
+            self.labelList.setUpdatesEnabled(True)
+        if s:
+            for action in self.actions.onShapesPresent:
+                action.setEnabled(True)
+        start = self._labelStreamCount
+        if start >= len(self.canvas.shapes):
+            self.canvas.shapes.extend(s)
+        else:
+            for i, shape in enumerate(s):
+                self.canvas.shapes.insert(start + i, shape)
+        self._labelStreamCount = start + len(s)
 
     def handleDoubleClickZoom(self, click_pos):
         """处理双击画布的放大/缩小功能"""
@@ -2380,96 +3074,154 @@ class MainWindow(QMainWindow, WindowMixin):
         self.color_index = 0
 
     def initUndoSystem(self):
-        """初始化撤销系统"""
-        self.undo_stack = []  # 撤销栈
-        self.max_undo_steps = 20  # 最大撤销步数
-    
-    def clearUndoStack(self):
-        """清空撤销栈"""
-        self.undo_stack.clear()
-        
-    def saveUndoAction(self, action_type, shape=None, shape_data=None):
-        """保存撤销操作信息"""
-        if shape:
-            # 保存形状的完整信息
-            shape_info = {
-                'label': shape.label,
-                'points': [QPointF(p.x(), p.y()) for p in shape.points],
-                'line_color': QColor(shape.line_color),
-                'fill_color': QColor(shape.fill_color),
-                'difficult': shape.difficult if hasattr(shape, 'difficult') else False,
-                'isRotated': shape.isRotated if hasattr(shape, 'isRotated') else False,
-                'direction': shape.direction if hasattr(shape, 'direction') else 0,
-                'center': shape.center if hasattr(shape, 'center') else None
-            }
+        """初始化撤销系统：每张图片一个命令栈，切换图片后保留，总内存受 UNDO_HISTORY_BYTES 限制"""
+        self.undoHistory = UndoHistory(self.UNDO_HISTORY_BYTES)
+        # 撤销、重做执行命令期间不再记录新的命令
+        self._undoApplying = False
+
+    def undoCheck(self):
+        """画布形状的校验值，离开图片时记下，回到图片后据此确认命令栈中的下标仍然有效"""
+        return (len(self.canvas.shapes), hash(tuple(s.label for s in self.canvas.shapes)))
+
+    def leaveUndoHistory(self):
+        """离开当前图片：未保存的修改被放弃时一并丢弃它的撤销历史"""
+        if not self.filePath:
+            return
+        stack = self.undoHistory.stackFor(self.filePath)
+        if stack is None:
+            return
+        if self.dirty:
+            self.undoHistory.drop(self.filePath)
         else:
-            shape_info = shape_data
-        
-        # 创建撤销操作
-        undo_action = {
-            'action_type': action_type,
-            'shape_info': shape_info
-        }
-        
-        # 添加到撤销栈
-        self.undo_stack.append(undo_action)
-        
-        # 限制撤销栈大小
-        if len(self.undo_stack) > self.max_undo_steps:
-            self.undo_stack.pop(0)
-    
+            stack.check = self.undoCheck()
+
+    def shapeIndex(self, shape):
+        shapes = self.canvas.shapes
+        # 新加的形状通常在最后
+        if shapes and shapes[-1] is shape:
+            return len(shapes) - 1
+        return shapes.index(shape)
+
+    def undoEntry(self, shape, index=None):
+        """撤销命令中一个形状的 (下标, 状态)"""
+        if index is None:
+            index = self.shapeIndex(shape)
+        return (index, (shape.label, [(p.x(), p.y()) for p in shape.points],
+                        shape.direction, shape.isRotated, shape.difficult))
+
+    def pushUndo(self, command):
+        if self._undoApplying or not self.filePath:
+            return
+        # 命令按完整的形状列表记录下标，读取中的标注先读完
+        self.finishLabelStream()
+        self.undoHistory.push(self.filePath, command)
+
+    def pushGeometryChanges(self):
+        """把画布记下的修改前几何与当前几何比较，为变化的形状记录撤销命令"""
+        origins = self.canvas.takeMoveOrigins()
+        if not origins or self._undoApplying:
+            return
+        index = dict((shape, i) for i, shape in enumerate(self.canvas.shapes)) \
+            if len(origins) > 1 else None
+        for shape, (points, direction) in origins.items():
+            current = [(p.x(), p.y()) for p in shape.points]
+            if current == points and shape.direction == direction:
+                continue
+            i = index.get(shape) if index is not None else \
+                (self.shapeIndex(shape) if shape in self.shapesToItems else None)
+            if i is None:
+                continue
+            self.pushUndo(ChangeGeometry(i, points, current, direction, shape.direction))
+
+    def removeShapesWithUndo(self, shapes):
+        """从画布删除一批形状，作为一步撤销，返回删除的个数"""
+        index = dict((shape, i) for i, shape in enumerate(self.canvas.shapes))
+        entries = [self.undoEntry(shape, index[shape]) for shape in shapes if shape in index]
+        if not entries:
+            return 0
+        removed = set(id(shape) for shape in shapes)
+        if self.canvas.selectedShape is not None and id(self.canvas.selectedShape) in removed:
+            self.canvas.selectedShape = None
+        self.canvas.shapes = [s for s in self.canvas.shapes if id(s) not in removed]
+        for shape in shapes:
+            if shape in index:
+                self.remLabel(shape)
+        self.pushUndo(DeleteShapes(entries))
+        self.canvas.update()
+        return len(entries)
+
+    # 撤销命令调用的编辑接口，下标均为画布 shapes 中的位置
+
+    def insertShapes(self, entries):
+        for index, (label, points, direction, isRotated, difficult) in entries:
+            shape = Shape(label=label)
+            for x, y in points:
+                shape.addPoint(QPointF(x, y))
+            shape.direction = direction
+            shape.isRotated = isRotated
+            shape.difficult = difficult
+            shape.close()
+            self.canvas.shapes.insert(index, shape)
+            self.addLabel(shape, save_undo=False, row=index)
+
+    def removeShapes(self, indices):
+        for index in sorted(indices, reverse=True):
+            shape = self.canvas.shapes.pop(index)
+            if shape is self.canvas.selectedShape:
+                self.canvas.selectedShape = None
+            self.remLabel(shape)
+
+    def setShapeGeometry(self, index, points, direction):
+        shape = self.canvas.shapes[index]
+        shape.points = [QPointF(x, y) for x, y in points]
+        shape.direction = direction
+        shape.close()
+        self.journalGeometry(shape)
+        self.updateOverlapWarning([shape])
+
+    def setShapeLabel(self, index, label):
+        self.shapesToItems[self.canvas.shapes[index]].setText(label)
+
     def undo(self):
         """执行撤销操作"""
-        if not self.undo_stack:
-            self.status("没有可撤销的操作")
-            return
-        
-        # 获取最后一个操作
-        last_action = self.undo_stack.pop()
-        action_type = last_action['action_type']
-        shape_info = last_action['shape_info']
-        
-        if action_type == "添加标签":
-            # 撤销添加：找到并删除最后添加的形状
-            if self.canvas.shapes:
-                last_shape = self.canvas.shapes[-1]
-                self.canvas.shapes.remove(last_shape)
-                self.remLabel(last_shape, save_undo=False)
-                self.canvas.update()
-                self.status("已撤销添加操作")
-        
-        elif action_type == "删除标签":
-            # 撤销删除：重新创建被删除的形状
-            if shape_info:
-                restored_shape = self.createShapeFromInfo(shape_info)
-                self.canvas.shapes.append(restored_shape)
-                self.addLabel(restored_shape, save_undo=False)
-                self.canvas.update()
-                self.status("已撤销删除操作")
-        
-        else:
-             self.status(f"已撤销操作: {action_type}")
-    
-    def createShapeFromInfo(self, shape_info):
-        """从保存的信息重新创建形状"""
-        # 创建新形状
-        if shape_info.get('isRotated', False):
-            shape = Shape(label=shape_info['label'], line_color=shape_info['line_color'])
-            shape.isRotated = True
-        else:
-            shape = Shape(label=shape_info['label'], line_color=shape_info['line_color'])
-        
-        # 设置形状属性
-        shape.points = shape_info['points']
-        shape.line_color = shape_info['line_color']
-        shape.fill_color = shape_info['fill_color']
-        shape.difficult = shape_info.get('difficult', False)
-        shape.direction = shape_info.get('direction', 0)
-        if shape_info.get('center'):
-            shape.center = shape_info['center']
-        
-        return shape
-    
+        self.applyUndo(self.undoHistory.undo, u'撤销', u'没有可撤销的操作')
+
+    def redo(self):
+        """重做上一次撤销的操作"""
+        self.applyUndo(self.undoHistory.redo, u'重做', u'没有可重做的操作')
+
+    def applyUndo(self, step, verb, emptyMessage):
+        # 还没结算的拖动先成为一条命令
+        self.flushMovedShapes()
+        stack = self.undoHistory.stackFor(self.filePath) if self.filePath else None
+        if stack is None:
+            self.status(emptyMessage)
+            return
+        self.finishLabelStream()
+        if stack.check is not None:
+            if stack.check != self.undoCheck():
+                # 离开期间标注已在别处修改，命令中的下标不再可靠
+                self.undoHistory.drop(self.filePath)
+                self.status(u'标注已变化，撤销历史已清除')
+                return
+            stack.check = None
+        self._undoApplying = True
+        try:
+            command = step(self.filePath, self)
+        except (IndexError, KeyError):
+            self.undoHistory.drop(self.filePath)
+            self.status(u'撤销历史与标注不一致，已清除')
+            return
+        finally:
+            self._undoApplying = False
+        if command is None:
+            self.status(emptyMessage)
+            return
+        self.setDirty()
+        self.updateStatistics()
+        self.canvas.update()
+        self.status(u'已%s: %s' % (verb, command.text))
+
     def clearAllShapes(self):
         """清空所有形状"""
         # 清空画布上的形状
@@ -2486,183 +3238,73 @@ class MainWindow(QMainWindow, WindowMixin):
         self.updateStatistics()
         self.updateOverlapWarning()
     
-    def restoreShapesFromState(self, shapes_data):
-        """从状态数据恢复形状"""
-        # 清空当前形状
-        self.clearAllShapes()
-        
-        # 恢复形状
-        for shape_data in shapes_data:
-            # 创建新形状
-            if shape_data.get('isRotated', False):
-                shape = Shape(label=shape_data['label'], line_color=shape_data['line_color'])
-                shape.isRotated = True
-            else:
-                shape = Shape(label=shape_data['label'], line_color=shape_data['line_color'])
-            
-            # 设置形状属性
-            shape.points = shape_data['points']
-            shape.line_color = shape_data['line_color']
-            shape.fill_color = shape_data['fill_color']
-            shape.difficult = shape_data.get('difficult', False)
-            shape.direction = shape_data.get('direction', 0)
-            
-            # 添加到画布和标签列表
-            self.canvas.shapes.append(shape)
-            self.addLabel(shape, save_undo=False)  # 恢复时不保存撤销状态
-        
-        # 更新界面
-        self.canvas.update()
+    def checkOverlappingBoxes(self, changedShapes=None, full=False):
+        """检测重叠的标注框
 
-    def checkOverlappingBoxes(self):
-        """检测重叠的标注框"""
+        changedShapes 为几何发生变化的形状，只对它们和网格邻居重新判定；
+        full=True 时整体重建索引。
+        """
         if not hasattr(self, 'canvas') or not self.canvas.shapes:
+            self.overlapIndex.clear()
             return []
-        
+
         shapes = self.canvas.shapes
-        overlapping_pairs = []
-        
-        # 首先清除所有形状的重叠状态
+        # 与原来一样，每次检测前清除所有最近复制标记
         for shape in shapes:
-            if hasattr(shape, 'is_overlapping'):
-                shape.is_overlapping = False
-            # 清除最近复制标记（在用户移动框后）
-            if hasattr(shape, 'is_recently_copied'):
-                shape.is_recently_copied = False
-        
-        # 检查每对标注框是否重叠
-        for i in range(len(shapes)):
-            for j in range(i + 1, len(shapes)):
-                shape1 = shapes[i]
-                shape2 = shapes[j]
-                
-                if self.isOverlapping(shape1, shape2):
-                    overlapping_pairs.append((i, j, shape1, shape2))
-                    # 标记重叠的形状
-                    if hasattr(shape1, 'is_overlapping'):
-                        shape1.is_overlapping = True
-                    if hasattr(shape2, 'is_overlapping'):
-                        shape2.is_overlapping = True
-        
-        return overlapping_pairs
-    
+            shape.is_recently_copied = False
+        if full:
+            changed = self.overlapIndex.rebuild(shapes)
+        else:
+            # 同步新增/删除的形状，再复查几何变化的形状
+            changed = self.overlapIndex.sync(shapes)
+            for shape in changedShapes or ():
+                if shape in self.overlapIndex:
+                    changed |= self.overlapIndex.update(shape)
+
+        # 只刷新重叠状态可能改变的形状
+        for shape in changed:
+            shape.is_overlapping = self.overlapIndex.isOverlapping(shape)
+
+        return self.overlapIndex.pairs(shapes)
+
+    def shapeBounds(self, shape):
+        """空间索引使用的包围盒 (x1, y1, x2, y2)"""
+        rect = shape.boundingRect()
+        return (rect.left(), rect.top(), rect.right(), rect.bottom())
+
+    def _overlapTest(self, shape1, shape2):
+        """空间索引的窄相位判定"""
+        return self._overlapBatch(shape1, [shape2])[0]
+
     def isOverlapping(self, shape1, shape2):
         """判断两个标注框是否重叠"""
-        try:
-            # 排除最近复制的框，避免误判
-            if (hasattr(shape1, 'is_recently_copied') and shape1.is_recently_copied) or \
-               (hasattr(shape2, 'is_recently_copied') and shape2.is_recently_copied):
-                return False
-            
-            # 获取两个形状的边界矩形
-            rect1 = shape1.boundingRect()
-            rect2 = shape2.boundingRect()
-            
-            # 检查边界矩形是否相交
-            if not rect1.intersects(rect2):
-                return False
-            
-            # 对于旋转框，需要更精确的检测
-            if (hasattr(shape1, 'isRotated') and shape1.isRotated) or \
-               (hasattr(shape2, 'isRotated') and shape2.isRotated):
-                return self.checkRotatedBoxOverlap(shape1, shape2)
-            else:
-                # 普通矩形框的重叠检测
-                return self.checkRectangleOverlap(shape1, shape2)
-                
-        except Exception as e:
-            print(f"重叠检测错误: {e}")
-            return False
-    
-    def checkRectangleOverlap(self, shape1, shape2):
-        """检测普通矩形框的重叠"""
-        try:
-            rect1 = shape1.boundingRect()
-            rect2 = shape2.boundingRect()
-            
-            # 计算重叠面积
-            intersection = rect1.intersected(rect2)
-            if intersection.isEmpty():
-                return False
-            
-            # 计算重叠比例（重叠面积 / 较小框面积）
-            area1 = rect1.width() * rect1.height()
-            area2 = rect2.width() * rect2.height()
-            overlap_area = intersection.width() * intersection.height()
-            
-            min_area = min(area1, area2)
-            overlap_ratio = overlap_area / min_area if min_area > 0 else 0
-            
-            # 重叠比例超过10%认为是重叠
-            return overlap_ratio > 0.1
-            
-        except Exception as e:
-            print(f"矩形重叠检测错误: {e}")
-            return False
-    
-    def checkRotatedBoxOverlap(self, shape1, shape2):
-        """检测旋转框的重叠（使用SAT算法）"""
-        try:
-            # 获取两个形状的顶点
-            points1 = shape1.points if hasattr(shape1, 'points') else []
-            points2 = shape2.points if hasattr(shape2, 'points') else []
-            
-            if len(points1) < 4 or len(points2) < 4:
-                return False
-            
-            # 使用分离轴定理(SAT)检测旋转矩形重叠
-            return self.separatingAxisTheorem(points1, points2)
-            
-        except Exception as e:
-            print(f"旋转框重叠检测错误: {e}")
-            return False
-    
-    def separatingAxisTheorem(self, points1, points2):
-        """分离轴定理检测多边形重叠"""
-        try:
-            def getAxes(points):
-                """获取多边形的所有边的法向量作为分离轴"""
-                axes = []
-                for i in range(len(points)):
-                    p1 = points[i]
-                    p2 = points[(i + 1) % len(points)]
-                    edge = QPointF(p2.x() - p1.x(), p2.y() - p1.y())
-                    # 法向量（垂直于边）
-                    normal = QPointF(-edge.y(), edge.x())
-                    # 归一化
-                    length = (normal.x() ** 2 + normal.y() ** 2) ** 0.5
-                    if length > 0:
-                        axes.append(QPointF(normal.x() / length, normal.y() / length))
-                return axes
-            
-            def projectPolygon(points, axis):
-                """将多边形投影到轴上"""
-                dots = [point.x() * axis.x() + point.y() * axis.y() for point in points]
-                return min(dots), max(dots)
-            
-            # 获取两个多边形的所有分离轴
-            axes = getAxes(points1) + getAxes(points2)
-            
-            # 检查每个轴上的投影是否分离
-            for axis in axes:
-                min1, max1 = projectPolygon(points1, axis)
-                min2, max2 = projectPolygon(points2, axis)
-                
-                # 如果在某个轴上分离，则不重叠
-                if max1 < min2 or max2 < min1:
-                    return False
-            
-            # 所有轴上都有重叠，则两个多边形重叠
-            return True
-            
-        except Exception as e:
-            print(f"SAT算法错误: {e}")
+        # 排除最近复制的框，避免误判
+        if getattr(shape1, 'is_recently_copied', False) or \
+           getattr(shape2, 'is_recently_copied', False):
             return False
+        return self._overlapBatch(shape1, [shape2])[0]
+
+    def _overlapBatch(self, shape, others):
+        """一个框与一批候选框的窄相位判定（向量化）
+
+        普通框要求重叠面积超过较小框的 10%，旋转框使用分离轴定理。
+        """
+        result = np.zeros(len(others), dtype=bool)
+        if len(shape.points) != 4:
+            return result.tolist()
+        index = [i for i, other in enumerate(others) if len(other.points) == 4]
+        if index:
+            corners = np.array([others[i].cornerArray() for i in index])
+            rotated = [others[i].isRotated for i in index]
+            result[index] = overlapWith(shape.cornerArray(), shape.isRotated,
+                                        corners, rotated, minRatio=0.1)
+        return result.tolist()
+
     
-    def updateOverlapWarning(self):
+    def updateOverlapWarning(self, changedShapes=None):
         """更新重叠警告信息"""
         try:
-            overlapping_pairs = self.checkOverlappingBoxes()
+            overlapping_pairs = self.checkOverlappingBoxes(changedShapes)
             
             if overlapping_pairs:
                 warning_msg = f"⚠️ 检测到 {len(overlapping_pairs)} 对重叠标注框"
@@ -2686,13 +3328,19 @@ class MainWindow(QMainWindow, WindowMixin):
                 self.overlapWarningLabel.setText(f"⚠️ {len(overlapping_pairs)}对重叠")
                 self.overlapWarningLabel.setVisible(True)
                 
-                # 打印详细信息到控制台
-                print(f"检测到重叠标注框:")
-                for i, (idx1, idx2, shape1, shape2) in enumerate(overlapping_pairs):
+                # 打印详细信息到控制台，只打印新出现的重叠对
+                reported = set((shape1, shape2) for _, _, shape1, shape2 in overlapping_pairs)
+                fresh = [pair for pair in overlapping_pairs
+                         if (pair[2], pair[3]) not in self._reportedOverlaps]
+                self._reportedOverlaps = reported
+                if fresh:
+                    print(f"检测到重叠标注框:")
+                for i, (idx1, idx2, shape1, shape2) in enumerate(fresh):
                     label1 = getattr(shape1, 'label', '未命名')
                     label2 = getattr(shape2, 'label', '未命名')
                     print(f"  {i+1}. 标注框 {idx1+1}({label1}) 与 标注框 {idx2+1}({label2}) 重叠")
             else:
+                self._reportedOverlaps = set()
                 # 没有重叠，隐藏警告
                 if hasattr(self, 'overlapWarningLabel'):
                     self.overlapWarningLabel.setVisible(False)
@@ -2741,7 +3389,7 @@ class MainWindow(QMainWindow, WindowMixin):
             QMessageBox.information(self, "提示", "当前没有标注框可以检测")
             return
         
-        overlapping_pairs = self.checkOverlappingBoxes()
+        overlapping_pairs = self.checkOverlappingBoxes(full=True)
         
         if not overlapping_pairs:
             QMessageBox.information(self, "提示", "未检测到重叠的标注框")
@@ -2770,13 +3418,8 @@ class MainWindow(QMainWindow, WindowMixin):
             else:
                 shapes_to_delete.add(shape2)
         
-        # 执行删除操作 - 修复这里的错误
-        deleted_count = 0
-        for shape in shapes_to_delete:
-            if shape in self.canvas.shapes:  # 确保形状还存在
-                self.canvas.shapes.remove(shape)  # 从canvas中移除
-                self.remLabel(shape)  # 从标签列表中移除
-                deleted_count += 1
+        # 执行删除操作，整批作为一步撤销
+        deleted_count = self.removeShapesWithUndo(shapes_to_delete)
 
         if deleted_count > 0:
             self.setDirty()
@@ -2794,15 +3437,8 @@ class MainWindow(QMainWindow, WindowMixin):
             if hasattr(shape, 'isRotated') and shape.isRotated:
                 # 旋转框：使用顶点计算面积
                 if hasattr(shape, 'points') and len(shape.points) >= 4:
-                    points = shape.points
                     # 使用鞋带公式计算多边形面积
-                    area = 0
-                    n = len(points)
-                    for i in range(n):
-                        j = (i + 1) % n
-                        area += points[i].x() * points[j].y()
-                        area -= points[j].x() * points[i].y()
-                    return abs(area) / 2
+                    return float(polygonArea(shape.cornerArray())[0])
                 else:
                     # 备用方案：使用边界矩形
                     rect = shape.boundingRect()
@@ -2886,6 +3522,8 @@ def get_main_app(argv=[]):
 
 def main(argv=[]):
     '''construct main app and run it'''
+    # 打包后的程序启动批量解析进程时需要
+    multiprocessing.freeze_support()
     app, _win = get_main_app(argv)
     return app.exec_()
 
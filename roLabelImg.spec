@@ -6,7 +6,7 @@ a = Analysis(
     pathex=['libs'],
     binaries=[],
     datas=[('data', 'data'), ('icons', 'icons'), ('libs', 'libs'), ('resources.py', '.')],
-    hiddenimports=['PyQt5', 'PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'lxml.etree', 'resources', 'libs', 'libs.lib', 'libs.shape', 'libs.canvas', 'libs.zoomWidget', 'libs.labelDialog', 'libs.colorDialog', 'libs.labelFile', 'libs.toolBar', 'libs.pascal_voc_io', 'libs.ustr', 'lib', 'shape', 'canvas', 'zoomWidget', 'labelDialog', 'colorDialog', 'labelFile', 'toolBar', 'pascal_voc_io', 'ustr'],
+    hiddenimports=['PyQt5', 'PyQt5.QtCore', 'PyQt5.QtGui', 'PyQt5.QtWidgets', 'lxml.etree', 'resources', 'libs', 'libs.lib', 'libs.shape', 'libs.canvas', 'libs.zoomWidget', 'libs.labelDialog', 'libs.colorDialog', 'libs.labelFile', 'libs.toolBar', 'libs.pascal_voc_io', 'libs.ustr', 'libs.spatialIndex', 'libs.boxGeometry', 'libs.imageLoader', 'libs.tileRenderer', 'libs.annotationIndex', 'libs.dirWatcher', 'libs.fileListModel', 'libs.dirScanner', 'libs.projectManifest', 'libs.datasetStats', 'libs.labelStatsModel', 'libs.vocBatchReader', 'libs.saveQueue', 'libs.annotationJournal', 'libs.annotationFingerprint', 'libs.undoHistory', 'lib', 'shape', 'canvas', 'zoomWidget', 'labelDialog', 'colorDialog', 'labelFile', 'toolBar', 'pascal_voc_io', 'ustr', 'spatialIndex', 'boxGeometry', 'imageLoader', 'tileRenderer', 'annotationIndex', 'dirWatcher', 'fileListModel', 'dirScanner', 'projectManifest', 'datasetStats', 'labelStatsModel', 'vocBatchReader', 'saveQueue', 'annotationJournal', 'annotationFingerprint', 'undoHistory'],
     hookspath=[],
     hooksconfig={},
     runtime_hooks=[],
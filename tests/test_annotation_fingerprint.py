@@ -0,0 +1,73 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from annotationFingerprint import FingerprintStore, changedSince, fingerprint
+from pascal_voc_io import PascalVocWriter
+
+
+class TestAnnotationFingerprint(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'a.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def makeWriter(self, label):
+        writer = PascalVocWriter('tests', 'a', (512, 640, 3))
+        writer.addBndBox(1, 40, 430, 504, label, 0)
+        return writer
+
+    def test_skip_unchanged(self):
+        store = FingerprintStore()
+        self.assertTrue(self.makeWriter('dog').save(self.path, store))
+        mtime = os.stat(self.path).st_mtime_ns
+        self.assertFalse(self.makeWriter('dog').save(self.path, store))
+        self.assertEqual(os.stat(self.path).st_mtime_ns, mtime)
+        self.assertTrue(self.makeWriter('cat').save(self.path, store))
+        with open(self.path, 'rb') as f:
+            self.assertEqual(store.digestFor(self.path), fingerprint(f.read()))
+
+    def test_existing_file_compared_without_record(self):
+        self.makeWriter('dog').save(self.path)
+        # 没有记录的文件读出比较，内容相同不写
+        store = FingerprintStore()
+        self.assertFalse(self.makeWriter('dog').save(self.path, store))
+        self.assertIsNotNone(store.digestFor(self.path))
+        # 在别处改过的文件记录失效，重新写入
+        with open(self.path, 'ab') as f:
+            f.write(b'\n')
+        self.assertIsNone(store.digestFor(self.path))
+        self.assertTrue(self.makeWriter('dog').save(self.path, store))
+
+    def test_recent_stamp_is_not_trusted(self):
+        store = FingerprintStore()
+        self.makeWriter('dog').save(self.path, store)
+        st = os.stat(self.path)
+        # 别人在同一时间片内写入同样大小的内容，(修改时间, 大小) 没有变化
+        with open(self.path, 'rb') as f:
+            other = f.read().replace(b'dog', b'cat')
+        with open(self.path, 'wb') as f:
+            f.write(other)
+        os.utime(self.path, ns=(st.st_atime_ns, st.st_mtime_ns))
+        self.assertTrue(self.makeWriter('dog').save(self.path, store))
+        with open(self.path, 'rb') as f:
+            self.assertIn(b'dog', f.read())
+
+        # 修改时间已过去足够久时直接相信记录，不读文件
+        old = os.stat(self.path).st_mtime_ns - 10 * 10 ** 9
+        os.utime(self.path, ns=(old, old))
+        store.put(self.path, (old, os.stat(self.path).st_size), fingerprint(b'recorded'))
+        self.assertFalse(store.writeIfChanged(self.path, b'recorded', writeFunc=None))
+
+    def test_changed_since(self):
+        self.assertEqual(sorted(changedSince({'a': '1', 'b': '2', 'c': '3'}, {'a': '1', 'b': '0'})),
+                         ['b', 'c'])
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from annotationIndex import AnnotationIndex
+
+
+class TestAnnotationIndex(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.images = []
+        for i in range(4):
+            path = os.path.join(self.tmp, 'img%d.jpg' % i)
+            open(path, 'wb').close()
+            self.images.append(path)
+        for i in (1, 3):
+            open(os.path.join(self.tmp, 'img%d.xml' % i), 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_build_and_update(self):
+        index = AnnotationIndex(lambda p: os.path.splitext(p)[0] + '.xml')
+        index.build(self.images)
+        self.assertEqual([index.isAnnotated(i) for i in range(4)], [False, True, False, True])
+        self.assertEqual(index.progress(), (2, 4, 50.0))
+
+        xml0 = os.path.join(self.tmp, 'img0.xml')
+        self.assertEqual(index.setXmlExists(xml0), [0])
+        self.assertEqual(index.setXmlExists(xml0), [])
+        self.assertEqual(index.annotatedCount(), 3)
+        self.assertEqual(index.setXmlExists(os.path.join(self.tmp, 'other.xml')), [])
+
+        os.remove(os.path.join(self.tmp, 'img3.xml'))
+        self.assertEqual(index.refresh(self.images[3]), [3])
+        self.assertEqual(index.progress()[0], 2)
@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from annotationJournal import AnnotationJournal, readJournal, recoverJournals, shapeState
+
+BOX = [(0, 0), (10, 0), (10, 10), (0, 10)]
+
+
+class TestAnnotationJournal(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def base(self):
+        return [shapeState('a', BOX), shapeState('b', BOX), shapeState('c', BOX)]
+
+    def test_replay_after_crash(self):
+        journal = AnnotationJournal.create(self.tmp)
+        journal.begin('img.jpg', 'img.xml', (1, 100))
+        newId = journal.newId()
+        journal.record('img.jpg', 'add', newId, shape=shapeState('d', BOX))
+        journal.record('img.jpg', 'delete', 0)
+        journal.record('img.jpg', 'relabel', 1, label=u'人')
+        journal.record('img.jpg', 'rotate', newId, points=[[1, 1], [2, 1], [2, 2], [1, 2]], direction=0.5)
+        journal.setView('img.jpg', 150, 10, 20)
+        journal.sync()
+        # 模拟异常退出：不调用 close，只释放锁
+        journal._lockFile.close()
+
+        images, view = recoverJournals(self.tmp)
+        self.assertEqual(view['zoom'], 150)
+        shapes = images['img.jpg'].replay(self.base(), (1, 100))
+        self.assertEqual([s['label'] for _, s in shapes], [u'人', 'c', 'd'])
+        self.assertEqual(shapes[-1][1]['direction'], 0.5)
+        self.assertEqual(shapes[-1][1]['points'][0], [1, 1])
+        # XML 已在别处修改时不重放
+        self.assertIsNone(images['img.jpg'].replay(self.base(), (2, 100)))
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_save_starts_new_base(self):
+        journal = AnnotationJournal.create(self.tmp)
+        journal.begin('img.jpg', 'img.xml', (1, 100))
+        journal.record('img.jpg', 'delete', 0)
+        seq = journal.markSave('img.jpg', 'img.xml')
+        # 保存后按画布顺序重新编号：b 为 0
+        journal.record('img.jpg', 'relabel', 0, label='x')
+        journal.sync()
+        edits, _ = readJournal(journal.path)
+        # 保存没有确认时，XML 仍是旧的则两段都重放
+        shapes = edits['img.jpg'].replay(self.base(), (1, 100))
+        self.assertEqual([s['label'] for _, s in shapes], ['x', 'c'])
+
+        journal.markSaved('img.jpg', seq, (2, 90))
+        journal.sync()
+        edits, _ = readJournal(journal.path)
+        saved = [shapeState('b', BOX), shapeState('c', BOX)]
+        shapes = edits['img.jpg'].replay(saved, (2, 90))
+        self.assertEqual([s['label'] for _, s in shapes], ['x', 'c'])
+        journal.close()
+
+    def test_compact_and_close(self):
+        journal = AnnotationJournal.create(self.tmp)
+        journal.begin('img.jpg', 'img.xml', None)
+        journal.record('img.jpg', 'add', journal.newId(), shape=shapeState('a', BOX))
+        journal.markSaved('img.jpg', journal.markSave('img.jpg', 'img.xml'), (1, 10))
+        # 全部保存后日志被压缩为空
+        self.assertEqual(os.path.getsize(journal.path), 0)
+        self.assertEqual(readJournal(journal.path), ({}, None))
+        journal.begin('other.jpg', 'other.xml', None)
+        journal.record('other.jpg', 'add', journal.newId(), shape=shapeState('a', BOX))
+        journal.discard('other.jpg')
+        journal.close()
+        self.assertEqual(os.listdir(self.tmp), [])
+
+    def test_truncated_line_ignored(self):
+        journal = AnnotationJournal.create(self.tmp)
+        journal.begin('img.jpg', 'img.xml', None)
+        journal.record('img.jpg', 'add', journal.newId(), shape=shapeState('a', BOX))
+        journal.sync()
+        with open(journal.path, 'a') as f:
+            f.write('{"op":"delete","id":-1,"ima')
+        images, _ = readJournal(journal.path)
+        self.assertEqual(len(images['img.jpg'].replay([], None)), 1)
+        # 仍被本进程持有的日志不会被恢复
+        self.assertEqual(recoverJournals(self.tmp), ({}, None))
+        journal.close()
@@ -0,0 +1,45 @@
+from unittest import TestCase
+
+import sys
+import os
+import math
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+import numpy as np
+from boxGeometry import rboxToCorners, cornersToRbox, polygonArea, satOverlap, overlapWith
+
+
+class TestBoxGeometry(TestCase):
+
+    def test_rbox_roundtrip(self):
+        rboxes = np.array([[50, 40, 20, 10, 0.3],
+                           [10, 10, 4, 8, 2.5],
+                           [0, 0, 6, 6, 0]])
+        corners = rboxToCorners(rboxes)
+        self.assertEqual(corners.shape, (3, 4, 2))
+        back = cornersToRbox(corners, directions=rboxes[:, 4])
+        np.testing.assert_allclose(back, rboxes, atol=1e-9)
+        np.testing.assert_allclose(polygonArea(corners), [200, 32, 36])
+
+    def test_matches_scalar_rotation(self):
+        cx, cy, w, h, angle = 30.0, 20.0, 10.0, 4.0, 0.7
+        xp, yp = cx - w / 2, cy - h / 2
+        theta = -angle
+        x = cx + math.cos(theta) * (xp - cx) + math.sin(theta) * (yp - cy)
+        y = cy - math.sin(theta) * (xp - cx) + math.cos(theta) * (yp - cy)
+        p0 = rboxToCorners([cx, cy, w, h, angle])[0, 0]
+        self.assertAlmostEqual(p0[0], x)
+        self.assertAlmostEqual(p0[1], y)
+
+    def test_overlap(self):
+        square = rboxToCorners([0, 0, 10, 10, 0])[0]
+        diamond = rboxToCorners([[12, 0, 10, 10, math.pi / 4],
+                                 [9, 9, 10, 10, math.pi / 4]])
+        self.assertEqual(satOverlap(square, diamond).tolist(), [True, False])
+
+        boxes = rboxToCorners([[9.5, 0, 10, 10, 0], [5, 0, 10, 10, 0], [20, 0, 4, 4, 0]])
+        self.assertEqual(overlapWith(square, False, boxes, [False] * 3).tolist(),
+                         [False, True, False])
+        self.assertEqual(overlapWith(square, True, boxes, [False] * 3).tolist(),
+                         [True, True, False])
@@ -0,0 +1,41 @@
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from datasetStats import DatasetStats, LabelSummary, summarizeShapes, ANGLE_BIN_DEGREES
+
+
+class TestDatasetStats(TestCase):
+
+    def test_summarize_shapes(self):
+        square = [(0, 0), (20, 0), (20, 20), (0, 20)]
+        shapes = [('dog', square, 0, False),
+                  ('dog', [(0, 0), (100, 0), (100, 100), (0, 100)], 0.5, True),
+                  ('', square, 0, False)]
+        summary = summarizeShapes(shapes, (1, 2))
+        self.assertEqual(summary.labels, {'dog': 2, u'未命名': 1})
+        self.assertEqual((summary.total, summary.rotated), (3, 1))
+        self.assertEqual(summary.sizeHist[1], 2)
+        self.assertEqual(summary.sizeHist[3], 1)
+        self.assertEqual(sum(summary.angleHist), 1)
+        self.assertEqual(summary.angleHist[int(28.6 // ANGLE_BIN_DEGREES)], 1)
+
+        row = summary.toRow()
+        self.assertEqual(LabelSummary.fromRow(row).toRow(), row)
+
+    def test_incremental(self):
+        stats = DatasetStats()
+        stats.setSummary('a.jpg', LabelSummary((1, 1), {'dog': 2}, 2, 1))
+        stats.setSummary('b.jpg', LabelSummary((1, 1), {'cat': 1}, 1, 0))
+        self.assertEqual((stats.labels, stats.total, stats.rotated), ({'dog': 2, 'cat': 1}, 3, 1))
+
+        # 同一文件再次保存时替换旧摘要
+        stats.setSummary('a.jpg', LabelSummary((2, 1), {'cat': 1}, 1, 0))
+        self.assertEqual((stats.labels, stats.total, stats.rotated), ({'cat': 2}, 2, 0))
+        self.assertEqual(stats.stampFor('a.jpg'), (2, 1))
+
+        stats.remove('b.jpg')
+        self.assertEqual((len(stats), stats.labels, stats.total), (1, {'cat': 1}, 1))
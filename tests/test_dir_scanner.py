@@ -0,0 +1,48 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from dirScanner import scanImages, ScanManifestStore
+
+
+class TestScanImages(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for name in ('b.JPG', 'a.png', 'sub/c.bmp', 'sub/deep/D.jpeg', 'sub/notes.txt'):
+            path = os.path.join(self.tmp, name)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def expected(self, *names):
+        return [os.path.join(self.tmp, n) for n in names]
+
+    def test_scan_matches_walk_order(self):
+        batches = []
+        images = scanImages(self.tmp, onBatch=lambda paths, dirs: batches.append(list(paths)),
+                            batchSize=2)
+        self.assertEqual(images, self.expected('a.png', 'b.JPG', 'sub/c.bmp', 'sub/deep/D.jpeg'))
+        self.assertEqual(sorted(sum(batches, [])), sorted(images))
+        self.assertIsNone(scanImages(self.tmp, isCancelled=lambda: True))
+
+    def test_manifest_reuse(self):
+        manifest = {}
+        scanImages(self.tmp, manifest)
+        self.assertEqual(len(manifest), 3)
+        # 目录修改时间未变时直接使用清单中的结果
+        manifest[self.tmp][1].append('cached.jpg')
+        self.assertIn(os.path.join(self.tmp, 'cached.jpg'), scanImages(self.tmp, manifest))
+
+        store = ScanManifestStore(os.path.join(self.tmp, 'cache'))
+        store.save(self.tmp, manifest)
+        self.assertEqual(store.load(self.tmp), manifest)
+        self.assertEqual(store.load(os.path.join(self.tmp, 'sub')), {})
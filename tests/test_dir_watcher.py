@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+try:
+    from PyQt5.QtCore import QCoreApplication
+except ImportError:
+    from PyQt4.QtCore import QCoreApplication
+from dirWatcher import DirectoryWatcher
+
+app = QCoreApplication.instance() or QCoreApplication([])
+
+
+class TestDirectoryWatcher(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.write('a.xml', 'a')
+        self.write('skip.jpg', '')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, text):
+        with open(os.path.join(self.tmp, name), 'w') as f:
+            f.write(text)
+
+    def settle(self, watcher):
+        watcher.waitForDone()
+        app.processEvents()
+
+    def test_changes_since_last_listing(self):
+        watcher = DirectoryWatcher('.xml')
+        watcher.setDirectories([self.tmp])
+        self.settle(watcher)
+        received = []
+        watcher.filesChanged.connect(received.append)
+
+        self.write('b.xml', 'b')
+        self.write('a.xml', 'changed')
+        self.write('.b.xml.1.2.tmp', '')
+        os.remove(os.path.join(self.tmp, 'skip.jpg'))
+        watcher.onDirectoryChanged(self.tmp)
+        watcher.flush()
+        self.settle(watcher)
+        self.assertEqual(sorted(received[0]), [(os.path.join(self.tmp, 'a.xml'), True),
+                                               (os.path.join(self.tmp, 'b.xml'), True)])
+
+        os.remove(os.path.join(self.tmp, 'a.xml'))
+        watcher.onDirectoryChanged(self.tmp)
+        watcher.flush()
+        self.settle(watcher)
+        self.assertEqual(received[1], [(os.path.join(self.tmp, 'a.xml'), False)])
+        watcher.flush()
+        self.settle(watcher)
+        self.assertEqual(len(received), 2)
+        watcher.clear()
+        self.assertEqual(watcher.directories(), [])
+
+    def test_own_writes_are_not_reported(self):
+        watcher = DirectoryWatcher('.xml')
+        watcher.setDirectories([self.tmp])
+        self.settle(watcher)
+        received = []
+        watcher.filesChanged.connect(received.append)
+
+        path = os.path.join(self.tmp, 'c.xml')
+        self.write('c.xml', 'c')
+        st = os.stat(path)
+        watcher.noteWritten(path, (st.st_mtime_ns, st.st_size))
+        watcher.onDirectoryChanged(self.tmp)
+        watcher.flush()
+        # 目录自本程序写入后没有别的变化，不再重新列出
+        self.assertFalse(watcher._listing)
+        self.settle(watcher)
+        self.assertEqual(received, [])
+
+        # 清单日志之类的其他文件写入前后登记了目录修改时间，同样不重新列出
+        before = os.stat(self.tmp).st_mtime_ns
+        self.write('.roLabelImg.db-journal', '')
+        os.remove(os.path.join(self.tmp, '.roLabelImg.db-journal'))
+        watcher.noteDirWritten(self.tmp, before, os.stat(self.tmp).st_mtime_ns)
+        watcher.onDirectoryChanged(self.tmp)
+        watcher.flush()
+        self.assertFalse(watcher._listing)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+try:
+    from PyQt5.QtCore import Qt
+except ImportError:
+    from PyQt4.QtCore import Qt
+from fileListModel import FileListModel
+
+
+class TestFileListModel(TestCase):
+
+    def test_lazy_status_and_rows(self):
+        asked = []
+
+        def status(row):
+            asked.append(row)
+            return row % 2 == 1
+
+        model = FileListModel(status, lambda row: 'xml %d' % row)
+        paths = ['/data/%06d.jpg' % i for i in range(1000)]
+        model.setPaths(paths)
+        self.assertEqual(model.rowCount(), 1000)
+        self.assertEqual(asked, [])
+        self.assertEqual(model.rowOf('/data/000500.jpg'), 500)
+        self.assertEqual(model.rowOf('/data/missing.jpg'), -1)
+
+        index = model.index(3)
+        self.assertEqual(model.data(index), '000003.jpg')
+        self.assertEqual(model.data(index, Qt.ForegroundRole), FileListModel.annotatedColor)
+        self.assertEqual(model.data(index, Qt.ToolTipRole), 'xml 3')
+        self.assertEqual(model.data(model.index(4), Qt.ForegroundRole), FileListModel.defaultColor)
+        self.assertEqual(asked, [3, 3, 4])
+
+        changed = []
+        model.dataChanged.connect(lambda a, b: changed.append((a.row(), b.row())))
+        model.refreshRows([7, 2, 7, 5000])
+        self.assertEqual(changed, [(2, 2), (7, 7)])
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+import sys
+import os
+import tempfile
+import shutil
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from imageLoader import ImageCache, CachedImage, fileStamp, ImageShapeCache, withXml
+
+
+class TestImageCache(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def entry(self, name, size):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(b'x' * size)
+        return CachedImage(path, b'x' * size, None, fileStamp(path))
+
+    def test_lru_eviction(self):
+        cache = ImageCache(maxBytes=100)
+        a, b, c = self.entry('a', 40), self.entry('b', 40), self.entry('c', 40)
+        cache.put(a)
+        cache.put(b)
+        self.assertIs(cache.get(a.path), a)
+        cache.put(c)
+        self.assertIn(a.path, cache)
+        self.assertNotIn(b.path, cache)
+        self.assertEqual(cache.totalBytes(), 80)
+        self.assertFalse(cache.put(self.entry('big', 200)))
+
+    def test_modified_file_is_miss(self):
+        cache = ImageCache()
+        a = self.entry('a', 10)
+        cache.put(a)
+        with open(a.path, 'ab') as f:
+            f.write(b'more')
+        self.assertIsNone(cache.get(a.path))
+        self.assertEqual(len(cache), 0)
+
+    def test_xml_refresh_replaces_entry(self):
+        cache = ImageCache()
+        a = self.entry('a', 10)
+        cache.put(a)
+        xmlPath = os.path.join(self.tmp, 'a.xml')
+        shutil.copy(os.path.join(dir_name, 'test.xml'), xmlPath)
+        self.assertIsNone(a.xmlFor(xmlPath))
+        fresh = withXml(a, xmlPath)
+        cache.put(fresh)
+        # 缓存中的原对象不被修改，新对象整体替换它
+        self.assertIsNone(a.xmlShapes)
+        self.assertIs(cache.get(a.path), fresh)
+        self.assertIs(fresh.data, a.data)
+        self.assertIsNotNone(fresh.xmlFor(xmlPath))
+        self.assertEqual(cache.totalBytes(), 10)
+        self.assertIsNone(withXml(a, os.path.join(self.tmp, 'missing.xml')))
+
+    def test_image_shape_from_header(self):
+        path = os.path.join(self.tmp, 'test.bmp')
+        shutil.copy(os.path.join(dir_name, 'test.bmp'), path)
+        shapes = ImageShapeCache()
+        self.assertEqual(shapes.shapeFor(path), [512, 512, 3])
+        self.assertEqual(shapes.get(path, fileStamp(path)), [512, 512, 3])
+        # 文件变化后缓存失效
+        with open(path, 'ab') as f:
+            f.write(b'\0')
+        self.assertIsNone(shapes.get(path, fileStamp(path)))
+        self.assertIsNone(shapes.shapeFor(os.path.join(self.tmp, 'missing.jpg')))
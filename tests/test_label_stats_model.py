@@ -0,0 +1,38 @@
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from labelStatsModel import LabelStatsModel
+
+
+class TestLabelStatsModel(TestCase):
+
+    def test_coalesced_in_place_updates(self):
+        model = LabelStatsModel()
+        changed, inserted, removed = [], [], []
+        model.dataChanged.connect(lambda a, b: changed.append(a.row()))
+        model.rowsInserted.connect(lambda parent, first, last: inserted.append(first))
+        model.rowsRemoved.connect(lambda parent, first, last: removed.append(first))
+
+        model.setCounts({'dog': 1})
+        model.setCounts({'dog': 2, 'cat': 1})
+        model.setDatasetCounts({'dog': 5, 'cat': 3, 'ship': 1})
+        self.assertEqual(model.rowCount(), 0)
+        model.flush()
+        self.assertEqual(model.labels(), ['cat', 'dog', 'ship'])
+        self.assertEqual(inserted, [0, 1, 2])
+        self.assertEqual(model.data(model.index(1, 1)), 2)
+        self.assertEqual(model.data(model.index(1, 2)), 5)
+
+        # 数量变化只刷新对应的行，消失的类别删除
+        del inserted[:]
+        model.setCounts({'dog': 3})
+        model.setDatasetCounts({'dog': 6, 'cat': 3})
+        model.flush()
+        self.assertEqual(model.labels(), ['cat', 'dog'])
+        self.assertEqual((inserted, removed), ([], [2]))
+        self.assertEqual(sorted(changed), [0, 1])
+        self.assertEqual(model.data(model.index(0, 1)), 0)
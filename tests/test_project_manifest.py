@@ -0,0 +1,72 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from projectManifest import ProjectManifest, ManifestStore
+from annotationIndex import AnnotationIndex
+from datasetStats import LabelSummary
+
+
+class TestProjectManifest(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_roundtrip(self):
+        paths = [os.path.join(self.tmp, '%d.jpg' % i) for i in range(3)]
+        manifest = ProjectManifest.open(self.tmp)
+        manifest.saveImages(paths, [0, 1, 0])
+        manifest.setImageInfo(paths[1], (10, 20), 640, 480)
+        summary = LabelSummary((11, 30), {'dog': 2, 'cat': 1}, 3, 1)
+        manifest.setLabelStats(paths[1], summary.toRow())
+        manifest.setAnnotated([(paths[2], True)])
+        manifest.close()
+
+        manifest = ProjectManifest.open(self.tmp)
+        # 清单可能在网络盘上，不能使用 WAL
+        self.assertEqual(manifest.conn.execute('PRAGMA journal_mode').fetchone()[0], 'delete')
+        self.assertEqual(manifest.images(), (paths, bytearray([0, 1, 1])))
+        self.assertEqual(manifest.imageInfo(paths[1], (10, 20)), (640, 480))
+        self.assertIsNone(manifest.imageInfo(paths[1], (12, 20)))
+        loaded = LabelSummary.fromRow(manifest.labelStatsFor(paths[1]))
+        self.assertEqual((loaded.stamp, loaded.labels, loaded.total, loaded.rotated),
+                         ((11, 30), {'dog': 2, 'cat': 1}, 3, 1))
+
+        # 重新保存列表时保留已有图片的尺寸和统计
+        manifest.saveImages(paths[1:], [1, 1])
+        # 写入在后台提交，flush 后才能读到
+        manifest.flush()
+        self.assertEqual(manifest.images()[0], paths[1:])
+        self.assertEqual(list(manifest.loadLabelStats()), [paths[1]])
+        self.assertEqual(list(manifest.loadLabelStats([paths[0], paths[2]])), [])
+        manifest.close()
+
+        store = ManifestStore()
+        store.save(self.tmp, {self.tmp: [1, ['a.jpg'], []]})
+        self.assertEqual(store.load(self.tmp), {self.tmp: [1, ['a.jpg'], []]})
+
+    def test_fingerprints(self):
+        manifest = ProjectManifest.open(self.tmp)
+        manifest.setFingerprint('a.xml', (10, 20), 'abc')
+        manifest.close()
+        manifest = ProjectManifest.open(self.tmp)
+        self.assertEqual(manifest.fingerprints(), {'a.xml': ((10, 20), 'abc')})
+        manifest.close()
+
+    def test_known_flags_skip_listing(self):
+        paths = [os.path.join(self.tmp, '%d.jpg' % i) for i in range(3)]
+        index = AnnotationIndex(lambda p: os.path.splitext(p)[0] + '.xml')
+        index.build(paths, bytearray([1, 0, 1]))
+        self.assertEqual(index.progress()[0], 2)
+        self.assertEqual(index.setImageXml(1, paths[1], True), [1])
+        self.assertEqual(index.xmlDirs(), [os.path.normcase(self.tmp)])
+        self.assertEqual(index.setXmlExists(os.path.join(self.tmp, '0.xml'), False), [0])
+        self.assertEqual(index.flags(), bytes([0, 1, 1]))
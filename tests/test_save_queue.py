@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+import threading
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+try:
+    from PyQt5.QtCore import QCoreApplication
+except ImportError:
+    from PyQt4.QtCore import QCoreApplication
+from saveQueue import SaveJob, SaveQueue
+from pascal_voc_io import PascalVocReader, writeFileAtomic
+
+app = QCoreApplication.instance() or QCoreApplication([])
+
+
+class TestSaveQueue(TestCase):
+
+    def test_coalesce_pending_saves(self):
+        started = threading.Event()
+        gate = threading.Event()
+        written = []
+
+        def write(job):
+            started.set()
+            gate.wait(5)
+            written.append((job.xmlPath, job.shapes))
+
+        queue = SaveQueue(write)
+        queue.submit('a.xml', SaveJob('a.xml', 'a.jpg', ['first'], None))
+        self.assertTrue(started.wait(5))
+        # a.xml 正在写时再提交的快照排队，b.xml 之后 a.xml 的两次提交合并为最后一次
+        queue.submit('b.xml', SaveJob('b.xml', 'b.jpg', ['b'], None))
+        queue.submit('a.xml', SaveJob('a.xml', 'a.jpg', ['second'], None))
+        queue.submit('a.xml', SaveJob('a.xml', 'a.jpg', ['third'], None))
+        self.assertTrue(queue.isPending('a.xml'))
+        gate.set()
+        self.assertTrue(queue.flush(5))
+        self.assertFalse(queue.isPending())
+        self.assertEqual(written[0][0], 'a.xml')
+        self.assertEqual(written[1:], [('b.xml', ('b',)), ('a.xml', ('third',))])
+
+    def test_failure_reported(self):
+        failures = []
+
+        def write(job):
+            raise IOError('disk full')
+
+        queue = SaveQueue(write)
+        queue.failed.connect(lambda key, job, message: failures.append((key, message)))
+        queue.submit('a.xml', SaveJob('a.xml', 'a.jpg', [], None))
+        self.assertTrue(queue.waitFor('a.xml', 5))
+        # 信号从写线程排队发到主线程
+        app.processEvents()
+        self.assertEqual(failures, [('a.xml', 'disk full')])
+
+    def test_write_job(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            xmlPath = os.path.join(tmp, 'a.xml')
+            shape = dict(label=u'人', points=[(1, 2), (11, 2), (11, 22), (1, 22)], difficult=False,
+                         direction=0, center=None, isRotated=False, line_color=None, fill_color=None)
+            queue = SaveQueue()
+            queue.submit(xmlPath, SaveJob(xmlPath, os.path.join(tmp, 'a.jpg'), [shape], [30, 20, 3],
+                                          verified=True))
+            self.assertTrue(queue.flush(5))
+            reader = PascalVocReader(xmlPath)
+            self.assertTrue(reader.verified)
+            self.assertEqual([s[0] for s in reader.getShapes()], [u'人'])
+            self.assertEqual(os.listdir(tmp), ['a.xml'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_atomic_write_keeps_old_file_on_error(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'a.xml')
+            writeFileAtomic(path, b'old')
+            writeFileAtomic(path, b'new')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'new')
+            self.assertRaises(TypeError, writeFileAtomic, path, u'not bytes')
+            with open(path, 'rb') as f:
+                self.assertEqual(f.read(), b'new')
+            self.assertEqual(os.listdir(tmp), ['a.xml'])
+        finally:
+            shutil.rmtree(tmp)
@@ -0,0 +1,42 @@
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+try:
+    from PyQt5.QtCore import QPointF
+except ImportError:
+    from PyQt4.QtCore import QPointF
+from shape import Shape
+
+
+def makeBox(x1, y1, x2, y2):
+    shape = Shape('box')
+    for x, y in ((x1, y1), (x2, y1), (x2, y2), (x1, y2)):
+        shape.addPoint(QPointF(x, y))
+    shape.close()
+    return shape
+
+
+class TestShapeCache(TestCase):
+
+    def test_cache_invalidated_on_mutation(self):
+        shape = makeBox(0, 0, 10, 10)
+        rect = shape.boundingRect()
+        self.assertIs(shape.boundingRect(), rect)
+        self.assertTrue(shape.containsPoint(QPointF(5, 5)))
+
+        shape.moveBy(QPointF(20, 0))
+        self.assertEqual(shape.boundingRect().left(), 20)
+        self.assertFalse(shape.containsPoint(QPointF(5, 5)))
+
+        shape.moveVertexBy(2, QPointF(5, 5))
+        self.assertEqual(shape.boundingRect().right(), 35)
+        shape[0] = QPointF(0, 0)
+        self.assertEqual(shape.boundingRect().left(), 0)
+        self.assertEqual(shape.cornerArray()[0].tolist(), [0, 0])
+
+        shape.points = [QPointF(1, 1), QPointF(2, 1), QPointF(2, 2), QPointF(1, 2)]
+        self.assertEqual(shape.boundingRect().width(), 1)
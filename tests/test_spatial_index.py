@@ -0,0 +1,90 @@
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from spatialIndex import GridIndex, OverlapIndex, HitTestIndex, TrackedList
+
+
+def rectsOverlap(a, b):
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+class TestGridIndex(TestCase):
+
+    def test_query(self):
+        grid = GridIndex(cellSize=10)
+        grid.insert('a', (0, 0, 5, 5))
+        grid.insert('b', (50, 50, 60, 60))
+        grid.insert('huge', (-1e5, -1e5, 1e5, 1e5))
+        self.assertEqual(grid.query((1, 1, 2, 2)), {'a', 'huge'})
+        self.assertEqual(grid.queryPoint(55, 55), {'b', 'huge'})
+        grid.update('a', (52, 52, 53, 53))
+        self.assertEqual(grid.queryPoint(1, 1), {'huge'})
+        self.assertEqual(grid.queryPoint(52.5, 52.5), {'a', 'b', 'huge'})
+        grid.remove('huge')
+        self.assertEqual(len(grid), 2)
+
+
+class TestOverlapIndex(TestCase):
+
+    def test_incremental_matches_bruteforce(self):
+        boxes = {i: (i * 7 % 90, i * 13 % 90, i * 7 % 90 + 12, i * 13 % 90 + 12)
+                 for i in range(40)}
+        index = OverlapIndex(lambda a, b: rectsOverlap(boxes[a], boxes[b]),
+                             lambda k: boxes[k], cellSize=16)
+        order = sorted(boxes)
+        index.sync(order)
+
+        def bruteforce():
+            return [(i, j) for i in order for j in order
+                    if i < j and rectsOverlap(boxes[i], boxes[j])]
+
+        self.assertEqual([(a, b) for _, _, a, b in index.pairs(order)], bruteforce())
+
+        boxes[3] = (200, 200, 210, 210)
+        index.update(3)
+        boxes[5] = (0, 0, 100, 100)
+        index.update(5)
+        self.assertEqual([(a, b) for _, _, a, b in index.pairs(order)], bruteforce())
+
+        order.remove(5)
+        changed = index.sync(order)
+        self.assertNotIn(5, changed)
+        self.assertEqual([(a, b) for _, _, a, b in index.pairs(order)], bruteforce())
+
+
+class TestHitTestIndex(TestCase):
+
+    def test_tracks_list_and_geometry(self):
+        class Box(object):
+
+            def __init__(self, rect):
+                self.onChanged = None
+                self.move(rect)
+
+            def move(self, rect):
+                self.rect = rect
+                if self.onChanged is not None:
+                    self.onChanged(self)
+
+        a, b = Box((0, 0, 10, 10)), Box((5, 5, 15, 15))
+        objs = TrackedList([a, b])
+        index = HitTestIndex(lambda o: o.rect, lambda o, callback: setattr(o, 'onChanged', callback))
+        index.sync(objs)
+        self.assertEqual(index.candidates(7, 7), [b, a])
+        self.assertEqual(index.candidates(1, 1), [a])
+
+        a.move((100, 100, 110, 110))
+        # 只有移动过的对象需要重新登记
+        self.assertEqual(index._dirty, set([a]))
+        index.sync(objs)
+        self.assertEqual(index.candidates(7, 7), [b])
+        self.assertEqual(index.candidates(98, 98, radius=3), [a])
+
+        c = Box((0, 0, 200, 200))
+        objs.insert(0, c)
+        index.sync(objs)
+        self.assertEqual(index.candidates(7, 7), [b, c])
@@ -0,0 +1,81 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+try:
+    from PyQt5.QtGui import QImage, QColor
+    from PyQt5.QtCore import QSize
+except ImportError:
+    from PyQt4.QtGui import QImage, QColor
+    from PyQt4.QtCore import QSize
+from tileRenderer import TilePyramid, readOverview, readTile, supportsClipRect
+
+
+class TestTilePyramid(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'big.png')
+        image = QImage(2000, 1000, QImage.Format_RGB32)
+        image.fill(QColor(0, 0, 255))
+        # 右下角一块红色，用来确认瓦片取的是原图中的对应区域
+        for x in range(1800, 2000):
+            for y in range(900, 1000):
+                image.setPixel(x, y, QColor(255, 0, 0).rgb())
+        image.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_levels(self):
+        tiles = TilePyramid(self.path, QSize(2000, 1000), tileSize=256)
+        self.assertEqual(tiles.maxLevel, 3)
+        self.assertEqual(tiles.levelFor(1.0), 0)
+        self.assertEqual(tiles.levelFor(0.3), 1)
+        self.assertEqual(tiles.levelFor(0.01), 3)
+        self.assertEqual(tiles.levelSize(3), (250, 125))
+
+    def test_tile_range(self):
+        tiles = TilePyramid(self.path, QSize(2000, 1000), tileSize=256)
+        self.assertEqual(tiles.tileRange(0, (300, 0, 600, 100)), (1, 0, 2, 0))
+        self.assertEqual(tiles.tileRange(1, (-50, -50, 5000, 5000)), (0, 0, 3, 1))
+
+    def test_read_tile_decodes_only_its_region(self):
+        size = QSize(2000, 1000)
+        tile = readTile(self.path, size, 256, 0, 7, 3)
+        self.assertEqual((tile.width(), tile.height()), (2000 - 7 * 256, 1000 - 3 * 256))
+        self.assertEqual(QColor(tile.pixel(tile.width() - 1, tile.height() - 1)).red(), 255)
+        # 第 3 层整张图缩小到一块瓦片
+        tile = readTile(self.path, size, 256, 3, 0, 0)
+        self.assertEqual((tile.width(), tile.height()), (250, 125))
+        overview = readOverview(self.path, size, maxSide=500)
+        self.assertEqual((overview.width(), overview.height()), (500, 250))
+
+    def test_formats_without_clip_rect_decode_once(self):
+        size = QSize(2000, 1000)
+        tiffPath = os.path.join(self.tmp, 'big.tif')
+        QImage(self.path).save(tiffPath)
+        for path in (self.path, tiffPath):
+            self.assertFalse(supportsClipRect(path))
+            tiles = TilePyramid(path, size, tileSize=256)
+            tile = tiles.decodeTile((0, 7, 3))
+            source = tiles.sourceImage()
+            # 后续瓦片都从同一张已解码的原图裁出
+            tiles.decodeTile((1, 0, 0))
+            self.assertEqual(tiles.sourceImage().cacheKey(), source.cacheKey())
+            self.assertEqual(tile, readTile(path, size, 256, 0, 7, 3))
+            self.assertEqual(tiles.decodeTile((3, 0, 0)).size(), QSize(250, 125))
+            tiles.shutdown()
+            self.assertTrue(tiles.sourceImage().isNull())
+
+        jpegPath = os.path.join(self.tmp, 'big.jpg')
+        QImage(self.path).save(jpegPath)
+        self.assertTrue(supportsClipRect(jpegPath))
+        tiles = TilePyramid(jpegPath, size, tileSize=256)
+        tiles.decodeTile((0, 7, 3))
+        self.assertIsNone(tiles._source)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import sys
+import os
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from undoHistory import UndoHistory, AddShapes, DeleteShapes, ChangeGeometry, Relabel
+
+BOX = [(0, 0), (10, 0), (10, 10), (0, 10)]
+MOVED = [(5, 0), (15, 0), (15, 10), (5, 10)]
+
+
+def state(label, points=BOX, direction=0):
+    return (label, list(points), direction, True, False)
+
+
+class FakeEditor(object):
+    """用列表模拟画布，形状为 [label, points, direction]"""
+
+    def __init__(self, labels):
+        self.shapes = [[label, list(BOX), 0] for label in labels]
+
+    def insertShapes(self, entries):
+        for index, (label, points, direction, _, _) in entries:
+            self.shapes.insert(index, [label, list(points), direction])
+
+    def removeShapes(self, indices):
+        for index in sorted(indices, reverse=True):
+            self.shapes.pop(index)
+
+    def setShapeGeometry(self, index, points, direction):
+        self.shapes[index][1:] = [list(points), direction]
+
+    def setShapeLabel(self, index, label):
+        self.shapes[index][0] = label
+
+    def labels(self):
+        return [s[0] for s in self.shapes]
+
+
+class TestUndoHistory(TestCase):
+
+    def test_undo_redo_commands(self):
+        editor = FakeEditor(['a', 'b', 'c'])
+        history = UndoHistory()
+        # 批量删除 a、c 作为一步
+        history.push('img', DeleteShapes([(2, state('c')), (0, state('a'))]))
+        editor.removeShapes([0, 2])
+        editor.shapes[0][0] = 'x'
+        history.push('img', Relabel(0, 'b', 'x'))
+        editor.setShapeGeometry(0, MOVED, 0.5)
+        history.push('img', ChangeGeometry(0, BOX, MOVED, 0, 0.5))
+
+        history.undo('img', editor)
+        self.assertEqual(editor.shapes[0][1:], [BOX, 0])
+        history.undo('img', editor)
+        self.assertEqual(editor.labels(), ['b'])
+        history.undo('img', editor)
+        self.assertEqual(editor.labels(), ['a', 'b', 'c'])
+        self.assertIsNone(history.undo('img', editor))
+
+        history.redo('img', editor)
+        history.redo('img', editor)
+        self.assertEqual(editor.labels(), ['x'])
+        command = history.redo('img', editor)
+        self.assertEqual(command.text, u'旋转')
+        self.assertEqual(editor.shapes[0][1:], [MOVED, 0.5])
+        self.assertIsNone(history.redo('img', editor))
+
+    def test_new_command_drops_redo(self):
+        editor = FakeEditor([])
+        history = UndoHistory()
+        editor.insertShapes([(0, state('a'))])
+        history.push('img', AddShapes([(0, state('a'))]))
+        history.undo('img', editor)
+        self.assertEqual(editor.labels(), [])
+        editor.insertShapes([(0, state('b'))])
+        history.push('img', AddShapes([(0, state('b'))]))
+        self.assertIsNone(history.redo('img', editor))
+        history.undo('img', editor)
+        self.assertEqual(editor.labels(), [])
+        self.assertEqual(len(history.stackFor('img').commands), 1)
+
+    def test_memory_bound_evicts_least_recent_image(self):
+        command = ChangeGeometry(0, BOX, MOVED, 0, 0)
+        history = UndoHistory(maxBytes=command.cost() * 5)
+        for _ in range(3):
+            history.push('old', ChangeGeometry(0, BOX, MOVED, 0, 0))
+        for _ in range(4):
+            history.push('current', ChangeGeometry(0, BOX, MOVED, 0, 0))
+        self.assertLessEqual(history.cost, history.maxBytes)
+        self.assertEqual(len(history.stackFor('current').commands), 4)
+        self.assertEqual(len(history.stackFor('old').commands), 1)
+
+        # 单个命令超过上限时当前图片仍保留最后一步
+        history.push('current', AddShapes([(0, state('a', BOX * 100))]))
+        self.assertIsNone(history.stackFor('old'))
+        self.assertEqual(len(history.stackFor('current').commands), 1)
+        history.drop('current')
+        self.assertEqual(history.cost, 0)
+        self.assertEqual(len(history), 0)
+
+    def test_evict_fully_undone_stack_keeps_redo_order(self):
+        editor = FakeEditor([])
+        command = AddShapes([(0, state('a'))])
+        history = UndoHistory(maxBytes=command.cost() * 4)
+        for label in ['a', 'b', 'c']:
+            editor.insertShapes([(len(editor.shapes), state(label))])
+            history.push('old', AddShapes([(len(editor.shapes) - 1, state(label))]))
+        for _ in range(3):
+            history.undo('old', editor)
+        self.assertEqual(editor.labels(), [])
+
+        # 全部已撤销的栈被压缩时丢弃重做链末尾，剩下的仍能从当前状态依次重做
+        history.push('current', AddShapes([(0, state('x'))]))
+        history.push('current', AddShapes([(0, state('x'))]))
+        stack = history.stackFor('old')
+        self.assertEqual((len(stack.commands), stack.index), (2, 0))
+        history.redo('old', editor)
+        history.redo('old', editor)
+        self.assertEqual(editor.labels(), ['a', 'b'])
+        self.assertIsNone(history.redo('old', editor))
@@ -0,0 +1,60 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from pascal_voc_io import PascalVocWriter, PascalVocReader
+from vocBatchReader import readVocFiles, readVocDirectory
+from datasetStats import summarizeArrays, summarizeShapes
+
+
+class TestVocBatchReader(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.paths = []
+        for i in range(5):
+            writer = PascalVocWriter('tmp', '%d' % i, (100, 200, 3))
+            writer.addBndBox(10, 20, 30 + i, 60, 'dog', i % 2)
+            writer.addRotatedBndBox(50, 40, 20, 10, 0.5 + i, 'cat' if i % 2 else 'dog', 0)
+            path = os.path.join(self.tmp, '%d.xml' % i)
+            writer.save(path)
+            self.paths.append(path)
+        with open(os.path.join(self.tmp, 'broken.xml'), 'w') as f:
+            f.write('<annotation>')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_matches_reader(self):
+        arrays = readVocDirectory(self.tmp, processes=2, chunkSize=2)
+        self.assertEqual(arrays.paths[:5], self.paths)
+        self.assertEqual(arrays.failed, [5])
+        self.assertEqual(len(arrays), 10)
+        self.assertEqual(arrays.labelNames, ['dog', 'cat'])
+
+        for i, path in enumerate(self.paths):
+            shapes = PascalVocReader(path).getShapes()
+            rows = arrays.rowsOf(i)
+            self.assertEqual([arrays.labelNames[l] for l in arrays.labelIds[rows]],
+                             [s[0] for s in shapes])
+            self.assertEqual(arrays.difficult[rows].tolist(), [s[6] for s in shapes])
+            self.assertEqual(arrays.rotated[rows].tolist(), [s[3] for s in shapes])
+            self.assertEqual(arrays.boxes[rows][0].tolist(), [20 + i / 2.0, 40, 20 + i, 40, 0])
+            self.assertEqual(arrays.boxes[rows][1].tolist(), [50, 40, 20, 10, 0.5 + i])
+
+        # 由数组生成的摘要与逐个解析的结果一致
+        summaries = summarizeArrays(arrays, [None] * len(arrays.paths))
+        self.assertIsNone(summaries[5])
+        for path, summary in zip(self.paths, summaries):
+            expected = summarizeShapes(PascalVocReader(path).getShapes())
+            self.assertEqual(summary.toRow(), expected.toRow())
+
+    def test_in_process(self):
+        arrays = readVocFiles(self.paths[:1])
+        self.assertEqual(arrays.imageIds.tolist(), [0, 0])
+        self.assertEqual(len(readVocFiles([])), 0)
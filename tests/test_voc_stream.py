@@ -0,0 +1,64 @@
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from xml.etree import ElementTree
+import pascal_voc_io
+from pascal_voc_io import PascalVocWriter, PascalVocReader
+
+
+class TestVocStream(TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmp, 'many.xml')
+        writer = PascalVocWriter('tmp', 'many', (100, 200, 3))
+        writer.verified = True
+        for i in range(25):
+            writer.addBndBox(i, 2, i + 10, 20, 'box%d' % (i % 3), i % 2)
+            writer.addRotatedBndBox(50 + i, 40, 20, 10, 0.1 * i, 'rot', 0)
+        writer.save(self.path)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_batches_match_full_parse(self):
+        full = PascalVocReader(self.path)
+        self.assertTrue(full.verified)
+        self.assertEqual(len(full.getShapes()), 50)
+        self.assertEqual(full.getShapes()[0], ('box0', [(0, 2), (10, 2), (10, 20), (0, 20)], 0, False, None, None, False))
+
+        reader = PascalVocReader(self.path, lazy=True)
+        self.assertEqual(reader.getShapes(), [])
+        batches = list(reader.iterShapes(batchSize=8))
+        self.assertEqual([len(b) for b in batches], [8] * 6 + [2])
+        self.assertEqual([s for b in batches for s in b], full.getShapes())
+        self.assertTrue(reader.verified)
+
+    def test_elementtree_fallback_matches_lxml(self):
+        expected = PascalVocReader(self.path).getShapes()
+        etree = pascal_voc_io.etree
+        pascal_voc_io.etree = ElementTree
+        try:
+            reader = PascalVocReader(self.path)
+            self.assertEqual(reader.getShapes(), expected)
+            self.assertTrue(reader.verified)
+
+            # 只取根元素 annotation 下的 object
+            other = os.path.join(self.tmp, 'other.xml')
+            with open(other, 'w') as f:
+                f.write('<annotation><part><object><type>bndbox</type><name>x</name>'
+                        '<bndbox><xmin>1</xmin><ymin>1</ymin><xmax>2</xmax><ymax>2</ymax></bndbox>'
+                        '</object></part><filename>a</filename></annotation>')
+            self.assertEqual(PascalVocReader(other).getShapes(), [])
+            with open(other, 'w') as f:
+                f.write('<dataset verified="yes"><object/></dataset>')
+            reader = PascalVocReader(other)
+            self.assertEqual((reader.getShapes(), reader.verified), ([], False))
+        finally:
+            pascal_voc_io.etree = etree
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+from unittest import TestCase
+
+import sys
+import os
+import shutil
+import tempfile
+dir_name = os.path.abspath(os.path.dirname(__file__))
+libs_path = os.path.join(dir_name, '..', 'libs')
+sys.path.insert(0, libs_path)
+from pascal_voc_io import PascalVocWriter, PascalVocReader
+
+
+class TestVocWriter(TestCase):
+
+    def makeWriter(self):
+        writer = PascalVocWriter(u'文件夹', 'a&b', (512, 640, 3), localImgPath=None)
+        writer.verified = True
+        writer.addBndBox(1, 40, 430, 504, u'人', 1)
+        writer.addBndBox(60, 40, 640, 100, 'a<b>&"c"', 0)
+        writer.addBndBox(60, 40, 70, 100, None, 0)
+        writer.addRotatedBndBox(100.5, 200.25, 30.0, 40.0, 0.3, 'cr\r\nlf', 0)
+        return writer
+
+    def test_same_bytes_as_prettify(self):
+        writer = self.makeWriter()
+        root = writer.genXML()
+        writer.appendObjects(root)
+        expected = writer.prettify(root)
+        self.assertEqual(writer.toXML(), expected)
+        self.assertIn(b'<path/>', expected)
+        self.assertIn(b'<name>&#20154;</name>', expected)
+
+    def test_save_roundtrip(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            path = os.path.join(tmp, 'out.xml')
+            self.makeWriter().save(path)
+            shapes = PascalVocReader(path).getShapes()
+            self.assertEqual([s[0] for s in shapes], [u'人', 'a<b>&"c"', None, 'cr\nlf'])
+        finally:
+            shutil.rmtree(tmp)
+
+    def test_invalid_character(self):
+        writer = PascalVocWriter('f', 'n', (1, 1))
+        writer.addBndBox(1, 1, 2, 2, 'bad\x01', 0)
+        self.assertRaises(ValueError, writer.toXML)